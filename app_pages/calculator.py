@@ -0,0 +1,333 @@
+import streamlit as st
+
+import charts
+import db
+import perf
+import workdays
+from db import add_data
+from payroll import (GROSS_SALARY_MIN, GROSS_SALARY_MAX, MAX_YEARS_EXPERIENCE, SUPKO_RATE_OPTIONS, TZPB_RATE_OPTIONS,
+                     VACATION_BASE_PREVIOUS_MONTH, VACATION_BASE_CURRENT_MONTH, SOLVE_TARGETS,
+                     cached_calculate_net_salary, solve_gross_salary_batch)
+
+# Страница на калкулатора. Годината и видът на графиките идват от страничния панел в app.py.
+# Изчислението за един служител не ползва pandas, а matplotlib се зарежда от charts едва при първата
+# графика - двете се импортират само когато потрябват.
+year = st.session_state['year']
+native_charts = st.session_state['native_charts']
+working_days = workdays.month_working_days(year)
+
+st.title(f"💰 Калкулатор за нетна заплата {year}")
+st.markdown(f"""
+Изчислете **нетната си заплата** за {year} година.
+---
+""")
+
+st.header("Въведете вашите данни")
+col1, col2 = st.columns([1, 1])
+
+with col1:
+    st.subheader("Основни параметри")
+    egn = st.text_input("ЕГН на служителя (задължително за изчисление на отпуск)", max_chars=10, key='egn_input')
+    full_name = st.text_input("Име на служителя", key='name_input')
+    gross_salary = st.number_input(
+        "Брутна заплата (без доплащане за стаж, лв):",
+        min_value=GROSS_SALARY_MIN,
+        max_value=GROSS_SALARY_MAX,
+        value=2267.0,
+        step=50.0,
+        help="Въведете основната брутна месечна заплата."
+    )
+    birth_year = st.selectbox(
+        "Година на раждане:",
+        options=["След 1960", "Преди 1960"],
+        index=1,
+        help="Изберете година на раждане."
+    )
+    has_telk = st.checkbox(
+        "Има ТЕЛК",
+        help="Отбележете, ако лицето притежава решение на ТЕЛК."
+    )
+
+with col2:
+    st.subheader("Трудов стаж, осигуровки и отсъствия")
+    supko_rate = st.selectbox(
+        "Доплащане за стаж (%):",
+        options=SUPKO_RATE_OPTIONS,
+        index=0,
+        help="Изберете процент на доплащане за всяка година трудов стаж."
+    )
+    experience = st.number_input(
+        "Години стаж:",
+        min_value=0,
+        max_value=MAX_YEARS_EXPERIENCE,
+        value=0,
+        step=1,
+        help="Въведете години трудов стаж."
+    )
+    tzpb_rate = st.selectbox(
+        "ТЗПБ (%):",
+        options=TZPB_RATE_OPTIONS,
+        index=2,
+        help="Изберете процента на ТЗПБ."
+    )
+    month = st.selectbox(
+        "Месец на изчисление:",
+        options=workdays.MONTHS,
+        index=8,
+        help="Изберете месеца, за който правите изчислението."
+    )
+    st.info(f"Работните дни за **{month} {year}** са: **{working_days[month]}**")
+    days_vacation = st.number_input(
+        "Дни в платен отпуск:",
+        min_value=0,
+        max_value=working_days[month],
+        value=0,
+        step=1,
+        help="Въведете броя на дните в платен годишен отпуск."
+    )
+    days_sick = st.number_input(
+        "Дни в болничен (общо):",
+        min_value=0,
+        max_value=working_days[month] - days_vacation,
+        value=0,
+        step=1,
+        help="Въведете общия брой на дните в болничен."
+    )
+    sick_leave_count = st.number_input(
+        "Брой болнични листа:",
+        min_value=0,
+        max_value=days_sick if days_sick > 0 else 1,
+        value=0,
+        step=1,
+        help="Въведете броя на отделните болнични листа за месеца."
+    )
+    days_absence = st.number_input(
+        "Дни самоотлъчка:",
+        min_value=0,
+        max_value=working_days[month] - days_vacation - days_sick,
+        value=0,
+        step=1,
+        help="Въведете броя на дните самоотлъчка. За тези дни не се дължат осигуровки."
+    )
+    days_unpaid = st.number_input(
+        "Дни неплатен отпуск:",
+        min_value=0,
+        max_value=working_days[month] - days_vacation - days_sick - days_absence,
+        value=0,
+        step=1,
+        help="За тези дни се дължи здравна осигуровка, която се удържа от служителя."
+    )
+
+st.markdown("---")
+col_buttons = st.columns(2)
+with col_buttons[0]:
+    if st.button("Изчисли заплата", type="primary", use_container_width=True):
+        if egn and full_name:
+            result = cached_calculate_net_salary(
+                gross_salary,
+                tzpb_rate,
+                birth_year,
+                month,
+                days_vacation,
+                days_sick,
+                days_absence,
+                days_unpaid,
+                has_telk,
+                experience,
+                supko_rate,
+                egn,
+                sick_leave_count,
+                year
+            )
+
+            if result['vacation_base_source'] == VACATION_BASE_PREVIOUS_MONTH:
+                st.info(
+                    f"Платеният отпуск е изчислен на базата на предходен месец с 10+ отработени дни. Среднодневна база: {result['vacation_daily_base']:.2f} лв.")
+            elif result['vacation_base_source'] == VACATION_BASE_CURRENT_MONTH:
+                st.info(
+                    f"Платеният отпуск е изчислен на базата на текущия месец. Среднодневна база: {result['vacation_daily_base']:.2f} лв.")
+            else:
+                st.warning(
+                    "Не са открити предходни месеци с достатъчно отработени дни, нито текущият месец отговаря на условията. Платеният отпуск няма да бъде изчислен.")
+
+            st.success(f"### 💰 Нетна заплата: {result['net_salary']:,.2f} лв")
+            st.info(f"Доплащане за стаж: **{result['supko_amount']:,.2f} лв**")
+
+            # Показване на ключови показатели
+            st.markdown("---")
+            st.subheader("Ключови показатели")
+            col_kpi_1, col_kpi_2, col_kpi_3, col_kpi_4 = st.columns(4)
+            with col_kpi_1:
+                st.metric("Брутна заплата (основна)", f"{result['gross_salary_before_supko']:,.2f} лв")
+            with col_kpi_2:
+                st.metric("Брутна заплата (общо)", f"{result['gross_salary_with_supko']:,.2f} лв")
+            with col_kpi_3:
+                st.metric("Осигурителен доход", f"{result['insurance_base']:,.2f} лв")
+            with col_kpi_4:
+                st.metric("Облагаем доход", f"{result['taxable_income']:,.2f} лв")
+
+            # Разходи и удръжки
+            st.markdown("---")
+            st.subheader("Разходи и удръжки")
+            col_deductions_1, col_deductions_2, col_deductions_3, col_deductions_4 = st.columns(4)
+            with col_deductions_1:
+                st.metric("Общо осигуровки служител", f"{result['total_insurance_employee']:,.2f} лв",
+                          delta=-result['total_insurance_employee'], delta_color="inverse")
+            with col_deductions_2:
+                st.metric("Данък върху дохода", f"{result['income_tax']:,.2f} лв",
+                          delta=-result['income_tax'], delta_color="inverse")
+            with col_deductions_3:
+                st.metric("Разходи за работодател", f"{result['total_employer_cost']:,.2f} лв")
+            with col_deductions_4:
+                st.metric("ЗО за неплатен отпуск", f"{result['health_insurance_unpaid']:,.2f} лв")
+
+            # Визуализация на разпределението
+            st.markdown("---")
+            st.subheader("Графично представяне на разпределението")
+            col_vis_1, col_vis_2 = st.columns([1, 1])
+            with col_vis_1:
+                st.markdown("#### От гледна точка на служителя")
+                values_employee = charts.employee_values(result)
+                if native_charts:
+                    import pandas as pd
+
+                    st.bar_chart(pd.DataFrame({'Сума (лв)': values_employee}, index=charts.EMPLOYEE_LABELS))
+                else:
+                    with perf.span('charts.employee'):
+                        st.image(charts.employee_chart(values_employee), use_container_width=True)
+
+            with col_vis_2:
+                st.markdown("#### Разходи за работодателя")
+                values_employer = charts.employer_values(result)
+                if native_charts:
+                    import pandas as pd
+
+                    st.bar_chart(pd.DataFrame({'Сума (лв)': values_employer}, index=charts.EMPLOYER_LABELS))
+                else:
+                    with perf.span('charts.employer'):
+                        st.image(charts.employer_chart(values_employer), use_container_width=True)
+
+            with perf.span('app.markdown_tables'), st.expander("📊 Вижте подробно изчисление по пера"):
+                st.markdown("### Детайлен разчет на заплатата и осигуровките")
+                st.markdown("#### Разпределение на брутната заплата:")
+                st.markdown(f"""
+                | Перо | Стойност (лв) | Описание |
+                | :--- | :--- | :--- |
+                | **Основна заплата** | **{result['base_salary_part']:,.2f}** | За отработени дни |
+                | **Платен отпуск** | **{result['vacation_salary_part']:,.2f}** | За дни платен отпуск |
+                | **Болнични (от работодател)** | **{result['sick_pay_employer']:,.2f}** | За първите {result['days_sick_employer']} дни болничен |
+                | **Дни неплатен отпуск** | **{result['days_unpaid']}** | Без възнаграждение |
+                | **Дни самоотлъчка** | **{result['days_absence']}** | Без възнаграждение |
+                | **Общо брутен доход** | **{result['total_gross_income']:,.2f}** | Общата сума, от която се изчисляват удръжките |
+                """)
+                st.markdown("#### Основни суми и отработени дни:")
+                st.markdown(f"""
+                | Параметър | Стойност | Описание |
+                | :--- | :--- | :--- |
+                | **Брутна заплата (основна)** | **{result['gross_salary_before_supko']:,.2f} лв** | Въведената основна брутна заплата |
+                | Доплащане за стаж (СУПКО) | {result['supko_amount']:,.2f} лв | Доплащане за години трудов стаж |
+                | **Общо брутен доход** | **{result['gross_salary_with_supko']:,.2f} лв** | Обща брутна сума преди осигуровки и данъци |
+                | Общо работни дни за месеца | {result['total_working_days']} дни | Работни дни за избрания месец ({month}) |
+                | Отработени дни | {result['days_worked']} дни | Реално отработени дни |
+                | Дни в платен отпуск | {result['days_vacation']} дни | Дни, за които е ползван платен отпуск |
+                | Дни в болничен | {result['days_sick']} дни | Общ брой дни в болничен за месеца |
+                | Болнични, платени от работодателя | {result['days_sick_employer']} дни | Според броя на болничните листа |
+                | Болнични, платени от НОИ | {result['days_sick_nssi']} дни | Останалото от общия брой болнични дни |
+                | Възнаграждение от НОИ за болничен | {result['sick_pay_nssi']:,.2f} лв | За дните над 2, платени от НОИ |
+                | Дни самоотлъчка | {result['days_absence']} дни | Неплатени дни без осигуровки |
+                | **Дни неплатен отпуск** | **{result['days_unpaid']} дни** | **Дължима ЗО: {result['health_insurance_unpaid']:,.2f} лв.** |
+                """)
+                st.markdown("#### Осигуровки за служител:")
+                st.markdown(f"""
+                | Параметър | Стойност (лв) | Процент |
+                | :--- | :--- | :--- |
+                | Пенсионно осигуряване | {result['pension_insurance_employee']:,.2f} | {result['pension_employee_rate'] * 100:.2f}% |
+                | ОЗМ | {result['ozm_insurance_employee']:,.2f} | {result['ozm_employee_rate'] * 100:.2f}% |
+                | Безработица | {result['unemployment_insurance_employee']:,.2f} | {result['unemployment_employee_rate'] * 100:.2f}% |
+                | **Общо ДОО (служител)** | **{result['total_doo_employee']:,.2f}** | **{result['pension_employee_rate'] * 100 + result['ozm_employee_rate'] * 100 + result['unemployment_employee_rate'] * 100:.2f}%** |
+                | ДЗПО | {result['dzpo_insurance_employee']:,.2f} | {result['dzpo_employee_rate'] * 100:.2f}% |
+                | Здравно осигуряване | {result['health_insurance_employee']:,.2f} | {result['health_employee_rate'] * 100:.2f}% |
+                | **Здравна осигуровка за неплатен отпуск** | **{result['health_insurance_unpaid']:,.2f}** | |
+                | **Общо осигуровки служител** | **{result['total_insurance_employee']:,.2f}** | |
+                """)
+                st.markdown("#### Осигуровки за работодател:")
+                st.markdown(f"""
+                | Параметър | Стойност (лв) | Процент |
+                | :--- | :--- | :--- |
+                | Пенсионно осигуряване | {result['pension_insurance_employer']:,.2f} | {result['pension_employer_rate'] * 100:.2f}% |
+                | ОЗМ | {result['ozm_insurance_employer']:,.2f} | {result['ozm_employer_rate'] * 100:.2f}% |
+                | Безработица | {result['unemployment_insurance_employer']:,.2f} | {result['unemployment_employer_rate'] * 100:.2f}% |
+                | **Общо ДОО (работодател)** | **{result['total_doo_employer']:,.2f}** | **{result['pension_employer_rate'] * 100 + result['ozm_employer_rate'] * 100 + result['unemployment_employer_rate'] * 100:.2f}%** |
+                | ДЗПО | {result['dzpo_insurance_employer']:,.2f} | {result['dzpo_employer_rate'] * 100:.2f}% |
+                | ТЗПБ | {result['tzpb']:,.2f} | {tzpb_rate:.2f}% |
+                | Здравно осигуряване | {result['health_insurance_employer']:,.2f} | {result['health_employer_rate'] * 100:.2f}% |
+                | Здравни осигуровки за болнични | {result['health_insurance_sick_leave_employer']:,.2f} | |
+                | **Здравна осигуровка за неплатен отпуск** | **{result['health_insurance_unpaid']:,.2f}** | |
+                | **Общо осигуровки работодател** | **{result['total_insurance_employer']:,.2f}** | |
+                """)
+                st.markdown("#### Данъчно изчисление:")
+                st.markdown(f"""
+                | Параметър | Стойност (лв) | Описание |
+                | :--- | :--- | :--- |
+                | Осигурителена основа | {result['insurance_base']:,.2f} | База за изчисляване на осигуровките |
+                | Общо осигуровки служител | {result['total_insurance_employee']:,.2f} | |
+                | **Облагаем доход** | **{result['taxable_income']:,.2f}** | Заплата минус осигуровки и облекчение за ТЕЛК |
+                | Данък върху дохода (10%) | {result['income_tax']:,.2f} | |
+                | **Нетна заплата** | **{result['net_salary']:,.2f}** | |
+                """)
+                st.markdown(f"**Общо разходи за работодател:** **{result['total_employer_cost']:,.2f} лв**")
+        else:
+            st.error("Моля, въведете ЕГН и име на служителя, за да бъде възможно изчислението на отпуска.")
+
+with col_buttons[1]:
+    if st.button("Запиши данни", use_container_width=True):
+        if egn and full_name:
+            add_data(egn, full_name, month, gross_salary, supko_rate, experience, days_vacation, days_sick,
+                     days_absence, days_unpaid, sick_leave_count, year)
+            st.success(f"Данните за служител {full_name} за {month} {year} бяха успешно записани.")
+        else:
+            st.error("Моля, попълнете ЕГН и име на служителя.")
+
+with st.expander("🔁 Брутна заплата по желана нетна заплата или бюджет"):
+    st.caption("Стажът, ставките и отсъствията се вземат от формата по-горе. "
+               "Базата за отпуска се търси по ЕГН, ако е въведено.")
+    solve_target = st.selectbox("Желана стойност:", options=list(SOLVE_TARGETS), format_func=SOLVE_TARGETS.get,
+                                key='solve_target')
+    solve_amounts = st.text_area("Суми (лв), по една на ред - за няколко кандидата наведнъж:", value="2000",
+                                 key='solve_amounts')
+    if st.button("Намери брутна заплата", use_container_width=True):
+        try:
+            amounts = [float(line.strip().replace(',', '.')) for line in solve_amounts.splitlines()
+                       if line.strip()]
+        except ValueError:
+            amounts = []
+        if not amounts:
+            st.error("Въведете поне една сума (число на всеки ред).")
+        else:
+            import pandas as pd
+
+            previous_month_data = db.get_previous_month_data(egn, month, year) if egn else (None,) * 4
+            solve_input = pd.DataFrame({
+                'tzpb_rate': tzpb_rate, 'birth_year': birth_year, 'year': year, 'month': month,
+                'days_vacation': days_vacation, 'days_sick': days_sick, 'days_absence': days_absence,
+                'days_unpaid': days_unpaid, 'has_telk': has_telk, 'years_experience': experience,
+                'supko_rate': supko_rate, 'sick_leave_count': sick_leave_count,
+                'prev_gross_salary_base': previous_month_data[0], 'prev_supko_rate': previous_month_data[1],
+                'prev_years_experience': previous_month_data[2],
+                'prev_total_working_days': previous_month_data[3],
+            }, index=range(len(amounts))).astype({
+                'prev_gross_salary_base': float, 'prev_supko_rate': float, 'prev_years_experience': float,
+                'prev_total_working_days': float})
+            solved = solve_gross_salary_batch(solve_input, amounts, solve_target)
+            st.dataframe(pd.DataFrame({
+                f"Цел: {SOLVE_TARGETS[solve_target]} (лв)": amounts,
+                'Брутна заплата (лв)': solved['gross_salary_before_supko'],
+                'Брутна заплата със стаж (лв)': solved['gross_salary_with_supko'],
+                'Нетна заплата (лв)': solved['net_salary'],
+                'Разходи за работодател (лв)': solved['total_employer_cost'],
+            }).round(2), use_container_width=True, hide_index=True)
+            if solved['gross_salary_before_supko'].isna().any():
+                st.warning("Някои от сумите не са постижими при тези параметри.")
+            elif not solved['gross_salary_before_supko'].between(GROSS_SALARY_MIN, GROSS_SALARY_MAX).all():
+                st.info(f"Някои заплати са извън допустимите {GROSS_SALARY_MIN:.0f} - {GROSS_SALARY_MAX:.0f} лв "
+                        "за въвеждане.")
@@ -0,0 +1,72 @@
+import pandas as pd
+import streamlit as st
+
+import db
+import perf
+from payroll import TZPB_RATE_OPTIONS, refresh_results
+
+# Страница с таблото - само четене на поддържаните в базата суми по месеци
+year = st.session_state['year']
+
+st.header(f"Табло за {year} г.")
+st.markdown("Сумите за цялата фирма се поддържат в базата при всяко записване на изчислени заплати, "
+            "така че таблото не преизчислява нищо. Новите и променените записи влизат след обновяване.")
+
+# ТЕЛК се задава при изчислението от командния ред (cli.py --telk) - тук се запазва от съхранените резултати
+telk_egns = db.read_telk_egns(year)
+
+col_refresh = st.columns([1, 1, 2])
+with col_refresh[0]:
+    dashboard_tzpb = st.selectbox("ТЗПБ (%):", options=TZPB_RATE_OPTIONS, index=2, key='dashboard_tzpb')
+with col_refresh[1]:
+    st.write("")
+    if st.button("Обнови резултатите", use_container_width=True):
+        with perf.span('app.dashboard_refresh'), st.spinner("Изчисляване на променените записи..."):
+            refreshed = refresh_results(dashboard_tzpb, telk_egns, year=year)
+        st.success(f"Преизчислени записи: {refreshed}")
+with col_refresh[2]:
+    st.write("")
+    if telk_egns:
+        st.caption(f"С ТЕЛК: {len(telk_egns)} служители ({', '.join(telk_egns[:5])}"
+                   f"{', ...' if len(telk_egns) > 5 else ''})")
+
+with perf.span('app.dashboard'):
+    summary_columns = ['Година', 'Месец'] + list(db.SUMMARY_COLUMN_LABELS.values())
+    summary = pd.DataFrame(db.read_summary(year), columns=summary_columns).drop(columns='Година')
+    if summary.empty:
+        st.info("Няма изчислени заплати за годината. Натиснете „Обнови резултатите“.")
+    else:
+        labels = db.SUMMARY_COLUMN_LABELS
+        totals = summary.drop(columns='Месец').sum()
+        col_totals = st.columns(4)
+        col_totals[0].metric("Брутен доход", f"{totals[labels['total_gross_income']]:,.2f} лв")
+        col_totals[1].metric("Нетно", f"{totals[labels['net_salary']]:,.2f} лв")
+        col_totals[2].metric("Разходи за работодател", f"{totals[labels['total_employer_cost']]:,.2f} лв")
+        col_totals[3].metric("Данък", f"{totals[labels['income_tax']]:,.2f} лв")
+
+        st.subheader("По месеци")
+        monthly = summary.set_index('Месец')
+        st.bar_chart(monthly[[labels['net_salary'], labels['total_insurance_employee'], labels['income_tax']]])
+        st.dataframe(monthly, use_container_width=True)
+
+        col_breakdown = st.columns(2)
+        with col_breakdown[0]:
+            st.subheader("Осигуровки по фондове")
+            funds = [('Пенсии', 'pension_insurance'), ('ОЗМ', 'ozm_insurance'),
+                     ('Безработица', 'unemployment_insurance'), ('ДЗПО', 'dzpo_insurance'),
+                     ('Здравно', 'health_insurance')]
+            st.bar_chart(pd.DataFrame({
+                'Служител': [totals[labels[f'{fund}_employee']] for _, fund in funds],
+                'Работодател': [totals[labels[f'{fund}_employer']] for _, fund in funds],
+            }, index=[name for name, _ in funds]))
+        with col_breakdown[1]:
+            st.subheader("Болнични")
+            st.dataframe(pd.DataFrame({
+                'Дни': [totals[labels['days_sick_employer']], totals[labels['days_sick_nssi']]],
+                'Сума (лв)': [totals[labels['sick_pay_employer']], totals[labels['sick_pay_nssi']]],
+            }, index=['Работодател', 'НОИ']), use_container_width=True)
+
+    yearly = pd.DataFrame(db.read_yearly_summary(), columns=['Година'] + list(db.SUMMARY_COLUMN_LABELS.values()))
+    if len(yearly) > 1:
+        st.subheader("По години")
+        st.dataframe(yearly.set_index('Година'), use_container_width=True)
@@ -0,0 +1,174 @@
+import pandas as pd
+import streamlit as st
+
+import db
+import exporter
+import importer
+import workdays
+from db import update_data, delete_data
+from payroll import GROSS_SALARY_MIN, GROSS_SALARY_MAX, MAX_YEARS_EXPERIENCE, SUPKO_RATE_OPTIONS, TZPB_RATE_OPTIONS
+
+# Страница за управление на записите: таблица за редакция, импорт, експорт и единичен запис
+year = st.session_state['year']
+
+st.header("Управление на данни за заплати")
+
+st.subheader("Записи")
+col_filters = st.columns(3)
+with col_filters[0]:
+    filter_egn = st.text_input("ЕГН (начало):", key='filter_egn')
+with col_filters[1]:
+    filter_name = st.text_input("Име (начало):", key='filter_name')
+with col_filters[2]:
+    filter_month = st.selectbox("Месец:", options=["Всички"] + workdays.MONTHS, key='filter_month')
+filter_month = None if filter_month == "Всички" else filter_month
+
+# Курсорите за началото на всяка отворена страница; нулират се при промяна на филтрите
+filters = (year, filter_egn, filter_name, filter_month)
+if st.session_state.get('page_filters') != filters:
+    st.session_state['page_filters'] = filters
+    st.session_state['page_cursors'] = [None]
+page_cursors = st.session_state['page_cursors']
+# Таблицата за редакция е нова за всяка страница и след всеки запис, за да не пренася стари промени
+editor_key = f"records_editor_{st.session_state.get('editor_version', 0)}_{len(page_cursors)}_{hash(filters)}"
+
+# Взима се един ред повече, за да се разбере дали има следваща страница
+page = db.read_page(filter_egn, filter_name, filter_month, after=page_cursors[-1], limit=db.PAGE_SIZE + 1,
+                    year=year)
+has_next_page = len(page) > db.PAGE_SIZE
+page = page[:db.PAGE_SIZE]
+
+labels = db.SALARY_COLUMN_LABELS
+df = pd.DataFrame(page, columns=list(labels.values()))
+# Редакциите във формата не презареждат страницата - проверяват се и се записват наведнъж при „Запази“
+with st.form(key='records_form', border=False):
+    st.caption("Редактирайте клетките, добавяйте редове най-отдолу или ги изтривайте, после запазете всички "
+               "промени наведнъж.")
+    st.data_editor(df, key=editor_key, num_rows='dynamic', hide_index=True, use_container_width=True,
+                   column_config={
+                       labels['egn']: st.column_config.TextColumn(required=True, max_chars=10),
+                       labels['full_name']: st.column_config.TextColumn(required=True),
+                       labels['month']: st.column_config.SelectboxColumn(options=workdays.MONTHS, required=True),
+                       labels['gross_salary_base']: st.column_config.NumberColumn(
+                           min_value=GROSS_SALARY_MIN, max_value=GROSS_SALARY_MAX, step=0.01, format="%.2f",
+                           required=True),
+                       labels['supko_rate']: st.column_config.SelectboxColumn(options=SUPKO_RATE_OPTIONS,
+                                                                              required=True),
+                       labels['years_experience']: st.column_config.NumberColumn(
+                           min_value=0, max_value=MAX_YEARS_EXPERIENCE, step=1, required=True),
+                       **{labels[name]: st.column_config.NumberColumn(min_value=0, step=1, default=0)
+                          for name in ['days_vacation', 'days_sick', 'days_absence', 'days_unpaid']},
+                       labels['sick_leave_count']: st.column_config.NumberColumn(min_value=0, step=1, default=1),
+                   })
+    save_grid = st.form_submit_button("Запази промените", type='primary')
+
+# Само разликата спрямо заредената страница се проверява и записва в една транзакция, последвана от
+# едно презареждане. При грешка нищо не се записва и редакциите остават в таблицата за поправка.
+if save_grid:
+    upserts, deletes, grid_errors = importer.table_changes(page, st.session_state.get(editor_key, {}), year)
+    if grid_errors:
+        st.error("Промените не са запазени - поправете редовете:")
+        st.dataframe(pd.DataFrame(grid_errors, columns=['Ред', 'Грешка']), use_container_width=True,
+                     hide_index=True)
+    elif upserts or deletes:
+        db.apply_changes(upserts, deletes, year)
+        st.session_state['editor_version'] = st.session_state.get('editor_version', 0) + 1
+        st.session_state['editor_saved'] = (len(upserts), len(deletes))
+        st.rerun()
+    else:
+        st.info("Няма промени за запазване.")
+if 'editor_saved' in st.session_state:
+    saved, removed = st.session_state.pop('editor_saved')
+    st.success(f"Запазени редове: {saved}, изтрити: {removed}.")
+
+col_pages = st.columns([1, 1, 4])
+with col_pages[0]:
+    if st.button("◀ Предишна", disabled=len(page_cursors) == 1, use_container_width=True):
+        page_cursors.pop()
+        st.rerun()
+with col_pages[1]:
+    if st.button("Следваща ▶", disabled=not has_next_page, use_container_width=True):
+        page_cursors.append(db.page_cursor(page[-1]))
+        st.rerun()
+with col_pages[2]:
+    st.caption(f"Страница {len(page_cursors)}")
+
+with st.expander("📥 Импорт на месечен табел (CSV/XLSX)"):
+    st.markdown(f"Колоните трябва да са като в таблицата по-горе. Записите са за {year} г.; съществуващите "
+                "записи за същия ЕГН и месец се обновяват.")
+    timesheet_file = st.file_uploader("Изберете файл:", type=['csv', 'xlsx'], key='timesheet_file')
+    if timesheet_file is not None and st.button("Импортирай"):
+        try:
+            report = importer.import_timesheet(timesheet_file, year=year)
+        except (ValueError, RuntimeError) as e:
+            st.error(str(e))
+        else:
+            st.success(f"Записани редове: {report['imported']} от {report['rows']}.")
+            if report['errors']:
+                st.warning(f"Пропуснати редове с грешки: {len(report['errors'])}")
+                st.dataframe(pd.DataFrame(report['errors'], columns=['Ред', 'Грешка']),
+                             use_container_width=True)
+
+with st.expander("📤 Експорт на ведомост (CSV/Parquet/XLSX)"):
+    st.markdown("Заплатите се изчисляват и записват на порции, така че и голяма ведомост не натоварва паметта.")
+    col_export = st.columns(3)
+    with col_export[0]:
+        export_month = st.selectbox("Месец:", options=["Цялата година"] + workdays.MONTHS, key='export_month')
+    with col_export[1]:
+        export_tzpb = st.selectbox("ТЗПБ (%):", options=TZPB_RATE_OPTIONS, index=2, key='export_tzpb')
+    with col_export[2]:
+        export_format = st.selectbox("Формат:", options=exporter.EXPORT_FORMATS, key='export_format')
+    export_month = None if export_month == "Цялата година" else export_month
+
+    # Файлът се създава едва при натискане на бутона
+    def build_register(month=export_month, tzpb_rate=export_tzpb, file_format=export_format, year=year):
+        return exporter.register_bytes(file_format, month, tzpb_rate, year)
+
+    st.download_button("Изтегли ведомост", data=build_register,
+                       file_name=f"vedomost_{export_month + '_' if export_month else ''}{year}.{export_format}",
+                       mime=exporter.EXPORT_MIME_TYPES[export_format], use_container_width=True)
+
+st.markdown("---")
+st.subheader("Редактиране и изтриване на записи")
+
+col_crud = st.columns(2)
+with col_crud[0]:
+    egn_edit = st.text_input("Въведете ЕГН на запис за редактиране/изтриване:", key='egn_edit')
+    month_edit = st.selectbox("Изберете месец на запис за редактиране/изтриване:",
+                              options=workdays.MONTHS, key='month_edit')
+
+if egn_edit and month_edit:
+    row_to_edit = db.get_record(egn_edit, month_edit, year)
+    if row_to_edit is not None:
+        st.info(f"Редактирате запис за {row_to_edit['full_name']} за {month_edit} {year}")
+
+        with st.form(key='edit_form'):
+            new_gross_salary_base = st.number_input("Нова брутна заплата:",
+                                                    value=row_to_edit['gross_salary_base'])
+            new_supko_rate = st.selectbox("Нов СУПКО %:", options=SUPKO_RATE_OPTIONS,
+                                          index=SUPKO_RATE_OPTIONS.index(row_to_edit['supko_rate']))
+            new_years_experience = st.number_input("Нови години стаж:", value=row_to_edit['years_experience'])
+            new_days_vacation = st.number_input("Нови дни отпуск:", value=row_to_edit['days_vacation'])
+            new_days_sick = st.number_input("Нови дни болничен:", value=row_to_edit['days_sick'])
+            new_sick_leave_count = st.number_input("Нов брой болнични листа:",
+                                                   value=row_to_edit['sick_leave_count'], min_value=0)
+            new_days_absence = st.number_input("Нови дни самоотлъчка:",
+                                               value=row_to_edit['days_absence'])
+            new_days_unpaid = st.number_input("Нови дни неплатен отпуск:",
+                                              value=row_to_edit['days_unpaid'])
+
+            col_edit_delete = st.columns(2)
+            with col_edit_delete[0]:
+                if st.form_submit_button("Запази промени"):
+                    update_data(egn_edit, month_edit, new_gross_salary_base, new_supko_rate, new_years_experience,
+                                new_days_vacation, new_days_sick, new_days_absence, new_days_unpaid,
+                                new_sick_leave_count, year)
+                    st.success("Записът беше успешно актуализиран!")
+                    st.rerun()
+            with col_edit_delete[1]:
+                if st.form_submit_button("Изтрий запис"):
+                    delete_data(egn_edit, month_edit, year)
+                    st.success("Записът беше успешно изтрит!")
+                    st.rerun()
+    else:
+        st.warning("Не е намерен запис с този ЕГН и месец.")
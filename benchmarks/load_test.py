@@ -0,0 +1,280 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+# Скриптът се пуска от корена на проекта или от папката benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+import db
+from run_benchmarks import _format_seconds, populate
+
+# Натоварване на истинското приложение без браузър: всяка сесия е отделен AppTest в своя нишка - така,
+# както сървърът на Streamlit изпълнява сесиите в нишки на един процес, с общ пул от връзки и обща нишка за запис.
+
+APP_PATH = os.path.join(ROOT, 'app.py')
+RECORDS_PAGE = 'app_pages/records.py'
+
+# Версията на Streamlit, с която са проверени заместванията във вътрешността на AppTest (_shared_runtime).
+# При друга версия натоварването не се пуска - заместванията се проверяват отново и версията се обновява.
+STREAMLIT_VERSION = '1.66'
+
+DEFAULT_SESSIONS = [1, 2, 4, 8, 16]
+DEFAULT_ROWS = 10_000
+# Действията на една сесия: отваряне, изчисление, запис и разглеждане на страници със записи
+ACTIONS = ['open', 'calculate', 'save', 'records', 'next_page']
+
+
+def _rss():
+    # Текущата заета памет на процеса в байтове (без psutil: /proc в Linux, иначе пикът от resource)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _widget(widgets, label):
+    return next(widget for widget in widgets if widget.label.startswith(label))
+
+
+def _button(at, label):
+    return _widget(at.button, label)
+
+
+# Вътрешните атрибути, които _shared_runtime замества, трябва да са същите като в проверената версия -
+# иначе заместването тихо не би имало ефект и сесиите отново биха се пречили една на друга
+def _check_streamlit():
+    if st.__version__.split('.')[:2] != STREAMLIT_VERSION.split('.'):
+        raise RuntimeError(f"Натоварването е проверено със Streamlit {STREAMLIT_VERSION}.x, а е инсталиран "
+                           f"{st.__version__} - проверете _shared_runtime и обновете STREAMLIT_VERSION.")
+    expected = [(Runtime, 'instance', classmethod), (Runtime, 'exists', classmethod),
+                (app_test, 'ScriptCache', type), (local_script_runner, 'ScriptCache', type)]
+    missing = [f"{owner.__name__}.{name}" for owner, name, kind in expected
+               if not isinstance(vars(owner).get(name), kind)]
+    if '_instance' not in vars(Runtime):
+        missing.append('Runtime._instance')
+    if missing:
+        raise RuntimeError(f"Липсват вътрешни атрибути на Streamlit: {', '.join(missing)}.")
+
+
+# AppTest е направен за една сесия наведнъж, а сървърът има един Runtime и един кеш на компилираните скриптове.
+# AppTest.run поставя своя заместител на Runtime в началото на изпълнението и го маха (None) в края - при
+# едновременни сесии краят на една оставя останалите без Runtime, затова докато трае натоварването Runtime
+# винаги съществува: текущият заместител, а докато няма такъв - първият поставен. Кешът на скриптовете е
+# общ както в сървъра и страниците се компилират предварително (иначе всяко изпълнение компилира наново,
+# а ast.parse в Python 3.11 не е безопасен от няколко нишки).
+@contextlib.contextmanager
+def _shared_runtime():
+    instance, exists = Runtime.__dict__['instance'], Runtime.__dict__['exists']
+    script_cache = ScriptCache()
+    for page in [APP_PATH] + glob.glob(os.path.join(ROOT, 'app_pages', '*.py')):
+        script_cache.get_bytecode(page)
+    fallback = []
+
+    def current(cls):
+        if cls._instance is not None:
+            fallback[:] = fallback or [cls._instance]
+            return cls._instance
+        if not fallback:
+            raise RuntimeError("Runtime hasn't been created!")
+        return fallback[0]
+
+    Runtime.instance = classmethod(current)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(fallback))
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists = instance, exists
+        app_test.ScriptCache = local_script_runner.ScriptCache = ScriptCache
+
+
+class Session:
+    def __init__(self, number, timeout, pages):
+        self.number = number
+        self.timeout = timeout
+        self.pages = pages
+        self.latencies = {name: [] for name in ACTIONS}
+        self.errors = []
+
+    # Действието step (натискане, смяна на страница) и едно изпълнение на страницата; грешката в скрипта
+    # (at.exception) или изтеклото време се записват
+    def _run(self, action, at, step=None):
+        start = time.perf_counter()
+        try:
+            if step is not None:
+                step()
+            at.run(timeout=self.timeout)
+        except Exception as e:
+            self.errors.append((action, f"{type(e).__name__}: {e}"))
+            return False
+        self.latencies[action].append(time.perf_counter() - start)
+        for exception in at.exception:
+            self.errors.append((action, exception.message))
+        return not at.exception
+
+    # Потребителят попълва калкулатора, изчислява и записва, после разглежда записите
+    def flow(self, iteration):
+        at = AppTest.from_file(APP_PATH, default_timeout=self.timeout)
+        egn = f"{8_000_000_000 + self.number * 10_000 + iteration:010d}"
+        if not self._run('open', at):
+            return
+        at.text_input(key='egn_input').set_value(egn)
+        at.text_input(key='name_input').set_value(f"Сесия {self.number}")
+        _widget(at.number_input, "Брутна заплата").set_value(2000.0 + 10 * iteration)
+        if not self._run('calculate', at, _button(at, "Изчисли заплата").click):
+            return
+        if not self._run('save', at, _button(at, "Запиши данни").click):
+            return
+        if not self._run('records', at, lambda: at.switch_page(RECORDS_PAGE)):
+            return
+        for _ in range(self.pages):
+            next_page = _button(at, "Следваща ▶")
+            if next_page.disabled or not self._run('next_page', at, next_page.click):
+                break
+
+
+def run_level(sessions, iterations, timeout, pages):
+    workers = [Session(number, timeout, pages) for number in range(sessions)]
+    barrier = threading.Barrier(sessions)
+
+    def work(session):
+        barrier.wait()
+        for iteration in range(iterations):
+            try:
+                session.flow(iteration)
+            except Exception as e:
+                # Липсващ бутон или поле - страницата не е изобразена както се очаква
+                session.errors.append(('flow', f"{type(e).__name__}: {e}"))
+
+    threads = [threading.Thread(target=work, args=(session,), name=f'session-{session.number}')
+               for session in workers]
+    rss_before = _rss()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    rss_after = _rss()
+
+    latencies = {name: [value for session in workers for value in session.latencies[name]] for name in ACTIONS}
+    errors = [error for session in workers for error in session.errors]
+    actions = sum(len(values) for values in latencies.values())
+    return {
+        'sessions': sessions,
+        'seconds': elapsed,
+        'flows_per_second': sessions * iterations / elapsed,
+        'actions_per_second': actions / elapsed,
+        'latency': {name: {'p50': _percentile(values, 0.50), 'p95': _percentile(values, 0.95),
+                           'p99': _percentile(values, 0.99), 'count': len(values)}
+                    for name, values in latencies.items()},
+        'errors': len(errors),
+        'lock_errors': sum('locked' in message or 'busy' in message for _, message in errors),
+        'error_samples': sorted({f"{action}: {message}" for action, message in errors})[:5],
+        'rss_before': rss_before,
+        'rss_growth': None if rss_before is None or rss_after is None else rss_after - rss_before,
+    }
+
+
+def run(session_levels, iterations, rows, timeout, pages):
+    _check_streamlit()
+    report = {
+        'python': platform.python_version(),
+        'sqlite': db.sqlite3.sqlite_version,
+        'streamlit': st.__version__,
+        'rows': rows,
+        'iterations': iterations,
+        'levels': [],
+    }
+    previous_path = db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'salaries.db')
+        # Пулът на приложението е в st.cache_resource - нов за временната база
+        st.cache_resource.clear()
+        pool = db.ConnectionPool(db.DB_PATH)
+        db.set_pool(pool)
+        try:
+            db.create_db()
+            populate(rows)
+            with _shared_runtime():
+                for sessions in session_levels:
+                    report['levels'].append(run_level(sessions, iterations, timeout, pages))
+        finally:
+            st.cache_resource.clear()
+            db.set_pool(None)
+            pool.close()
+            db.DB_PATH = previous_path
+    return report
+
+
+def _format_optional(seconds):
+    return _format_seconds(seconds) if seconds is not None else f"{'-':>12}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Натоварване на app.py с много едновременни сесии (streamlit.testing) върху временна база.")
+    parser.add_argument('--sessions', type=int, nargs='+', default=DEFAULT_SESSIONS,
+                        help="Брой едновременни сесии за всяко ниво (по подразбиране: %(default)s)")
+    parser.add_argument('--iterations', type=int, default=3,
+                        help="Пълни потребителски сценарии на всяка сесия (по подразбиране: %(default)s)")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help="Служители-месеци в началната база (по подразбиране: %(default)s)")
+    parser.add_argument('--pages', type=int, default=2,
+                        help="Страници със записи, разглеждани в един сценарий (по подразбиране: %(default)s)")
+    parser.add_argument('--timeout', type=float, default=60,
+                        help="Най-дълго изпълнение на страницата в секунди, след което е грешка (по подразбиране: "
+                             "%(default)s)")
+    parser.add_argument('--output', help="JSON файл за резултатите")
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.iterations, args.rows, args.timeout, args.pages)
+    for level in report['levels']:
+        growth = level['rss_growth']
+        print(f"\n{level['sessions']} сесии: {level['flows_per_second']:.2f} сценария/s, "
+              f"{level['actions_per_second']:.1f} действия/s, грешки: {level['errors']} "
+              f"(заключена база: {level['lock_errors']}), памет: "
+              f"{'-' if growth is None else f'{growth / 2 ** 20:+.1f} MB'}")
+        print(f"  {'действие':<12}{'p50':>12}{'p95':>12}{'p99':>12}")
+        for name, latency in level['latency'].items():
+            print(f"  {name:<12}{_format_optional(latency['p50'])}{_format_optional(latency['p95'])}"
+                  f"{_format_optional(latency['p99'])}")
+        for sample in level['error_samples']:
+            print(f"  ГРЕШКА {sample}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if any(level['errors'] for level in report['levels']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Скриптът се пуска от корена на проекта или от папката benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import payroll
+import workdays
+from payroll import DEFAULT_YEAR, SUPKO_RATE_OPTIONS
+
+MONTHS = workdays.MONTHS
+DEFAULT_SIZES = [1_000, 100_000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.20
+# Едновременни сесии при теста за запис от много нишки
+WRITER_THREADS = 16
+
+
+# --- Синтетични данни ---
+
+def synthetic_rows(size, seed=2025):
+    rng = random.Random(seed)
+    for i in range(size):
+        month = MONTHS[i % 12]
+        working_days = workdays.working_days(DEFAULT_YEAR, i % 12 + 1)
+        days_vacation = rng.choice([0, 0, 0, 1, 2, 5])
+        days_sick = rng.choice([0, 0, 0, 0, 2, 4])
+        days_absence = rng.choice([0] * 19 + [1])
+        days_unpaid = rng.choice([0] * 9 + [1])
+        days_unpaid = min(days_unpaid, working_days - days_vacation - days_sick - days_absence)
+        yield (f"{7000000000 + i // 12:010d}", f"Служител {i // 12}", month,
+               float(rng.randrange(1050, 8000, 50)), rng.choice(SUPKO_RATE_OPTIONS), rng.randint(0, 40),
+               days_vacation, days_sick, days_absence, days_unpaid, 1 if days_sick else 0)
+
+
+def populate(size):
+    with db.get_pool().transaction() as conn:
+        db.upsert_salaries(conn, synthetic_rows(size))
+
+
+# --- Измерване ---
+
+# Медиана от няколко повторения; per_call дели времето на броя извиквания в едно повторение.
+# Първото извикване не се мери - в него са вносът на модули, студеният кеш на диска и първите заявки.
+def measure(func, repeat=5, per_call=1):
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) / per_call)
+    return statistics.median(timings)
+
+
+def run_size(size, repeat):
+    rng = random.Random(size)
+    employees = max(1, size // 12)
+    sample_egns = [f"{7000000000 + rng.randrange(employees):010d}" for _ in range(200)]
+
+    results = {}
+    start = time.perf_counter()
+    populate(size)
+    results['populate'] = time.perf_counter() - start
+
+    def single_calculations():
+        for egn in sample_egns:
+            payroll.calculate_net_salary_with_absences(2500.0, 0.7, payroll.BIRTH_AFTER_1960, 'Декември', 3, 2, 0, 0,
+                                                       False, 10, 0.6, egn, 1)
+
+    def previous_month_lookups():
+        for egn in sample_egns:
+            db.get_previous_month_data(egn, 'Декември')
+
+    def inserts():
+        for i, egn in enumerate(sample_egns):
+            db.add_data(egn, 'Бенчмарк', MONTHS[i % 12], 3000.0, 0.6, 5, 0, 0, 0, 0, 0)
+
+    def updates():
+        for i, egn in enumerate(sample_egns):
+            db.update_data(egn, MONTHS[i % 12], 3100.0, 0.7, 5, 1, 0, 0, 0, 0)
+
+    results['single_calculation'] = measure(single_calculations, repeat, len(sample_egns))
+    results['previous_month_lookup'] = measure(previous_month_lookups, repeat, len(sample_egns))
+    results['previous_month_lookup_all'] = measure(lambda: db.get_previous_month_data_all('Декември'), repeat)
+    results['batch_month_run'] = measure(lambda: payroll.run_month('Декември'), repeat)
+    # Всяка нишка обновява свой дял от sample_egns, както няколко служители, записващи едновременно
+    def concurrent_updates():
+        threads = [threading.Thread(target=lambda part=sample_egns[i::WRITER_THREADS]: [
+            db.update_data(egn, 'Януари', 3200.0, 0.7, 5, 1, 0, 0, 0, 0) for egn in part])
+            for i in range(WRITER_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    results['insert'] = measure(inserts, repeat, len(sample_egns))
+    results['update'] = measure(updates, repeat, len(sample_egns))
+    results['concurrent_update'] = measure(concurrent_updates, repeat, len(sample_egns))
+    results['read_data'] = measure(db.read_data, repeat)
+    return results
+
+
+def run(sizes, repeat):
+    report = {
+        'python': platform.python_version(),
+        'sqlite': db.sqlite3.sqlite_version,
+        'results': {},
+    }
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            pool = db.ConnectionPool(os.path.join(tmp, 'bench.db'))
+            db.set_pool(pool)
+            try:
+                db.create_db()
+                report['results'][str(size)] = run_size(size, repeat)
+            finally:
+                # Спира и нишката за запис, която държи своя връзка към временната база
+                db.set_pool(None)
+                pool.close()
+    return report
+
+
+# Сравнение с базовата линия: (размер, тест, базово време, ново време) за всички забавяния над прага
+def find_regressions(report, baseline, threshold):
+    regressions = []
+    for size, results in report['results'].items():
+        for name, seconds in results.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if base and seconds > base * (1 + threshold):
+                regressions.append((size, name, base, seconds))
+    return regressions
+
+
+# Тестове, които липсват в базовата линия за размер, който я има - без тях нов тест не се сравнява никога
+def find_missing(report, baseline):
+    missing = []
+    for size, results in report['results'].items():
+        base = baseline.get('results', {}).get(size)
+        if base is not None:
+            missing.extend((size, name) for name in results if name not in base)
+    return missing
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds:9.3f} s "
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмаркове на изчисленията и базата данни върху временна база.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Брой служители-месеци в синтетичните данни (напр. 1000 100000 1000000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Повторения на всеки тест (взима се медианата)")
+    parser.add_argument('--output', help="JSON файл за резултатите")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Базова линия за сравнение")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимо забавяне спрямо базовата линия (0.20 = 20%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="Записва резултатите като нова базова линия")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.repeat)
+    for size, results in report['results'].items():
+        print(f"\n{int(size):,} служители-месеци")
+        for name, seconds in results.items():
+            print(f"  {name:<28}{_format_seconds(seconds)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nБазовата линия е записана в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(report, baseline, args.threshold)
+    for size, name, base, seconds in regressions:
+        print(f"ЗАБАВЯНЕ: {name} при {int(size):,} реда: {_format_seconds(base).strip()} -> "
+              f"{_format_seconds(seconds).strip()} (+{(seconds / base - 1) * 100:.0f}%)")
+    missing = find_missing(report, baseline)
+    for size, name in missing:
+        print(f"НЯМА БАЗОВА СТОЙНОСТ: {name} при {int(size):,} реда (обновете с --save-baseline)")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
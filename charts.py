@@ -0,0 +1,89 @@
+import io
+from functools import lru_cache
+
+# Графиките се рисуват без pyplot: фигурите не се регистрират глобално и се освобождават веднага,
+# а matplotlib се зарежда едва при първата графика.
+
+EMPLOYEE_LABELS = ['Нетна заплата', 'Пенсионно осигуряване', 'ОЗМ',
+                   'Безработица', 'ДЗПО', 'Здравно осигуряване', 'ЗО за непл. отпуск', 'Данък']
+
+EMPLOYER_LABELS = [
+    'Брутна заплата', 'Пенсионно (Р-л)', 'ОЗМ (Р-л)', 'Безработица (Р-л)',
+    'ДЗПО (Р-л)', 'ТЗПБ', 'Здравно (Р-л)', 'Здр. осиг. за болнични (Р-л)',
+    'ЗО за непл. отпуск (С-л)'
+]
+EMPLOYER_COLORS = ['#ff9999', '#66b3ff', '#ffcc99', '#99ff99', '#ff6b6b', '#4ecdc4', '#ff9ff3', '#c466ff',
+                   '#e0e0e0']
+
+# Брой запомнени изображения за всяка от графиките
+CACHE_SIZE = 128
+
+
+# Стойностите се закръглят до стотинка - така и ключът на кеша е стабилен
+def employee_values(result):
+    return tuple(round(float(value), 2) for value in (
+        result['net_salary'],
+        result['pension_insurance_employee'],
+        result['ozm_insurance_employee'],
+        result['unemployment_insurance_employee'],
+        result['dzpo_insurance_employee'],
+        result['health_insurance_employee'],
+        result['health_insurance_unpaid'],
+        result['income_tax']
+    ))
+
+
+def employer_values(result):
+    return tuple(round(float(value), 2) for value in (
+        result['gross_salary_with_supko'], result['pension_insurance_employer'],
+        result['ozm_insurance_employer'],
+        result['unemployment_insurance_employer'], result['dzpo_insurance_employer'], result['tzpb'],
+        result['health_insurance_employer'], result['health_insurance_sick_leave_employer'],
+        result['health_insurance_unpaid']
+    ))
+
+
+def _to_png(fig):
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format='png')
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+def _autopct_format(pct):
+    return f'{pct:.1f}%' if pct >= 3 else ''
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def employee_chart(values):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 8))
+    ax1 = fig.subplots()
+    ax1.pie(values, labels=EMPLOYEE_LABELS, autopct=_autopct_format, startangle=90,
+            textprops={'fontsize': 10})
+    ax1.set_title('Разпределение на дохода за служителя')
+    return _to_png(fig)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def employer_chart(values):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 8))
+    ax2 = fig.subplots()
+    bars = ax2.bar(EMPLOYER_LABELS, values, color=EMPLOYER_COLORS)
+    ax2.set_title('Разходи от гледна точка на работодателя')
+    ax2.set_ylabel('Сума (лв)')
+    ax2.tick_params(axis='x', labelrotation=45, labelsize=9)
+    for label in ax2.get_xticklabels():
+        label.set_horizontalalignment('right')
+    for bar in bars:
+        height = bar.get_height()
+        ax2.annotate(f'{height:,.2f}', xy=(bar.get_x() + bar.get_width() / 2, height),
+                     xytext=(0, 3), textcoords="offset points", ha='center', va='bottom', fontsize=7,
+                     rotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
@@ -0,0 +1,164 @@
+import argparse
+import sys
+
+import db
+import exporter
+import importer
+import payroll
+import perf
+import scenarios
+
+
+def _import(args):
+    report = importer.import_timesheet(args.file, args.format, args.chunk_size, args.year)
+    print(f"Прочетени редове: {report['rows']}, записани: {report['imported']}, грешки: {len(report['errors'])}")
+    for line_number, message in report['errors']:
+        print(f"  ред {line_number}: {message}", file=sys.stderr)
+    return 1 if report['errors'] else 0
+
+
+def _run(args):
+    money = payroll.MONEY_STOTINKI if args.stotinki else payroll.MONEY_FLOAT
+    if args.month:
+        results = payroll.run_month(args.month, args.tzpb, args.telk, money, args.year)
+    else:
+        results = payroll.run_year(args.tzpb, args.telk, args.workers, money, args.year)
+    results = results.to_frame()
+    if args.stotinki:
+        results = payroll.stotinki_to_levs(results)
+    results.to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"Изчислени заплати: {len(results)} за {args.month or 'цялата година'} {args.year} -> {args.output}")
+    return 0
+
+
+def _export(args):
+    money = payroll.MONEY_STOTINKI if args.stotinki else payroll.MONEY_FLOAT
+    rows = exporter.export_register(args.output, args.format, args.month, args.tzpb, args.telk, money,
+                                    args.chunk_size, args.year)
+    print(f"Ведомост за {args.month or 'цялата година'} {args.year}: {rows} реда -> {args.output}")
+    return 0
+
+
+def _refresh(args):
+    telk_egns = [] if args.no_telk else args.telk
+    count = payroll.refresh_results(args.tzpb, telk_egns, args.year)
+    print(f"Преизчислени записи: {count}")
+    return 0
+
+
+def _scenarios(args):
+    grid = scenarios.scenario_grid(args.salary_change, args.supko or [None], args.scenario_tzpb or [None],
+                                   args.max_insurance_income or [None])
+    batch = scenarios.headcount(args.month, args.year, args.tzpb, args.telk)
+    report = scenarios.run_scenarios(batch, grid)
+    report.to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"Сценарии: {len(report)} върху {len(batch)} записа за {args.month or 'цялата година'} {args.year}"
+          f" -> {args.output}")
+    return 0
+
+
+def _changes(args):
+    output = sys.stdout.buffer if args.output == '-' else args.output
+    file_format = args.format or ('csv' if args.output == '-' else None)
+    rows, cursor = exporter.export_changes(output, file_format, args.after, args.chunk_size)
+    print(f"Промени след {args.after}: {rows}, следващ курсор: --after {cursor}", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Калкулатор за заплати - команди без графичен интерфейс.")
+    parser.add_argument('--db', default=db.DB_PATH, help="Път до базата данни (по подразбиране: %(default)s)")
+    parser.add_argument('--perf', metavar='ФАЙЛ', help="Записва времената по фази и броя заявки в JSON файл")
+    parser.add_argument('--year', type=int, default=payroll.DEFAULT_YEAR, choices=payroll.PAYROLL_YEARS,
+                        help="Година на записите и изчисленията (по подразбиране: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Импорт на месечен табел от CSV или XLSX")
+    import_parser.add_argument('file', help="CSV или XLSX файл с колоните от таблицата със записи")
+    import_parser.add_argument('--format', choices=['csv', 'xlsx'], help="Формат на файла (по разширението)")
+    import_parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE, help="Редове в една транзакция")
+    import_parser.set_defaults(handler=_import)
+
+    run_parser = commands.add_parser('run', help="Изчисляване на заплатите на всички служители за месец или година")
+    run_parser.add_argument('--month', choices=payroll.MONTHS,
+                            help="Месец на изчисление (без него - всички месеци)")
+    run_parser.add_argument('--workers', type=int, default=1,
+                            help="Брой процеси за изчисление на цялата година (по подразбиране: %(default)s)")
+    run_parser.add_argument('--output', required=True, help="CSV файл за резултатите")
+    run_parser.add_argument('--stotinki', action='store_true',
+                            help="Изчисление в цели стотинки със закръгляне на всяко перо (точни общи суми)")
+    run_parser.add_argument('--tzpb', type=float, default=payroll.DEFAULT_TZPB_RATE, choices=payroll.TZPB_RATE_OPTIONS,
+                            help="ТЗПБ в %% (по подразбиране: %(default)s)")
+    run_parser.add_argument('--telk', action='append', default=[], metavar='ЕГН',
+                            help="ЕГН на служител с ТЕЛК (може да се повтаря)")
+    run_parser.set_defaults(handler=_run)
+
+    export_parser = commands.add_parser('export', help="Експорт на ведомост към CSV, Parquet или XLSX на порции")
+    export_parser.add_argument('output', help="Файл за ведомостта")
+    export_parser.add_argument('--format', choices=exporter.EXPORT_FORMATS, help="Формат на файла (по разширението)")
+    export_parser.add_argument('--month', choices=payroll.MONTHS,
+                               help="Месец на ведомостта (без него - всички месеци)")
+    export_parser.add_argument('--tzpb', type=float, default=payroll.DEFAULT_TZPB_RATE,
+                               choices=payroll.TZPB_RATE_OPTIONS, help="ТЗПБ в %% (по подразбиране: %(default)s)")
+    export_parser.add_argument('--telk', action='append', default=[], metavar='ЕГН',
+                               help="ЕГН на служител с ТЕЛК (може да се повтаря)")
+    export_parser.add_argument('--stotinki', action='store_true',
+                               help="Изчисление в цели стотинки със закръгляне на всяко перо (точни общи суми)")
+    export_parser.add_argument('--chunk-size', type=int, default=exporter.CHUNK_SIZE,
+                               help="Служители, изчислявани наведнъж (по подразбиране: %(default)s)")
+    export_parser.set_defaults(handler=_export)
+
+    refresh_parser = commands.add_parser('refresh', help="Преизчисляване само на променените записи в payroll_results")
+    refresh_parser.add_argument('--tzpb', type=float, default=payroll.DEFAULT_TZPB_RATE,
+                                choices=payroll.TZPB_RATE_OPTIONS, help="ТЗПБ в %% (по подразбиране: %(default)s)")
+    refresh_telk = refresh_parser.add_mutually_exclusive_group()
+    refresh_telk.add_argument('--telk', action='append', metavar='ЕГН',
+                              help="ЕГН на служител с ТЕЛК (може да се повтаря; по подразбиране: "
+                                   "служителите с ТЕЛК в съхранените резултати)")
+    refresh_telk.add_argument('--no-telk', action='store_true', help="Без ТЕЛК за всички служители")
+    refresh_parser.set_defaults(handler=_refresh)
+
+    scenarios_parser = commands.add_parser('scenarios', help="Какво ако: сумите за фирмата при всички комбинации "
+                                                              "от промени на заплатите, СУПКО, ТЗПБ и максималния доход")
+    scenarios_parser.add_argument('--output', required=True, help="CSV файл със сумите по сценарии")
+    scenarios_parser.add_argument('--month', choices=payroll.MONTHS,
+                                  help="Месец на изчисление (без него - всички месеци)")
+    scenarios_parser.add_argument('--salary-change', type=float, nargs='+', default=[0.0], metavar='%',
+                                  help="Промени на основните заплати в %% (по подразбиране: без промяна)")
+    scenarios_parser.add_argument('--supko', type=float, nargs='+', choices=payroll.SUPKO_RATE_OPTIONS, metavar='%',
+                                  help="СУПКО в %% за всички служители (по подразбиране: от записите)")
+    scenarios_parser.add_argument('--scenario-tzpb', type=float, nargs='+', choices=payroll.TZPB_RATE_OPTIONS,
+                                  metavar='%', help="ТЗПБ в %% за сценариите (по подразбиране: --tzpb)")
+    scenarios_parser.add_argument('--max-insurance-income', type=float, nargs='+', metavar='ЛВ',
+                                  help="Максимален осигурителен доход (по подразбиране: за годината)")
+    scenarios_parser.add_argument('--tzpb', type=float, default=payroll.DEFAULT_TZPB_RATE,
+                                  choices=payroll.TZPB_RATE_OPTIONS, help="ТЗПБ в %% (по подразбиране: %(default)s)")
+    scenarios_parser.add_argument('--telk', action='append', default=[], metavar='ЕГН',
+                                  help="ЕГН на служител с ТЕЛК (може да се повтаря)")
+    scenarios_parser.set_defaults(handler=_scenarios)
+
+    changes_parser = commands.add_parser('changes', help="Промените в записите след даден номер (за синхронизиране)")
+    changes_parser.add_argument('--after', type=int, default=0, metavar='N',
+                                help="Номер на последната вече прочетена промяна (по подразбиране: 0 - от началото)")
+    changes_parser.add_argument('--output', default='-', help="Файл за промените (по подразбиране: стандартният изход)")
+    changes_parser.add_argument('--format', choices=exporter.CHANGE_FORMATS, help="Формат (по разширението, иначе CSV)")
+    changes_parser.add_argument('--chunk-size', type=int, default=db.CHANGES_CHUNK_SIZE,
+                                help="Промени, четени от базата наведнъж (по подразбиране: %(default)s)")
+    changes_parser.set_defaults(handler=_changes)
+
+    args = parser.parse_args(argv)
+    if args.perf:
+        perf.enable()
+    perf.begin_request(f'cli.{args.command}')
+    try:
+        db.set_pool(db.ConnectionPool(args.db))
+        db.create_db()
+        return args.handler(args)
+    finally:
+        perf.end_request()
+        if args.perf:
+            perf.dump(args.perf)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
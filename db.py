@@ -0,0 +1,1052 @@
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import perf
+import workdays
+from payroll import DEFAULT_YEAR, PAYROLL_YEARS, RESULT_COLUMNS
+from workdays import MONTH_NUMBERS
+
+DB_PATH = 'salaries.db'
+
+# Настройки, които се прилагат към всяка нова връзка
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+# --- Пул от връзки ---
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=8, timeout=30, read_only=False):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.read_only = read_only
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # isolation_level=None: транзакциите се отварят изрично с BEGIN
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{os.path.abspath(self.path)}?mode=ro', uri=True, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA query_only = 1")
+            # Режимът на журнала се пази във файла - връзка само за четене не може да го сменя
+            for pragma in PRAGMAS[1:]:
+                conn.execute(pragma)
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        # Броенето на заявките се включва само докато perf е включен
+        conn.set_trace_callback(perf.count_query if perf.is_enabled() else None)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    # BEGIN IMMEDIATE взима заключването за запис още в началото, вместо при първия запис
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def set_pool(pool):
+    global _pool, _writer
+    with _pool_lock:
+        # Интерфейсът задава същия пул при всяко изпълнение - нишката за запис остава
+        if pool is _pool:
+            return
+        _pool = pool
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+# --- Опашка за запис ---
+
+# Продължителност на прозореца, в който чакащите записи се събират в една транзакция (секунди),
+# и най-много операции в една транзакция
+WRITE_WINDOW = 0.0005
+WRITE_BATCH_SIZE = 256
+
+
+# Всички записи минават през една нишка с отделна връзка: операциите от различните сесии се събират
+# в обща транзакция и се потвърждават с един commit, така че записите не се борят за заключването на файла.
+# Грешка в една операция не проваля останалите в пакета. Четенето продължава през пула и не чака (WAL).
+class WriteQueue:
+    def __init__(self, pool, window=WRITE_WINDOW, batch_size=WRITE_BATCH_SIZE):
+        self.pool = pool
+        self.window = window
+        self.batch_size = batch_size
+        self._pending = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    # Добавя operation(conn) към опашката; резултатът (или грешката) е във върнатия Future след commit
+    def submit(self, operation):
+        context = perf.current()
+        if context is not None:
+            operation = self._counted(operation, context)
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Опашката за запис е затворена.")
+            # Нишката се пуска при първия запис (и наново в процес, създаден с fork)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+            self._pending.put((operation, future))
+        return future
+
+    # Заявките на операцията се броят към заявката и фазата на нишката, която я е подала. Броенето е
+    # включено само за такива операции - за всички записи то утроява времето на големите импорти.
+    @staticmethod
+    def _counted(operation, context):
+        def counted(conn):
+            conn.set_trace_callback(perf.count_query)
+            try:
+                with perf.attributed(context):
+                    return operation(conn)
+            finally:
+                conn.set_trace_callback(None)
+        return counted
+
+    def execute(self, operation):
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Запис от самата нишка за запис - операцията трябва да използва подадената връзка.")
+        return self.submit(operation).result()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._pending.put(None)
+        if thread is not None and thread.is_alive():
+            thread.join()
+
+    def _run(self):
+        try:
+            conn = self.pool._connect()
+        except BaseException as e:
+            self._fail(e)
+            return
+        try:
+            # Потвърждението означава запис на диска; fsync се плаща веднъж за целия пакет
+            conn.execute("PRAGMA synchronous = FULL")
+        except BaseException as e:
+            conn.close()
+            self._fail(e)
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch and batch[-1] is None:
+                    if batch[:-1]:
+                        self._commit(conn, batch[:-1])
+                    return
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    # Базата не може да се отвори: чакащите в момента записи получават грешката, вместо да чакат нишка,
+    # която вече я няма. Опашката остава отворена - следващият запис пуска нова нишка (грешката може да е
+    # временна, напр. заключен файл). Под заключването submit не може да добави запис по време на изчистването.
+    def _fail(self, error):
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+            while True:
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    return
+                if item is not None and item[1].set_running_or_notify_cancel():
+                    item[1].set_exception(error)
+
+    # Първата операция се чака без ограничение, следващите - до края на прозореца или до batch_size.
+    # Прозорецът се изчаква само ако има и други чакащи записи - единичен запис не се бави.
+    def _next_batch(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window if not self._pending.empty() else 0
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self._pending.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, conn, batch):
+        batch = [(operation, future) for operation, future in batch if future.set_running_or_notify_cancel()]
+        try:
+            outcomes = self._transaction(conn, batch)
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    # (future, резултат, грешка) за всяка операция от пакета
+    def _transaction(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            return [(future, None, e) for _, future in batch]
+        try:
+            results = [operation(conn) for operation, _ in batch]
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if len(batch) == 1:
+                return [(batch[0][1], None, e)]
+            # Грешка в една операция връща целия пакет - тогава всяка се изпълнява в своя транзакция,
+            # за да получи собствения си резултат (SAVEPOINT за всяка операция е в пъти по-бавен при големи записи)
+            return [outcome for item in batch for outcome in self._transaction(conn, [item])]
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        return [(future, result, None) for (_, future), result in zip(batch, results)]
+
+
+_writer = None
+
+
+def get_writer():
+    global _writer
+    get_pool()
+    with _pool_lock:
+        if _writer is None:
+            _writer = WriteQueue(_pool)
+        return _writer
+
+
+# Изпълнява operation(conn) в нишката за запис и връща резултата, след като транзакцията е потвърдена
+def write(operation):
+    return get_writer().execute(operation)
+
+
+# --- База данни ---
+
+# Колоните на месечен запис, както ги виждат останалите модули, и заглавията им в интерфейса.
+# В базата името е в employees, а месецът се пази като номер заедно с годината.
+SALARY_COLUMNS = ['egn', 'full_name', 'month', 'gross_salary_base', 'supko_rate', 'years_experience',
+                  'days_vacation', 'days_sick', 'days_absence', 'days_unpaid', 'sick_leave_count']
+SALARY_COLUMN_LABELS = dict(zip(SALARY_COLUMNS, [
+    'ЕГН', 'Име', 'Месец', 'Брутна Заплата', 'СУПКО %', 'Години стаж', 'Дни отпуск', 'Дни болничен',
+    'Дни самоотлъчка', 'Дни неплатен', 'Брой болнични листа']))
+RECORD_COLUMNS = SALARY_COLUMNS[3:]
+
+# Старата таблица salaries (без колона за година) съдържаше само 2025 г.
+LEGACY_SALARIES_YEAR = 2025
+# Най-много пропуснати записи, изброени в грешката при прехвърлянето от старата схема
+LEGACY_SKIPPED_SHOWN = 20
+
+
+def month_index(month):
+    return MONTH_NUMBERS[month]
+
+
+def _month_name_sql(column):
+    return "CASE {} {} END".format(column, " ".join(
+        f"WHEN {idx} THEN '{name}'" for name, idx in MONTH_NUMBERS.items()))
+
+
+# Работните дни от календара за годините със ставки (за другите години - NULL)
+def _working_days_sql(year_column, month_column):
+    return "CASE {} {} END".format(year_column, " ".join(
+        "WHEN {} THEN CASE {} {} END".format(year, month_column, " ".join(
+            f"WHEN {month} THEN {days}" for month, days in enumerate(
+                workdays.month_working_days(year).values(), start=1)))
+        for year in PAYROLL_YEARS))
+
+
+# Отработени дни в месечен запис r
+DAYS_WORKED_SQL = (f"{_working_days_sql('r.year', 'r.month')} - r.days_vacation - r.days_sick"
+                   " - r.days_absence - r.days_unpaid")
+
+# Име и номер на всеки месец като таблица - само за прехвърлянето от старата схема
+MONTHS_CTE = "months(name, idx) AS (VALUES {})".format(", ".join(
+    f"('{name}', {idx})" for name, idx in MONTH_NUMBERS.items()))
+
+# Записите във вида на SALARY_COLUMNS
+SELECT_SALARIES_SQL = '''
+    SELECT r.egn, e.full_name, {month}, {columns}
+    FROM salary_records r JOIN employees e ON e.egn = r.egn
+'''.format(month=_month_name_sql('r.month'), columns=', '.join(f'r.{name}' for name in RECORD_COLUMNS))
+
+UPSERT_EMPLOYEE_SQL = '''
+    INSERT INTO employees (egn, full_name) VALUES (?, ?)
+    ON CONFLICT (egn) DO UPDATE SET full_name = excluded.full_name
+'''
+
+UPSERT_RECORD_SQL = '''
+    INSERT INTO salary_records (egn, year, month, {columns}) VALUES (?, ?, ?, {placeholders})
+    ON CONFLICT (egn, year, month) DO UPDATE SET {updates}
+'''.format(
+    columns=', '.join(RECORD_COLUMNS),
+    placeholders=', '.join('?' for _ in RECORD_COLUMNS),
+    updates=', '.join(f'{name} = excluded.{name}' for name in RECORD_COLUMNS))
+
+# Брой записи на една страница в таблицата с данни
+PAGE_SIZE = 50
+
+
+# Месеци преди текущия (и от предходните години), в които са отработени най-малко 10 дни.
+# salary_records е WITHOUT ROWID с ключ (egn, year, month) - за един ЕГН това е обхват по ключа.
+QUALIFYING_MONTHS_SQL = f'''
+    SELECT r.egn, r.year, r.month, r.gross_salary_base, r.supko_rate, r.years_experience,
+           {_working_days_sql('r.year', 'r.month')} AS working_days
+    FROM salary_records r
+    WHERE (r.year, r.month) < (:year, :month) AND {DAYS_WORKED_SQL} >= 10
+'''
+
+# Записите, чийто резултат може да се промени след запис за (egn, година, месец): самият месец и
+# следващите месеци (и в следващите години) до първия с 10+ отработени дни включително - след него
+# базата за отпуска вече е друга. period номерира месеците подред през годините.
+MARK_DIRTY_SQL = f'''
+    WITH later AS (
+        SELECT r.year, r.month, r.year * 12 + r.month AS period, {DAYS_WORKED_SQL} >= 10 AS qualifies
+        FROM salary_records r
+        WHERE r.egn = :egn AND (r.year, r.month) > (:year, :month)
+    )
+    INSERT INTO payroll_dirty (egn, year, month)
+    SELECT :egn, :year, :month
+    UNION ALL
+    SELECT :egn, year, month FROM later
+    WHERE period <= COALESCE((SELECT MIN(period) FROM later WHERE qualifies), period)
+    ON CONFLICT (egn, year, month) DO UPDATE SET version = version + 1
+'''
+
+# Суми за цялата фирма по месеци в payroll_summary - поддържат се от тригери при всяка промяна в
+# payroll_results. Сумите са в цели стотинки, за да не се натрупва грешка при многократното добавяне и изваждане.
+SUMMARY_MONEY_COLUMNS = [
+    'total_gross_income', 'net_salary', 'total_employer_cost', 'total_insurance_employee',
+    'total_insurance_employer', 'income_tax',
+    'pension_insurance_employee', 'pension_insurance_employer', 'ozm_insurance_employee', 'ozm_insurance_employer',
+    'unemployment_insurance_employee', 'unemployment_insurance_employer', 'dzpo_insurance_employee',
+    'dzpo_insurance_employer', 'health_insurance_employee', 'health_insurance_employer',
+    'health_insurance_sick_leave_employer', 'health_insurance_unpaid', 'tzpb',
+    'sick_pay_employer', 'sick_pay_nssi',
+]
+SUMMARY_DAY_COLUMNS = ['days_sick_employer', 'days_sick_nssi']
+# records е броят изчислени записи (служители-месеци)
+SUMMARY_COLUMNS = ['records'] + SUMMARY_MONEY_COLUMNS + SUMMARY_DAY_COLUMNS
+SUMMARY_COLUMN_LABELS = dict(zip(SUMMARY_COLUMNS, [
+    'Записи', 'Брутен доход', 'Нетно', 'Разходи за работодател', 'Осигуровки служител', 'Осигуровки работодател',
+    'Данък', 'Пенсии (служител)', 'Пенсии (работодател)', 'ОЗМ (служител)', 'ОЗМ (работодател)',
+    'Безработица (служител)', 'Безработица (работодател)', 'ДЗПО (служител)', 'ДЗПО (работодател)',
+    'Здравно (служител)', 'Здравно (работодател)', 'Здравно за болнични', 'Здравно за неплатен отпуск', 'ТЗПБ',
+    'Болнични от работодател', 'Болнични от НОИ', 'Дни болничен (работодател)', 'Дни болничен (НОИ)']))
+
+
+# Стойностите на един ред от payroll_results (row) за колоните на SUMMARY_COLUMNS
+def _summary_values(row):
+    return (['1'] + [f'CAST(ROUND({row}.{name} * 100) AS INTEGER)' for name in SUMMARY_MONEY_COLUMNS]
+            + [f'CAST({row}.{name} AS INTEGER)' for name in SUMMARY_DAY_COLUMNS])
+
+
+# Добавя (sign='') или изважда (sign='-') ред от payroll_results към сумите за неговия месец
+def _summary_upsert_sql(row, sign=''):
+    return f'''
+        INSERT INTO payroll_summary (year, month, {", ".join(SUMMARY_COLUMNS)})
+        VALUES ({row}.year, {row}.month, {", ".join(sign + value for value in _summary_values(row))})
+        ON CONFLICT (year, month) DO UPDATE SET
+            {", ".join(f"{name} = {name} + excluded.{name}" for name in SUMMARY_COLUMNS)};
+    '''
+
+
+# Журнал на промените в месечните записи за синхронизиране на други системи: всеки запис, промяна и
+# изтриване в salary_records (и смяна на името в employees) добавя ред в salary_changes с растящ номер seq.
+# Записите минават по един през BEGIN IMMEDIATE, така че редът на seq е и редът на потвърждаване - след
+# прочитане до seq = N по-късно не може да се появи промяна с по-малък номер.
+CHANGE_OPERATIONS = ['insert', 'update', 'delete']
+CHANGE_COLUMNS = ['seq', 'operation', 'changed_at', 'egn', 'year', 'month', 'full_name'] + RECORD_COLUMNS
+# Най-много промени, прочитани от базата наведнъж
+CHANGES_CHUNK_SIZE = 10_000
+
+
+# Добавя ред за operation със стойностите на ред row от salary_records (NEW или OLD)
+def _journal_insert_sql(operation, row):
+    return f'''
+        INSERT INTO salary_changes (operation, egn, year, month, full_name, {", ".join(RECORD_COLUMNS)})
+        VALUES ('{operation}', {row}.egn, {row}.year, {row}.month,
+                (SELECT full_name FROM employees WHERE egn = {row}.egn),
+                {", ".join(f"{row}.{name}" for name in RECORD_COLUMNS)});
+    '''
+
+
+# --- Миграции ---
+
+# Всяка миграция получава връзка в отворена транзакция. Номерът на последната изпълнена
+# се пази в PRAGMA user_version, така че всяка се изпълнява точно веднъж за дадена база.
+
+def _table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (name,)).fetchone() is not None
+
+
+# 1: служителите в отделна таблица, месечните записи с ключ (egn, year, month) и номер на месеца.
+# Старата таблица salaries (с име на месеца и без година) се прехвърля и изтрива.
+def _migrate_normalized_schema(conn):
+    conn.execute('''
+        CREATE TABLE employees (
+            egn TEXT PRIMARY KEY,
+            full_name TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX idx_employees_full_name ON employees (full_name)")
+
+    conn.execute('''
+        CREATE TABLE salary_records (
+            egn TEXT NOT NULL REFERENCES employees (egn),
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL CHECK (month BETWEEN 1 AND 12),
+            gross_salary_base REAL NOT NULL,
+            supko_rate REAL NOT NULL,
+            years_experience INTEGER NOT NULL,
+            days_vacation INTEGER NOT NULL DEFAULT 0,
+            days_sick INTEGER NOT NULL DEFAULT 0,
+            days_absence INTEGER NOT NULL DEFAULT 0,
+            days_unpaid INTEGER NOT NULL DEFAULT 0,
+            sick_leave_count INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (egn, year, month)
+        ) WITHOUT ROWID
+    ''')
+    # Ведомост за месец, подредена по ЕГН
+    conn.execute("CREATE INDEX idx_salary_records_period ON salary_records (year, month)")
+
+    # Съхранени резултати от изчисленията и записите, които трябва да се преизчислят
+    for table in ('payroll_results', 'payroll_dirty'):
+        if _table_exists(conn, table):
+            conn.execute(f"ALTER TABLE {table} RENAME TO legacy_{table}")
+    result_columns = ',\n'.join(f'            {name} REAL' for name in RESULT_COLUMNS)
+    conn.execute(f'''
+        CREATE TABLE payroll_results (
+            egn TEXT,
+            year INTEGER,
+            month INTEGER,
+            tzpb_rate REAL,
+            has_telk INTEGER,
+{result_columns},
+            vacation_base_source TEXT,
+            PRIMARY KEY (egn, year, month)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE payroll_dirty (
+            egn TEXT,
+            year INTEGER,
+            month INTEGER,
+            version INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (egn, year, month)
+        ) WITHOUT ROWID
+    ''')
+
+    # Версия на историята на всеки служител - увеличава се при всеки запис, промяна или изтриване
+    # (пази кеша на изчисленията от остарели резултати, независимо кой процес е писал)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS history_versions (
+            egn TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        conn.execute(f'''
+            CREATE TRIGGER trg_salary_records_version_{event.lower()} AFTER {event} ON salary_records
+            BEGIN
+                INSERT INTO history_versions (egn, version) VALUES ({row}.egn, 1)
+                ON CONFLICT (egn) DO UPDATE SET version = version + 1;
+            END
+        ''')
+
+    if _table_exists(conn, 'salaries'):
+        _copy_legacy_salaries(conn)
+
+
+# Сравнява броя на редовете, копирани от последната заявка (changes() - без тези от тригерите), с тези в старата
+# таблица. Ред с непознат месец не минава през JOIN-а с months - тогава миграцията се прекъсва (транзакцията
+# се отменя) със списък на пропуснатите записи.
+def _check_legacy_copy(conn, table):
+    copied = conn.execute("SELECT changes()").fetchone()[0]
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if copied == count:
+        return
+    skipped = conn.execute(f'''
+        WITH {MONTHS_CTE}
+        SELECT t.egn, t.month FROM {table} t LEFT JOIN months m ON m.name = t.month
+        WHERE m.idx IS NULL
+        ORDER BY t.egn, t.month
+    ''').fetchall()
+    shown = ', '.join(f"{egn} ({month!r})" for egn, month in skipped[:LEGACY_SKIPPED_SHOWN])
+    if len(skipped) > LEGACY_SKIPPED_SHOWN:
+        shown += ', ...'
+    raise ValueError(f"Миграцията е прекъсната: от {count} реда в {table} са копирани {copied}. "
+                     f"Записи с непознат месец ({len(skipped)}): {shown}")
+
+
+def _copy_legacy_salaries(conn):
+    # Името на служителя е това от последния му месец; sick_leave_count липсва в най-старите бази
+    legacy_columns = [row[1] for row in conn.execute("PRAGMA table_info(salaries)")]
+    sick_leave_count = 'COALESCE(s.sick_leave_count, 1)' if 'sick_leave_count' in legacy_columns else '1'
+    conn.execute(f'''
+        WITH {MONTHS_CTE}
+        INSERT INTO employees (egn, full_name)
+        SELECT egn, full_name FROM (
+            SELECT s.egn, s.full_name, MAX(m.idx) FROM salaries s JOIN months m ON m.name = s.month
+            GROUP BY s.egn
+        )
+    ''')
+    conn.execute(f'''
+        WITH {MONTHS_CTE}
+        INSERT INTO salary_records (egn, year, month, {", ".join(RECORD_COLUMNS)})
+        SELECT s.egn, {LEGACY_SALARIES_YEAR}, m.idx, {", ".join(f"s.{name}" for name in RECORD_COLUMNS[:-1])},
+               {sick_leave_count}
+        FROM salaries s JOIN months m ON m.name = s.month
+    ''')
+    _check_legacy_copy(conn, 'salaries')
+    if _table_exists(conn, 'legacy_payroll_results'):
+        conn.execute(f'''
+            WITH {MONTHS_CTE}
+            INSERT INTO payroll_results
+            SELECT r.egn, {LEGACY_SALARIES_YEAR}, m.idx, r.tzpb_rate, r.has_telk,
+                   {", ".join(f"r.{name}" for name in RESULT_COLUMNS)}, r.vacation_base_source
+            FROM legacy_payroll_results r JOIN months m ON m.name = r.month
+        ''')
+        _check_legacy_copy(conn, 'legacy_payroll_results')
+    if _table_exists(conn, 'legacy_payroll_dirty'):
+        conn.execute(f'''
+            WITH {MONTHS_CTE}
+            INSERT INTO payroll_dirty (egn, year, month, version)
+            SELECT d.egn, {LEGACY_SALARIES_YEAR}, m.idx, d.version
+            FROM legacy_payroll_dirty d JOIN months m ON m.name = d.month
+        ''')
+        _check_legacy_copy(conn, 'legacy_payroll_dirty')
+    # Тригерите и индексите на старите таблици се изтриват заедно с тях
+    for table in ('salaries', 'legacy_payroll_results', 'legacy_payroll_dirty'):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+# 2: сумите по месеци за таблото, попълнени от вече изчислените резултати
+def _migrate_payroll_summary(conn):
+    columns = ',\n'.join(f'            {name} INTEGER NOT NULL DEFAULT 0' for name in SUMMARY_COLUMNS)
+    conn.execute(f'''
+        CREATE TABLE payroll_summary (
+            year INTEGER,
+            month INTEGER,
+{columns},
+            PRIMARY KEY (year, month)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        INSERT INTO payroll_summary (year, month, {", ".join(SUMMARY_COLUMNS)})
+        SELECT r.year, r.month, {", ".join(f"SUM({value})" for value in _summary_values('r'))}
+        FROM payroll_results r
+        GROUP BY r.year, r.month
+    ''')
+
+    # Празен месец (след изтриване на всички резултати) се премахва
+    conn.execute(f'''
+        CREATE TRIGGER trg_payroll_results_summary_insert AFTER INSERT ON payroll_results
+        BEGIN
+            {_summary_upsert_sql('NEW')}
+        END
+    ''')
+    # Преизчислението обновява записа на място - тогава се добавя само разликата в една заявка
+    delta = [f'{new} - {old}' for new, old in zip(_summary_values('NEW'), _summary_values('OLD'))]
+    conn.execute(f'''
+        CREATE TRIGGER trg_payroll_results_summary_update AFTER UPDATE ON payroll_results
+        WHEN NEW.year = OLD.year AND NEW.month = OLD.month
+        BEGIN
+            UPDATE payroll_summary SET {", ".join(f"{name} = {name} + {value}" for name, value in zip(SUMMARY_COLUMNS, delta))}
+            WHERE year = NEW.year AND month = NEW.month;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_payroll_results_summary_move AFTER UPDATE ON payroll_results
+        WHEN NEW.year <> OLD.year OR NEW.month <> OLD.month
+        BEGIN
+            {_summary_upsert_sql('OLD', '-')}
+            {_summary_upsert_sql('NEW')}
+            DELETE FROM payroll_summary WHERE year = OLD.year AND month = OLD.month AND records = 0;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_payroll_results_summary_delete AFTER DELETE ON payroll_results
+        BEGIN
+            {_summary_upsert_sql('OLD', '-')}
+            DELETE FROM payroll_summary WHERE year = OLD.year AND month = OLD.month AND records = 0;
+        END
+    ''')
+
+
+# 3: журнал на промените. Започва със сегашните записи като вмъкнати, така че четенето от seq = 0
+# дава пълното състояние, а всичко след това - само разликите.
+def _migrate_change_journal(conn):
+    # AUTOINCREMENT: номерата не се използват повторно, дори ако последните редове се изтрият
+    conn.execute(f'''
+        CREATE TABLE salary_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL CHECK (operation IN ({", ".join(f"'{name}'" for name in CHANGE_OPERATIONS)})),
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+            egn TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            full_name TEXT,
+            gross_salary_base REAL,
+            supko_rate REAL,
+            years_experience INTEGER,
+            days_vacation INTEGER,
+            days_sick INTEGER,
+            days_absence INTEGER,
+            days_unpaid INTEGER,
+            sick_leave_count INTEGER
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO salary_changes (operation, egn, year, month, full_name, {", ".join(RECORD_COLUMNS)})
+        SELECT 'insert', r.egn, r.year, r.month, e.full_name, {", ".join(f"r.{name}" for name in RECORD_COLUMNS)}
+        FROM salary_records r JOIN employees e ON e.egn = r.egn
+        ORDER BY r.egn, r.year, r.month
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER trg_salary_records_journal_insert AFTER INSERT ON salary_records
+        BEGIN
+            {_journal_insert_sql('insert', 'NEW')}
+        END
+    ''')
+    # Запис със същите стойности (напр. повторен импорт на същия табел) не е промяна
+    changed = ' OR '.join(f'NEW.{name} IS NOT OLD.{name}' for name in RECORD_COLUMNS)
+    conn.execute(f'''
+        CREATE TRIGGER trg_salary_records_journal_update AFTER UPDATE ON salary_records
+        WHEN NEW.egn = OLD.egn AND NEW.year = OLD.year AND NEW.month = OLD.month AND ({changed})
+        BEGIN
+            {_journal_insert_sql('update', 'NEW')}
+        END
+    ''')
+    # Смяна на ключа се вижда отвън като изтриване на стария и вмъкване на новия запис
+    conn.execute(f'''
+        CREATE TRIGGER trg_salary_records_journal_move AFTER UPDATE ON salary_records
+        WHEN NEW.egn <> OLD.egn OR NEW.year <> OLD.year OR NEW.month <> OLD.month
+        BEGIN
+            {_journal_insert_sql('delete', 'OLD')}
+            {_journal_insert_sql('insert', 'NEW')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_salary_records_journal_delete AFTER DELETE ON salary_records
+        BEGIN
+            {_journal_insert_sql('delete', 'OLD')}
+        END
+    ''')
+    # Името е част от всеки месечен запис, така че смяната му променя всички записи на служителя
+    conn.execute(f'''
+        CREATE TRIGGER trg_employees_journal_rename AFTER UPDATE OF full_name ON employees
+        WHEN NEW.full_name IS NOT OLD.full_name
+        BEGIN
+            INSERT INTO salary_changes (operation, egn, year, month, full_name, {", ".join(RECORD_COLUMNS)})
+            SELECT 'update', r.egn, r.year, r.month, NEW.full_name, {", ".join(f"r.{name}" for name in RECORD_COLUMNS)}
+            FROM salary_records r
+            WHERE r.egn = NEW.egn
+            ORDER BY r.year, r.month;
+        END
+    ''')
+
+
+MIGRATIONS = [
+    _migrate_normalized_schema,
+    _migrate_payroll_summary,
+    _migrate_change_journal,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Довежда базата до последната версия на схемата. При актуална база е само едно четене на user_version.
+@perf.timed('db.create_db')
+def create_db():
+    pool = get_pool()
+    with pool.connection() as conn:
+        if schema_version(conn) >= len(MIGRATIONS):
+            return
+    with pool.transaction() as conn:
+        # Проверява се отново в транзакцията - друг процес може да е мигрирал междувременно
+        for number in range(schema_version(conn), len(MIGRATIONS)):
+            MIGRATIONS[number](conn)
+            conn.execute(f"PRAGMA user_version = {number + 1}")
+
+
+# --- Записи ---
+
+# Всички функции по-долу работят с една година (year); месецът е името му, както навсякъде в интерфейса
+
+def mark_dirty(conn, rows, year=DEFAULT_YEAR):
+    conn.executemany(MARK_DIRTY_SQL, [{'egn': egn, 'year': year, 'month': month_index(month)}
+                                      for egn, month in rows])
+
+
+# Записва или обновява редове във вида на SALARY_COLUMNS (служителя и месечния запис)
+def upsert_salaries(conn, rows, year=DEFAULT_YEAR):
+    rows = list(rows)
+    conn.executemany(UPSERT_EMPLOYEE_SQL, {row[0]: row[1] for row in rows}.items())
+    conn.executemany(UPSERT_RECORD_SQL, [(row[0], year, month_index(row[2])) + tuple(row[3:]) for row in rows])
+
+
+@perf.timed('db.add_data')
+def add_data(egn, full_name, month, gross_salary_base, supko_rate, years_experience, days_vacation, days_sick,
+             days_absence, days_unpaid, sick_leave_count, year=DEFAULT_YEAR):
+    def operation(conn):
+        upsert_salaries(conn, [(
+            egn, full_name, month, gross_salary_base, supko_rate, years_experience, days_vacation, days_sick,
+            days_absence, days_unpaid, sick_leave_count)], year)
+        mark_dirty(conn, [(egn, month)], year)
+    write(operation)
+
+
+@perf.timed('db.read_data')
+def read_data(year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_SALARIES_SQL + ' WHERE r.year = ? ORDER BY r.egn, r.month', (year,)).fetchall()
+
+
+def _prefix_range(column, prefix, params):
+    # Сравнение по диапазон вместо LIKE, за да се използва индексът
+    name = column.split('.')[-1]
+    params[f'{name}_from'] = prefix
+    params[f'{name}_to'] = prefix + '\U0010ffff'
+    return f'{column} >= :{name}_from AND {column} < :{name}_to'
+
+
+# Една страница от записите, подредени по ЕГН и месец, с филтриране в SQL.
+# after е ключът (egn, номер на месеца) на последния ред от предходната страница.
+@perf.timed('db.read_page')
+def read_page(egn_prefix=None, name_prefix=None, month=None, after=None, limit=PAGE_SIZE, year=DEFAULT_YEAR):
+    conditions, params = ['r.year = :year'], {'year': year, 'limit': limit}
+    if egn_prefix:
+        conditions.append(_prefix_range('r.egn', egn_prefix, params))
+    if name_prefix:
+        conditions.append(_prefix_range('e.full_name', name_prefix, params))
+    if month:
+        conditions.append('r.month = :month')
+        params['month'] = month_index(month)
+    if after is not None:
+        conditions.append('(r.egn, r.month) > (:after_egn, :after_month)')
+        params['after_egn'], params['after_month'] = after
+
+    with get_pool().connection() as conn:
+        return conn.execute(f'''
+            {SELECT_SALARIES_SQL}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY r.egn, r.month
+            LIMIT :limit
+        ''', params).fetchall()
+
+
+def page_cursor(row):
+    return row[0], month_index(row[2])
+
+
+def get_history_version(egn):
+    with get_pool().connection() as conn:
+        row = conn.execute('SELECT version FROM history_versions WHERE egn = ?', (egn,)).fetchone()
+    return row[0] if row else 0
+
+
+@perf.timed('db.get_record')
+def get_record(egn, month, year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        row = conn.execute(SELECT_SALARIES_SQL + ' WHERE r.egn = ? AND r.year = ? AND r.month = ?',
+                           (egn, year, month_index(month))).fetchone()
+    return dict(zip(SALARY_COLUMNS, row)) if row else None
+
+
+# ЕГН на служителите със записи за годината, по ред; after и limit дават следващата порция при обхождане на части
+def read_egns(after=None, limit=None, year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        return [row[0] for row in conn.execute('''
+            SELECT e.egn FROM employees e
+            WHERE e.egn > ? AND EXISTS (SELECT 1 FROM salary_records r WHERE r.egn = e.egn AND r.year = ?)
+            ORDER BY e.egn LIMIT ?
+        ''', ('' if after is None else after, year, -1 if limit is None else limit))]
+
+
+# Записите за месеца, подредени по ЕГН; с after и limit - следващите limit записа след ЕГН after
+def read_month_data(month, year=DEFAULT_YEAR, after=None, limit=None):
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_SALARIES_SQL + '''
+            WHERE r.year = ? AND r.month = ? AND r.egn > ?
+            ORDER BY r.egn LIMIT ?
+        ''', (year, month_index(month), '' if after is None else after, -1 if limit is None else limit)).fetchall()
+
+
+@perf.timed('db.update_data')
+def update_data(egn, month, new_gross_salary_base, new_supko_rate, new_years_experience, new_days_vacation,
+                new_days_sick, new_days_absence, new_days_unpaid, new_sick_leave_count, year=DEFAULT_YEAR):
+    def operation(conn):
+        conn.execute('''
+            UPDATE salary_records SET
+            gross_salary_base = ?,
+            supko_rate = ?,
+            years_experience = ?,
+            days_vacation = ?,
+            days_sick = ?,
+            days_absence = ?,
+            days_unpaid = ?,
+            sick_leave_count = ?
+            WHERE egn = ? AND year = ? AND month = ?
+        ''', (
+            new_gross_salary_base, new_supko_rate, new_years_experience, new_days_vacation, new_days_sick,
+            new_days_absence, new_days_unpaid, new_sick_leave_count, egn, year, month_index(month)))
+        mark_dirty(conn, [(egn, month)], year)
+    write(operation)
+
+
+@perf.timed('db.delete_data')
+def delete_data(egn, month, year=DEFAULT_YEAR):
+    def operation(conn):
+        conn.execute('DELETE FROM salary_records WHERE egn = ? AND year = ? AND month = ?',
+                     (egn, year, month_index(month)))
+        mark_dirty(conn, [(egn, month)], year)
+    write(operation)
+
+
+# Всички промени от таблицата в интерфейса в една транзакция: първо изтриванията ((egn, month)),
+# после записите във вида на SALARY_COLUMNS - така ред с нов ЕГН или месец се премества
+@perf.timed('db.apply_changes')
+def apply_changes(upserts=(), deletes=(), year=DEFAULT_YEAR):
+    upserts, deletes = list(upserts), list(deletes)
+
+    def operation(conn):
+        conn.executemany('DELETE FROM salary_records WHERE egn = ? AND year = ? AND month = ?',
+                         [(egn, year, month_index(month)) for egn, month in deletes])
+        upsert_salaries(conn, upserts, year)
+        mark_dirty(conn, deletes + [(row[0], row[2]) for row in upserts], year)
+    write(operation)
+
+
+# Последният месец с 10+ отработени дни преди current_month, ако трябва - и от предходна година
+@perf.timed('db.get_previous_month_data')
+def get_previous_month_data(egn, current_month, year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        result = conn.execute(QUALIFYING_MONTHS_SQL + ' AND r.egn = :egn ORDER BY r.year DESC, r.month DESC LIMIT 1',
+                              {'year': year, 'month': month_index(current_month), 'egn': egn}).fetchone()
+
+    if result:
+        _, _, _, gross_salary_base, supko_rate, years_experience, total_working_days_prev = result
+        return gross_salary_base, supko_rate, years_experience, total_working_days_prev
+    return None, None, None, None
+
+
+# Последният месец с 10+ отработени дни преди current_month за всички ЕГН (или само за egns) с една заявка.
+# При MAX() SQLite връща останалите колони от реда с максималната стойност.
+@perf.timed('db.get_previous_month_data_all')
+def get_previous_month_data_all(current_month, year=DEFAULT_YEAR, egns=None):
+    params = {'year': year, 'month': month_index(current_month)}
+    condition = ''
+    if egns is not None:
+        condition = ' AND r.egn IN (SELECT value FROM json_each(:egns))'
+        params['egns'] = json.dumps(sorted(egns))
+    with get_pool().connection() as conn:
+        data = conn.execute(f'''
+            SELECT egn, gross_salary_base, supko_rate, years_experience, working_days, MAX(year * 12 + month)
+            FROM ({QUALIFYING_MONTHS_SQL}{condition})
+            GROUP BY egn
+        ''', params).fetchall()
+    return {egn: tuple(values) for egn, *values, _ in data}
+
+
+# --- Съхранени резултати ---
+
+# Историята на дадени служители за годината (за изчисляване на базата за отпуска в паметта)
+@perf.timed('db.read_employee_history')
+def read_employee_history(egns, year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        return conn.execute(SELECT_SALARIES_SQL + '''
+            WHERE r.egn IN (SELECT value FROM json_each(?)) AND r.year = ?
+            ORDER BY r.egn, r.month
+        ''', (json.dumps(sorted(egns)), year)).fetchall()
+
+
+# Записи за преизчисляване: маркираните, тези без резултат и изчислените с други ТЗПБ/ТЕЛК.
+# Връща (egn, month, version) - version е None за записите, които не са в payroll_dirty.
+def read_stale_results(tzpb_rate, telk_egns=(), year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        return conn.execute(f'''
+            SELECT egn, {_month_name_sql('month')}, version FROM payroll_dirty WHERE year = :year
+            UNION
+            SELECT s.egn, {_month_name_sql('s.month')}, NULL FROM salary_records s
+            LEFT JOIN payroll_results r ON r.egn = s.egn AND r.year = s.year AND r.month = s.month
+            WHERE s.year = :year
+              AND (r.egn IS NULL
+                   OR r.tzpb_rate != :tzpb_rate
+                   OR r.has_telk != (r.egn IN (SELECT value FROM json_each(:telk_egns))))
+        ''', {'year': year, 'tzpb_rate': tzpb_rate, 'telk_egns': json.dumps(list(telk_egns))}).fetchall()
+
+
+# ЕГН на служителите с ТЕЛК според съхранените резултати за годината (подредени)
+def read_telk_egns(year=DEFAULT_YEAR):
+    with get_pool().connection() as conn:
+        return [row[0] for row in conn.execute(
+            'SELECT DISTINCT egn FROM payroll_results WHERE year = ? AND has_telk ORDER BY egn', (year,))]
+
+
+# Записва преизчислените резултати и изчиства маркировките, освен ако записът е маркиран отново междувременно.
+# ON CONFLICT DO UPDATE вместо INSERT OR REPLACE - при REPLACE тригерите за изтриване (и сумите) не се изпълняват.
+@perf.timed('db.save_results')
+def save_results(results, stale, year=DEFAULT_YEAR):
+    columns = ['egn', 'year', 'month', 'tzpb_rate', 'has_telk'] + RESULT_COLUMNS + ['vacation_base_source']
+    # results е PayrollResults - колоните се четат поотделно, ставките се разгъват едва тук
+    values = {name: results.column(name).tolist() for name in columns if name not in ('year', 'month')}
+    values['year'] = itertools.repeat(year)
+    values['month'] = [MONTH_NUMBERS[month] for month in results.column('month').tolist()]
+    stale = [(egn, year, month_index(month), version) for egn, month, version in stale]
+
+    def operation(conn):
+        conn.executemany(f'''
+            INSERT INTO payroll_results ({", ".join(columns)})
+            VALUES ({", ".join("?" for _ in columns)})
+            ON CONFLICT (egn, year, month) DO UPDATE SET
+                {", ".join(f"{name} = excluded.{name}" for name in columns[3:])}
+        ''', zip(*[values[name] for name in columns]))
+        # Резултати за изтрити записи
+        conn.executemany('''
+            DELETE FROM payroll_results
+            WHERE egn = :egn AND year = :year AND month = :month AND NOT EXISTS (
+                SELECT 1 FROM salary_records s WHERE s.egn = :egn AND s.year = :year AND s.month = :month)
+        ''', [{'egn': egn, 'year': year, 'month': month} for egn, year, month, _ in stale])
+        conn.executemany('DELETE FROM payroll_dirty WHERE egn = ? AND year = ? AND month = ? AND version = ?',
+                         [row for row in stale if row[3] is not None])
+    write(operation)
+
+
+def read_results(month=None, year=DEFAULT_YEAR):
+    query = f'''
+        SELECT egn, {_month_name_sql('month')}, tzpb_rate, has_telk, {", ".join(RESULT_COLUMNS)},
+               vacation_base_source
+        FROM payroll_results WHERE year = ?
+    '''
+    with get_pool().connection() as conn:
+        if month is None:
+            return conn.execute(query + ' ORDER BY egn, month', (year,)).fetchall()
+        return conn.execute(query + ' AND month = ? ORDER BY egn', (year, month_index(month))).fetchall()
+
+
+# --- Обобщение за таблото ---
+
+# Сумите по месеци (за year или за всички години): година, месец, после SUMMARY_COLUMNS със сумите в лева
+def read_summary(year=None):
+    values = ', '.join(f'{name} / 100.0' if name in SUMMARY_MONEY_COLUMNS else name for name in SUMMARY_COLUMNS)
+    query = f'SELECT year, {_month_name_sql("month")}, {values} FROM payroll_summary'
+    with get_pool().connection() as conn:
+        if year is None:
+            return conn.execute(query + ' ORDER BY year, month').fetchall()
+        return conn.execute(query + ' WHERE year = ? ORDER BY month', (year,)).fetchall()
+
+
+# Сумите по години: година, после SUMMARY_COLUMNS със сумите в лева
+def read_yearly_summary():
+    values = ', '.join(f'SUM({name}) / 100.0' if name in SUMMARY_MONEY_COLUMNS else f'SUM({name})'
+                       for name in SUMMARY_COLUMNS)
+    with get_pool().connection() as conn:
+        return conn.execute(f'SELECT year, {values} FROM payroll_summary GROUP BY year ORDER BY year').fetchall()
+
+
+# --- Журнал на промените ---
+
+# Промените с номер след after по ред във вида на CHANGE_COLUMNS (месецът е името му), на порции до chunk_size.
+# Всяка порция е отделна заявка, така че връзката не се държи, докато извикващият записва.
+def iter_changes(after=0, chunk_size=CHANGES_CHUNK_SIZE):
+    query = f'''
+        SELECT seq, operation, changed_at, egn, year, {_month_name_sql('month')}, full_name,
+               {", ".join(RECORD_COLUMNS)}
+        FROM salary_changes WHERE seq > ? ORDER BY seq LIMIT ?
+    '''
+    while True:
+        with get_pool().connection() as conn:
+            rows = conn.execute(query, (after, chunk_size)).fetchall()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+# Номерът на последната промяна (0 при празен журнал) - курсорът, от който да продължи следващото четене
+def last_change():
+    with get_pool().connection() as conn:
+        return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM salary_changes').fetchone()[0]
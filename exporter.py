@@ -0,0 +1,169 @@
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+import db
+import payroll
+from payroll import DEFAULT_TZPB_RATE, DEFAULT_YEAR, MONEY_FLOAT, MONEY_STOTINKI, RESULT_COLUMNS
+
+EXPORT_FORMATS = ['csv', 'parquet', 'xlsx']
+# Формати за журнала на промените - по един ред за промяна, без да се чака краят на файла
+CHANGE_FORMATS = ['csv', 'jsonl']
+
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Брой служители, изчислявани и записвани наведнъж
+CHUNK_SIZE = 1000
+
+# Колоните във ведомостта - идентификация на записа и всички изчислени стойности
+REGISTER_COLUMNS = ['egn', 'full_name', 'month'] + RESULT_COLUMNS + ['vacation_base_source']
+
+# Най-много редове в един лист на Excel (без заглавието)
+XLSX_MAX_ROWS = 1_048_575
+
+
+def _chunks(month, tzpb_rate, telk_egns, money, chunk_size, year):
+    for results in payroll.iter_results(month, tzpb_rate, telk_egns, money, chunk_size, year):
+        results = results.to_frame()
+        if money == MONEY_STOTINKI:
+            results = payroll.stotinki_to_levs(results)
+        yield results[REGISTER_COLUMNS]
+
+
+# --- Запис по формати ---
+
+def _write_csv(chunks, target, columns=REGISTER_COLUMNS):
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as f:
+            return _write_csv(chunks, f, columns)
+    stream = io.TextIOWrapper(target, encoding='utf-8-sig', newline='', write_through=True)
+    try:
+        stream.write(','.join(columns) + '\n')
+        rows = 0
+        for chunk in chunks:
+            chunk.to_csv(stream, header=False, index=False)
+            rows += len(chunk)
+        return rows
+    finally:
+        # Потокът е на извикващия - отделяме обвивката, без да го затваряме
+        stream.detach()
+
+
+def _write_parquet(chunks, target):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("За експорт в Parquet е нужен пакетът pyarrow (pip install pyarrow).")
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+        if writer is None:
+            schema = pa.schema([(name, pa.string() if name in ('egn', 'full_name', 'month', 'vacation_base_source')
+                                 else pa.float64()) for name in REGISTER_COLUMNS])
+            writer = pq.ParquetWriter(target, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _write_xlsx(chunks, target):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("За експорт в XLSX е нужен пакетът openpyxl (pip install openpyxl).")
+
+    # В режим write_only редовете се записват във временен файл, а не се държат в паметта
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, rows = None, XLSX_MAX_ROWS, 0
+    for chunk in chunks:
+        for values in chunk.itertuples(index=False, name=None):
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Ведомост {len(workbook.worksheets) + 1}")
+                sheet.append(REGISTER_COLUMNS)
+                sheet_rows = 0
+            sheet.append(values)
+            sheet_rows += 1
+        rows += len(chunk)
+    if sheet is None:
+        workbook.create_sheet("Ведомост 1").append(REGISTER_COLUMNS)
+    workbook.save(target)
+    return rows
+
+
+# JSON Lines: един JSON обект на ред, с имената на колоните като ключове
+def _write_jsonl(chunks, target, columns):
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as f:
+            return _write_jsonl(chunks, f, columns)
+    stream = io.TextIOWrapper(target, encoding='utf-8', newline='\n', write_through=True)
+    try:
+        rows = 0
+        for chunk in chunks:
+            chunk[columns].to_json(stream, orient='records', lines=True, force_ascii=False)
+            rows += len(chunk)
+        return rows
+    finally:
+        stream.detach()
+
+
+_WRITERS = {'csv': _write_csv, 'parquet': _write_parquet, 'xlsx': _write_xlsx}
+_CHANGE_WRITERS = {'csv': _write_csv, 'jsonl': _write_jsonl}
+
+
+def _file_format(target, file_format):
+    if file_format is None:
+        name = target if isinstance(target, (str, os.PathLike)) else getattr(target, 'name', '')
+        file_format = os.path.splitext(str(name))[1].lower().lstrip('.') or 'csv'
+    return file_format
+
+
+# Записва ведомостта за месец от year (или за цялата година при month=None) в target - път или двоичен поток.
+# Служителите се изчисляват на порции от chunk_size, така че паметта не зависи от броя на редовете.
+# Връща броя на записаните редове.
+def export_register(target, file_format=None, month=None, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(),
+                    money=MONEY_FLOAT, chunk_size=CHUNK_SIZE, year=DEFAULT_YEAR):
+    file_format = _file_format(target, file_format)
+    if file_format not in _WRITERS:
+        raise ValueError(f"Непознат формат: {file_format!r}")
+    return _WRITERS[file_format](_chunks(month, tzpb_rate, set(telk_egns), money, chunk_size, year), target)
+
+
+# Ведомостта като байтове - за бутона за изтегляне в приложението. Файлът се подготвя във временен файл
+# на диска, а не в паметта, и се прочита наведнъж след края на записа.
+def register_bytes(file_format, month=None, tzpb_rate=DEFAULT_TZPB_RATE, year=DEFAULT_YEAR):
+    with tempfile.TemporaryFile() as target:
+        export_register(target, file_format, month, tzpb_rate, year=year)
+        target.seek(0)
+        return target.read()
+
+
+# Записва промените от журнала след номер after в target - път или двоичен поток, на порции от chunk_size.
+# Връща (брой промени, номер на последната) - номерът е after за следващото извикване.
+def export_changes(target, file_format=None, after=0, chunk_size=db.CHANGES_CHUNK_SIZE):
+    file_format = _file_format(target, file_format)
+    if file_format not in _CHANGE_WRITERS:
+        raise ValueError(f"Непознат формат: {file_format!r}")
+    cursor = [after]
+
+    def chunks():
+        for rows in db.iter_changes(after, chunk_size):
+            cursor[0] = rows[-1][0]
+            yield pd.DataFrame(rows, columns=db.CHANGE_COLUMNS)
+
+    rows = _CHANGE_WRITERS[file_format](chunks(), target, db.CHANGE_COLUMNS)
+    return rows, cursor[0]
@@ -0,0 +1,231 @@
+import csv
+import io
+import os
+import sqlite3
+
+import db
+import workdays
+from payroll import (DEFAULT_YEAR, GROSS_SALARY_MIN, GROSS_SALARY_MAX, MAX_YEARS_EXPERIENCE,
+                     SUPKO_RATE_OPTIONS)
+
+# Брой редове, записвани в една транзакция
+CHUNK_SIZE = 5000
+
+# Заглавията на колоните могат да са както имената в базата, така и тези от интерфейса
+_HEADER_ALIASES = {name: name for name in db.SALARY_COLUMNS}
+_HEADER_ALIASES.update({label: name for name, label in db.SALARY_COLUMN_LABELS.items()})
+
+_DAY_COLUMNS = ['days_vacation', 'days_sick', 'days_absence', 'days_unpaid']
+
+
+# --- Четене на файла ред по ред ---
+
+def _read_csv_rows(stream):
+    if isinstance(stream, (str, os.PathLike)):
+        with open(stream, newline='', encoding='utf-8-sig') as f:
+            yield from _read_csv_rows(f)
+        return
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    # Файловете от български Excel често са разделени с ";"
+    first_line = stream.readline()
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    yield from csv.reader([first_line], delimiter=delimiter)
+    yield from csv.reader(stream, delimiter=delimiter)
+
+
+def _read_xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("За импорт от XLSX е нужен пакетът openpyxl (pip install openpyxl).")
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def read_timesheet(source, file_format=None):
+    if file_format is None:
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+        file_format = 'xlsx' if str(name).lower().endswith('.xlsx') else 'csv'
+
+    rows = _read_xlsx_rows(source) if file_format == 'xlsx' else _read_csv_rows(source)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = [_HEADER_ALIASES.get(str(title).strip()) for title in header]
+    missing = [name for name in db.SALARY_COLUMNS if name not in columns and name != 'sick_leave_count']
+    if missing:
+        raise ValueError("Липсващи колони: " + ", ".join(db.SALARY_COLUMN_LABELS[name] for name in missing))
+
+    # Номерата на редовете са като във файла (заглавието е ред 1)
+    for line_number, values in enumerate(rows, start=2):
+        if not any(str(value).strip() for value in values):
+            continue
+        yield line_number, {name: value for name, value in zip(columns, values) if name}
+
+
+# --- Валидиране ---
+
+def _to_number(value, cast):
+    if isinstance(value, str):
+        value = value.strip()
+        if ',' in value and '.' not in value:
+            value = value.replace(',', '.')
+    number = float(value)
+    if cast is int:
+        if not number.is_integer():
+            raise ValueError
+        return int(number)
+    return number
+
+
+def _to_egn(value):
+    # Excel губи водещите нули на ЕГН, записани като число
+    if isinstance(value, (int, float)):
+        return str(int(value)).zfill(10)
+    return str(value).strip()
+
+
+# Проверява един ред със същите ограничения като формата за въвеждане (работните дни са за year).
+# Връща кортеж за db.upsert_salaries или хвърля ValueError с описание на грешката.
+def validate_record(record, year=DEFAULT_YEAR):
+    egn = _to_egn(record.get('egn', ''))
+    full_name = str(record.get('full_name', '')).strip()
+    month = str(record.get('month', '')).strip()
+    if not egn or len(egn) > 10:
+        raise ValueError("ЕГН трябва да е между 1 и 10 символа.")
+    if not full_name:
+        raise ValueError("Липсва име на служителя.")
+    if month not in workdays.MONTH_NUMBERS:
+        raise ValueError(f"Непознат месец: {month!r}.")
+
+    try:
+        gross_salary_base = _to_number(record.get('gross_salary_base'), float)
+        supko_rate = _to_number(record.get('supko_rate'), float)
+        years_experience = _to_number(record.get('years_experience'), int)
+        days = {name: _to_number(record.get(name) or 0, int) for name in _DAY_COLUMNS}
+        sick_leave_count = record.get('sick_leave_count')
+        sick_leave_count = 1 if sick_leave_count in (None, '') else _to_number(sick_leave_count, int)
+    except (TypeError, ValueError):
+        raise ValueError("Невалидна числова стойност.")
+
+    if not GROSS_SALARY_MIN <= gross_salary_base <= GROSS_SALARY_MAX:
+        raise ValueError(f"Брутната заплата трябва да е между {GROSS_SALARY_MIN:.0f} и {GROSS_SALARY_MAX:.0f} лв.")
+    if supko_rate not in SUPKO_RATE_OPTIONS:
+        raise ValueError(f"Непознат процент СУПКО: {supko_rate}.")
+    if not 0 <= years_experience <= MAX_YEARS_EXPERIENCE:
+        raise ValueError(f"Годините стаж трябва да са между 0 и {MAX_YEARS_EXPERIENCE}.")
+
+    # Дните се проверяват последователно, както в полетата на формата
+    remaining = workdays.working_days(year, workdays.MONTH_NUMBERS[month])
+    for name in _DAY_COLUMNS:
+        if not 0 <= days[name] <= remaining:
+            raise ValueError(f"{db.SALARY_COLUMN_LABELS[name]}: допустимо е от 0 до {remaining}.")
+        remaining -= days[name]
+    max_sick_leave_count = days['days_sick'] if days['days_sick'] > 0 else 1
+    if not 0 <= sick_leave_count <= max_sick_leave_count:
+        raise ValueError(f"Броят болнични листа трябва да е между 0 и {max_sick_leave_count}.")
+
+    return (egn, full_name, month, gross_salary_base, supko_rate, years_experience, days['days_vacation'],
+            days['days_sick'], days['days_absence'], days['days_unpaid'], sick_leave_count)
+
+
+# --- Редакции от таблицата в интерфейса ---
+
+# Разликата между заредените редове (във вида на SALARY_COLUMNS) и редакциите от st.data_editor
+# ({'edited_rows': {позиция: {колона: стойност}}, 'added_rows': [...], 'deleted_rows': [...]}, колоните са
+# заглавията от интерфейса). Връща (upserts, deletes, errors): редове за db.upsert_salaries, (egn, month) за
+# изтриване и (ред, грешка). Ред с променени ЕГН или месец премества записа - старият се изтрива.
+def table_changes(rows, edits, year=DEFAULT_YEAR):
+    deleted = {int(position) for position in edits.get('deleted_rows', [])}
+    deletes = [(rows[position][0], rows[position][2]) for position in sorted(deleted)]
+    changed = [(f"{rows[int(position)][0]}, {rows[int(position)][2]}", rows[int(position)], values)
+               for position, values in edits.get('edited_rows', {}).items() if int(position) not in deleted]
+    changed += [(f"Нов ред {number}", None, values) for number, values in enumerate(edits.get('added_rows', []), 1)]
+
+    upserts, errors, keys = [], [], set()
+    for label, original, values in changed:
+        record = dict(zip(db.SALARY_COLUMNS, original or ()))
+        record.update({_HEADER_ALIASES.get(column, column): value for column, value in values.items()})
+        try:
+            row = validate_record({name: '' if value is None else value for name, value in record.items()}, year)
+        except ValueError as e:
+            errors.append((label, str(e)))
+            continue
+        if (row[0], row[2]) in keys:
+            errors.append((label, "Повече от един ред за същия ЕГН и месец."))
+            continue
+        keys.add((row[0], row[2]))
+        if original is not None and row == tuple(original):
+            continue
+        if original is None or (row[0], row[2]) != (original[0], original[2]):
+            # Нов ред или преместен запис не бива да презапише друг запис, който не е на страницата
+            if (row[0], row[2]) not in deletes and db.get_record(row[0], row[2], year) is not None:
+                errors.append((label, f"Вече има запис за ЕГН {row[0]} за {row[2]}."))
+                continue
+            if original is not None:
+                deletes.append((original[0], original[2]))
+        upserts.append(row)
+    return upserts, deletes, errors
+
+
+# --- Запис ---
+
+def _write_chunk(chunk, errors, year):
+    def write_all(conn):
+        db.upsert_salaries(conn, [values for _, values in chunk], year)
+        db.mark_dirty(conn, [(values[0], values[2]) for _, values in chunk], year)
+        return len(chunk)
+
+    try:
+        return db.write(write_all)
+    except sqlite3.Error:
+        pass
+
+    # Част от пакета е отхвърлена - записваме редовете поотделно, за да открием грешните
+    # Операцията може да се изпълни повторно, ако друга в същия пакет се провали - грешките се връщат, а не се добавят
+    def write_rows(conn):
+        written, row_errors = 0, []
+        for line_number, values in chunk:
+            conn.execute("SAVEPOINT import_row")
+            try:
+                db.upsert_salaries(conn, [values], year)
+                db.mark_dirty(conn, [(values[0], values[2])], year)
+                written += 1
+            except sqlite3.Error as e:
+                conn.execute("ROLLBACK TO import_row")
+                row_errors.append((line_number, str(e)))
+            conn.execute("RELEASE import_row")
+        return written, row_errors
+
+    written, row_errors = db.write(write_rows)
+    errors.extend(row_errors)
+    return written
+
+
+# Импортира месечен табел (CSV или XLSX) за годината year на пакети от chunk_size реда.
+# Грешните редове се пропускат и се връщат в 'errors' като (номер на ред, съобщение).
+def import_timesheet(source, file_format=None, chunk_size=CHUNK_SIZE, year=DEFAULT_YEAR):
+    report = {'rows': 0, 'imported': 0, 'errors': []}
+    chunk = []
+    for line_number, record in read_timesheet(source, file_format):
+        report['rows'] += 1
+        try:
+            chunk.append((line_number, validate_record(record, year)))
+        except ValueError as e:
+            report['errors'].append((line_number, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            report['imported'] += _write_chunk(chunk, report['errors'], year)
+            chunk = []
+    if chunk:
+        report['imported'] += _write_chunk(chunk, report['errors'], year)
+    report['errors'].sort()
+    return report
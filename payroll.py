@@ -0,0 +1,1404 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache
+from operator import itemgetter
+
+import numpy as np
+
+import perf
+import workdays
+from workdays import MONTHS, MONTH_NUMBERS
+
+BIRTH_BEFORE_1960 = "Преди 1960"
+BIRTH_AFTER_1960 = "След 1960"
+
+# Допустими стойности на входните данни (общи за формата и импорта)
+GROSS_SALARY_MIN = 1050.0
+GROSS_SALARY_MAX = 10000.0
+MAX_YEARS_EXPERIENCE = 50
+SUPKO_RATE_OPTIONS = [0.6, 0.7, 0.8, 0.9, 1.0]
+TZPB_RATE_OPTIONS = [0.4, 0.5, 0.7, 0.9, 1.1]
+
+# Осигурителни ставки според годината на раждане
+CONTRIBUTION_RATES = {
+    BIRTH_BEFORE_1960: {
+        'pension_employee': 0.0878,
+        'ozm_employee': 0.014,
+        'unemployment_employee': 0.004,
+        'dzpo_employee': 0.00,
+        'health_employee': 0.032,
+
+        'pension_employer': 0.1102,
+        'ozm_employer': 0.021,
+        'unemployment_employer': 0.006,
+        'dzpo_employer': 0.00,
+        'health_employer': 0.048,
+    },
+    BIRTH_AFTER_1960: {
+        'pension_employee': 0.0658,
+        'ozm_employee': 0.014,
+        'unemployment_employee': 0.004,
+        'dzpo_employee': 0.022,
+        'health_employee': 0.032,
+
+        'pension_employer': 0.0822,
+        'ozm_employer': 0.021,
+        'unemployment_employer': 0.006,
+        'dzpo_employer': 0.028,
+        'health_employer': 0.048,
+    },
+}
+
+
+# Осигурителни прагове, данъчна ставка, облекчение за ТЕЛК и осигурителни ставки по години
+YEAR_PARAMETERS = {
+    2025: {
+        'min_insurance_income': 1077,
+        'max_insurance_income': 4130,
+        'tax_rate': 0.10,
+        'telk_relief': 660,
+        'contribution_rates': CONTRIBUTION_RATES,
+    },
+    # Минималната заплата от 620,20 евро и максималният осигурителен доход от 2352 евро по бюджета за 2026,
+    # в лева по фиксирания курс 1,95583. Ставките и облекченията са приети без промяна спрямо 2025.
+    2026: {
+        'min_insurance_income': 1213.02,
+        'max_insurance_income': 4600,
+        'tax_rate': 0.10,
+        'telk_relief': 660,
+        'contribution_rates': CONTRIBUTION_RATES,
+    },
+}
+PAYROLL_YEARS = sorted(YEAR_PARAMETERS)
+
+# Годината на изчисление по подразбиране (и на записите отпреди въвеждането на годината)
+DEFAULT_YEAR = 2025
+
+_THRESHOLD_NAMES = ['min_insurance_income', 'max_insurance_income', 'tax_rate', 'telk_relief']
+
+
+def year_parameters(year):
+    if year not in YEAR_PARAMETERS:
+        raise ValueError(f"Няма ставки и прагове за година: {year}")
+    return YEAR_PARAMETERS[year]
+
+
+def contribution_rates(birth_year, year=DEFAULT_YEAR):
+    # Всичко различно от "Преди 1960" се третира като "След 1960"
+    rates = year_parameters(year)['contribution_rates']
+    if birth_year == BIRTH_BEFORE_1960:
+        return rates[BIRTH_BEFORE_1960]
+    return rates[BIRTH_AFTER_1960]
+
+
+# YEAR_PARAMETERS като масиви с ред за всяка година от първата до последната (и колона за всяко поколение
+# при ставките). Изгражда се веднъж; пакетното изчисление само избира редовете по индекс.
+@lru_cache(maxsize=None)
+def _parameter_table():
+    first, last = PAYROLL_YEARS[0], PAYROLL_YEARS[-1]
+    known = np.zeros(last - first + 1, dtype=bool)
+    table = {name: np.full(len(known), np.nan) for name in _THRESHOLD_NAMES}
+    rate_names = list(CONTRIBUTION_RATES[BIRTH_AFTER_1960])
+    table.update({name: np.full((len(known), 2), np.nan) for name in rate_names})
+    for year, parameters in YEAR_PARAMETERS.items():
+        known[year - first] = True
+        for name in _THRESHOLD_NAMES:
+            table[name][year - first] = parameters[name]
+        # Колона 0 - след 1960, колона 1 - преди 1960
+        for column, cohort in enumerate([BIRTH_AFTER_1960, BIRTH_BEFORE_1960]):
+            for name in rate_names:
+                table[name][year - first, column] = parameters['contribution_rates'][cohort][name]
+    return first, known, table
+
+
+# Праговете и ставките за всеки ред по масив от години и признак "роден преди 1960"
+def year_parameter_columns(year, before_1960):
+    first, known, table = _parameter_table()
+    idx = np.asarray(year, dtype=np.int64) - first
+    valid = (idx >= 0) & (idx < len(known))
+    valid[valid] = known[idx[valid]]
+    if not valid.all():
+        unknown = sorted(set(np.asarray(year)[~valid].tolist()))
+        raise ValueError(f"Няма ставки и прагове за година: {', '.join(map(str, unknown))}")
+    cohort = np.asarray(before_1960, dtype=np.intp)
+    return {name: values[idx] if values.ndim == 1 else values[idx, cohort] for name, values in table.items()}
+
+
+# --- Изчисление за един служител ---
+
+# Източник на среднодневната база за платения отпуск (връща се в 'vacation_base_source')
+VACATION_BASE_PREVIOUS_MONTH = 'previous_month'
+VACATION_BASE_CURRENT_MONTH = 'current_month'
+VACATION_BASE_NONE = 'none'
+
+# Режим на сумите: лева като float или цели стотинки (int64) със закръгляне на всяко перо
+MONEY_FLOAT = 'float'
+MONEY_STOTINKI = 'stotinki'
+
+
+@perf.timed('payroll.calculate')
+def calculate_net_salary_with_absences(gross_salary, tzpb_rate, birth_year, month, days_vacation=0, days_sick=0,
+                                       days_absence=0, days_unpaid=0, has_telk=False, years_experience=0,
+                                       supko_rate=0.0, egn=None, sick_leave_count=1, previous_month_data=None,
+                                       money=MONEY_FLOAT, year=DEFAULT_YEAR, hire_date=None, leave_date=None):
+    # Осигурителни прагове за годината
+    parameters = year_parameters(year)
+    min_insurance_income = parameters['min_insurance_income']
+    max_insurance_income = parameters['max_insurance_income']
+
+    # Доплащане за професионален опит
+    supko_amount = gross_salary * (supko_rate / 100) * years_experience
+    gross_salary_with_supko = gross_salary + supko_amount
+
+    # Общ брой работни дни за избрания месец
+    if month not in MONTH_NUMBERS:
+        raise ValueError(f"Непознат месец: {month}")
+    total_working_days = workdays.working_days(year, MONTH_NUMBERS[month])
+    # Работни дни от месеца, през които лицето е назначено (при постъпване или напускане в месеца)
+    employed_days = workdays.employed_working_days(year, MONTH_NUMBERS[month], hire_date, leave_date)
+
+    # Изчисляване на отработени дни
+    days_worked = employed_days - days_vacation - days_sick - days_absence - days_unpaid
+
+    # Данъчни ставки
+    tax_rate = parameters['tax_rate']
+
+    # Определяне на осигурителните ставки според годината на раждане
+    rates = contribution_rates(birth_year, year)
+    pension_employee = rates['pension_employee']
+    ozm_employee = rates['ozm_employee']
+    unemployment_employee = rates['unemployment_employee']
+    dzpo_employee = rates['dzpo_employee']
+    health_employee = rates['health_employee']
+
+    pension_employer = rates['pension_employer']
+    ozm_employer = rates['ozm_employer']
+    unemployment_employer = rates['unemployment_employer']
+    dzpo_employer = rates['dzpo_employer']
+    health_employer = rates['health_employer']
+
+    tzpb_employer = tzpb_rate / 100
+
+    # Проверка дали имаме достатъчно отработени дни в предходния месец
+    # (previous_month_data може да се подаде наготово, иначе се търси в базата по ЕГН)
+    if previous_month_data is None:
+        previous_month_data = (None, None, None, None)
+        if egn:
+            from db import get_previous_month_data
+            previous_month_data = get_previous_month_data(egn, month, year)
+    prev_gross_salary_base, prev_supko_rate, prev_years_experience, prev_total_working_days = previous_month_data
+
+    # В стотинки се смята през пакетното изчисление, за да са правилата за закръгляне на едно място
+    if money == MONEY_STOTINKI:
+        row = {
+            'gross_salary': [gross_salary], 'tzpb_rate': [tzpb_rate], 'birth_year': [birth_year], 'month': [month],
+            'days_vacation': [days_vacation], 'days_sick': [days_sick], 'days_absence': [days_absence],
+            'days_unpaid': [days_unpaid], 'has_telk': [has_telk], 'years_experience': [years_experience],
+            'supko_rate': [supko_rate], 'sick_leave_count': [sick_leave_count], 'year': [year],
+            'hire_date': [hire_date], 'leave_date': [leave_date],
+        }
+        for name, value in zip(BATCH_PREVIOUS_MONTH_COLUMNS, previous_month_data):
+            row[name] = [np.nan if value is None else value]
+        return PayrollResults.from_frame(calculate_net_salary_batch(row, MONEY_STOTINKI))[0]
+    if money != MONEY_FLOAT:
+        raise ValueError(f"Непознат режим на сумите: {money!r}")
+
+    if prev_gross_salary_base is not None:
+        prev_gross_with_supko = prev_gross_salary_base + (
+                prev_gross_salary_base * (prev_supko_rate / 100) * prev_years_experience)
+        daily_gross_salary_vacation = prev_gross_with_supko / prev_total_working_days
+        vacation_base_source = VACATION_BASE_PREVIOUS_MONTH
+    else:
+        if days_worked >= 10:
+            daily_gross_salary_vacation = gross_salary_with_supko / total_working_days
+            vacation_base_source = VACATION_BASE_CURRENT_MONTH
+        else:
+            daily_gross_salary_vacation = 0
+            vacation_base_source = VACATION_BASE_NONE
+
+    # Изчисляване на заплатата по пера
+    base_salary_part = (gross_salary_with_supko / total_working_days) * days_worked
+    vacation_salary_part = daily_gross_salary_vacation * days_vacation
+    sick_pay_part = 0
+    unpaid_absence_part = 0
+
+    gross_salary_worked = base_salary_part + vacation_salary_part
+
+    # Болничните се изчисляват по различен начин (70%)
+    # Първите 2 дни се плащат от работодателя за всеки отделен болничен, останалите от НОИ
+    daily_sick_pay = (gross_salary_with_supko / total_working_days) * 0.7
+    days_sick_employer = min(days_sick, 2 * sick_leave_count)
+    days_sick_nssi = max(0, days_sick - days_sick_employer)
+
+    sick_pay_employer = daily_sick_pay * days_sick_employer
+    sick_pay_nssi = daily_sick_pay * days_sick_nssi
+
+    # Осигурителен доход за здравни осигуровки върху болничните от НОИ (минималният осигурителен доход)
+    sick_leave_insurance_base = (min_insurance_income / total_working_days) * days_sick_nssi
+    health_insurance_sick_leave_employer = sick_leave_insurance_base * 0.048
+
+    # Изчисляване на здравната осигуровка за неплатен отпуск
+    health_insurance_unpaid_base = min_insurance_income / 2
+    health_insurance_unpaid_total = (health_insurance_unpaid_base / total_working_days) * days_unpaid * 0.08
+
+    # Общ брутен доход
+    total_gross_income = gross_salary_worked + sick_pay_employer
+
+    # Корекция на осигурителната основа
+    insurance_base_income = gross_salary_worked + sick_pay_employer
+    # При постъпване или напускане в месеца минималният доход е пропорционален на дните по назначение
+    min_insurance_base = min_insurance_income
+    if employed_days < total_working_days:
+        min_insurance_base = min_insurance_income * employed_days / total_working_days
+    insurance_base = max(min(insurance_base_income, max_insurance_income), min_insurance_base)
+
+    # Изчисляване на осигуровките за служител
+    pension_employee_val = insurance_base * pension_employee
+    ozm_employee_val = insurance_base * ozm_employee
+    unemployment_employee_val = insurance_base * unemployment_employee
+    dzpo_employee_val = insurance_base * dzpo_employee
+    health_employee_val = insurance_base * health_employee
+
+    # Общо осигуровки за служител
+    total_doo_employee = pension_employee_val + ozm_employee_val + unemployment_employee_val
+    total_insurance_employee = total_doo_employee + dzpo_employee_val + health_employee_val + health_insurance_unpaid_total
+
+    # Изчисляване на осигуровките за работодател
+    pension_employer_val = insurance_base * pension_employer
+    ozm_employer_val = insurance_base * ozm_employer
+    unemployment_employer_val = insurance_base * unemployment_employer
+    dzpo_employer_val = insurance_base * dzpo_employer
+    tzpb_val = insurance_base * tzpb_employer
+    health_employer_val = insurance_base * health_employer
+
+    # Общо осигуровки за работодател (включват и ЗО за болнични)
+    total_doo_employer = pension_employer_val + ozm_employer_val + unemployment_employer_val
+    total_insurance_employer = total_doo_employer + dzpo_employer_val + tzpb_val + health_employer_val + health_insurance_sick_leave_employer
+
+    # Общо разходи за работодателя
+    total_employer_cost = total_gross_income + total_insurance_employer + health_insurance_unpaid_total
+
+    # Данъчна основа (брутна заплата, без болнични, минус осигуровките на служителя)
+    taxable_income = (gross_salary_worked) - (
+            total_insurance_employee - health_insurance_unpaid_total)
+
+    # Прилагане на данъчно облекчение за ТЕЛК
+    if has_telk:
+        taxable_income = max(0, taxable_income - parameters['telk_relief'])
+
+    # Данък върху дохода
+    income_tax = taxable_income * tax_rate
+
+    # Нетна заплата
+    net_salary = total_gross_income - total_insurance_employee - income_tax
+
+    return PayrollResult(cohort_rates(birth_year, tzpb_rate, year), {
+        'gross_salary_before_supko': gross_salary,
+        'gross_salary_with_supko': gross_salary_with_supko,
+        'supko_amount': supko_amount,
+        'total_gross_income': total_gross_income,
+        'net_salary': net_salary,
+        'insurance_base': insurance_base,
+
+        'pension_insurance_employee': pension_employee_val,
+        'ozm_insurance_employee': ozm_employee_val,
+        'unemployment_insurance_employee': unemployment_employee_val,
+        'dzpo_insurance_employee': dzpo_employee_val,
+        'health_insurance_employee': health_employee_val,
+        'total_doo_employee': total_doo_employee,
+        'total_insurance_employee': total_insurance_employee,
+        'health_insurance_unpaid': round(health_insurance_unpaid_total, 2),
+
+        'pension_insurance_employer': pension_employer_val,
+        'ozm_insurance_employer': ozm_employer_val,
+        'unemployment_insurance_employer': unemployment_employer_val,
+        'dzpo_insurance_employer': dzpo_employer_val,
+        'tzpb': tzpb_val,
+        'health_insurance_employer': health_employer_val,
+        'health_insurance_sick_leave_employer': health_insurance_sick_leave_employer,
+        'total_doo_employer': total_doo_employer,
+        'total_insurance_employer': total_insurance_employer,
+        'total_employer_cost': total_employer_cost,
+
+        'taxable_income': taxable_income,
+        'income_tax': income_tax,
+
+        'days_worked': days_worked,
+        'total_working_days': total_working_days,
+        'days_vacation': days_vacation,
+        'days_sick': days_sick,
+        'days_absence': days_absence,
+        'days_unpaid': days_unpaid,
+        'sick_pay_employer': sick_pay_employer,
+        'sick_pay_nssi': sick_pay_nssi,
+        'days_sick_employer': days_sick_employer,
+        'days_sick_nssi': days_sick_nssi,
+
+        'base_salary_part': base_salary_part,
+        'vacation_salary_part': vacation_salary_part,
+        'sick_pay_part': sick_pay_part,
+        'unpaid_absence_part': unpaid_absence_part,
+        'vacation_daily_base': daily_gross_salary_vacation,
+        'vacation_base_source': vacation_base_source
+    })
+
+
+# --- Кеш на изчисленията ---
+
+class PayrollCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+result_cache = PayrollCache()
+
+
+# Същото като calculate_net_salary_with_absences, но с кеш (LRU). Ключът включва версията на
+# историята на служителя, която се увеличава при всяка промяна в месечните му записи - старите резултати
+# просто престават да се използват.
+@perf.timed('payroll.cached_calculate')
+def cached_calculate_net_salary(gross_salary, tzpb_rate, birth_year, month, days_vacation=0, days_sick=0,
+                                days_absence=0, days_unpaid=0, has_telk=False, years_experience=0,
+                                supko_rate=0.0, egn=None, sick_leave_count=1, year=DEFAULT_YEAR):
+    version = 0
+    if egn:
+        from db import get_history_version
+        version = get_history_version(egn)
+
+    key = (gross_salary, tzpb_rate, birth_year, month, days_vacation, days_sick, days_absence, days_unpaid,
+           bool(has_telk), years_experience, supko_rate, egn, sick_leave_count, year, version)
+    result = result_cache.get(key)
+    if result is None:
+        result = calculate_net_salary_with_absences(gross_salary, tzpb_rate, birth_year, month, days_vacation,
+                                                    days_sick, days_absence, days_unpaid, has_telk,
+                                                    years_experience, supko_rate, egn, sick_leave_count,
+                                                    year=year)
+        result_cache.put(key, result)
+    # PayrollResult се чете като речник, но не се променя през него - запомненият резултат се връща без копие
+    return result
+
+
+# --- Пакетно изчисление ---
+
+# ТЗПБ по подразбиране, ако не е подаден друг процент (както във формата)
+DEFAULT_TZPB_RATE = 0.7
+
+# Входни колони за пакетното изчисление и стойностите им по подразбиране
+# (съвпадат с параметрите на calculate_net_salary_with_absences)
+BATCH_INPUT_DEFAULTS = {
+    'days_vacation': 0,
+    'days_sick': 0,
+    'days_absence': 0,
+    'days_unpaid': 0,
+    'has_telk': False,
+    'years_experience': 0,
+    'supko_rate': 0.0,
+    'sick_leave_count': 1,
+    'year': DEFAULT_YEAR,
+}
+# Незадължителни дати на постъпване и напускане (липсващата дата е NaT - без ограничение)
+BATCH_DATE_COLUMNS = ['hire_date', 'leave_date']
+BATCH_REQUIRED_COLUMNS = ['gross_salary', 'tzpb_rate', 'birth_year', 'month']
+
+# Числовите колони в резултата (без 'vacation_base_source')
+RESULT_COLUMNS = [
+    'gross_salary_before_supko', 'gross_salary_with_supko', 'supko_amount', 'total_gross_income', 'net_salary',
+    'insurance_base',
+    'pension_employee_rate', 'ozm_employee_rate', 'unemployment_employee_rate', 'dzpo_employee_rate',
+    'health_employee_rate',
+    'pension_insurance_employee', 'ozm_insurance_employee', 'unemployment_insurance_employee',
+    'dzpo_insurance_employee', 'health_insurance_employee', 'total_doo_employee', 'total_insurance_employee',
+    'health_insurance_unpaid',
+    'pension_employer_rate', 'ozm_employer_rate', 'unemployment_employer_rate', 'dzpo_employer_rate',
+    'tzpb_employer_rate', 'health_employer_rate',
+    'pension_insurance_employer', 'ozm_insurance_employer', 'unemployment_insurance_employer',
+    'dzpo_insurance_employer', 'tzpb', 'health_insurance_employer', 'health_insurance_sick_leave_employer',
+    'total_doo_employer', 'total_insurance_employer', 'total_employer_cost',
+    'taxable_income', 'income_tax',
+    'days_worked', 'total_working_days', 'days_vacation', 'days_sick', 'days_absence', 'days_unpaid',
+    'sick_pay_employer', 'sick_pay_nssi', 'days_sick_employer', 'days_sick_nssi',
+    'base_salary_part', 'vacation_salary_part', 'sick_pay_part', 'unpaid_absence_part', 'vacation_daily_base',
+]
+
+# Данни за предходния месец с 10+ отработени дни (NaN, ако няма такъв)
+BATCH_PREVIOUS_MONTH_COLUMNS = ['prev_gross_salary_base', 'prev_supko_rate', 'prev_years_experience',
+                                'prev_total_working_days']
+
+# Колоните със суми - в режим MONEY_STOTINKI те са цели стотинки (останалите са ставки и дни)
+MONEY_RESULT_COLUMNS = [
+    'gross_salary_before_supko', 'gross_salary_with_supko', 'supko_amount', 'total_gross_income', 'net_salary',
+    'insurance_base',
+    'pension_insurance_employee', 'ozm_insurance_employee', 'unemployment_insurance_employee',
+    'dzpo_insurance_employee', 'health_insurance_employee', 'total_doo_employee', 'total_insurance_employee',
+    'health_insurance_unpaid',
+    'pension_insurance_employer', 'ozm_insurance_employer', 'unemployment_insurance_employer',
+    'dzpo_insurance_employer', 'tzpb', 'health_insurance_employer', 'health_insurance_sick_leave_employer',
+    'total_doo_employer', 'total_insurance_employer', 'total_employer_cost',
+    'taxable_income', 'income_tax',
+    'sick_pay_employer', 'sick_pay_nssi',
+    'base_salary_part', 'vacation_salary_part', 'sick_pay_part', 'unpaid_absence_part', 'vacation_daily_base',
+]
+
+
+def _column(df, name, dtype):
+    if name in df:
+        return df[name].to_numpy(dtype=dtype)
+    if name in BATCH_INPUT_DEFAULTS:
+        return np.full(len(df), BATCH_INPUT_DEFAULTS[name], dtype=dtype)
+    return np.full(len(df), np.nan, dtype=dtype)
+
+
+def _date_column(df, name):
+    import pandas as pd
+
+    if name in df:
+        return pd.to_datetime(df[name]).to_numpy(dtype='datetime64[D]')
+    return np.full(len(df), np.datetime64('NaT'), dtype='datetime64[D]')
+
+
+# Календарът и годишните стойности за всеки ред: работни дни в месеца, работни дни по назначение,
+# прагове и ставки. Всичко се избира по индекс от готовите таблици, без речници и условия по редове.
+# Номерата на месеците (1 - 12) по имената им; 0 за непознато име
+def _month_numbers(months):
+    import pandas as pd
+
+    return pd.Categorical(months, categories=MONTHS).codes.astype(np.int64) + 1
+
+
+def _period_columns(df):
+    year = _column(df, 'year', np.int64)
+    month = _month_numbers(df['month'])
+    if (month == 0).any():
+        unknown = sorted(set(df['month'][month == 0].astype(str)))
+        raise ValueError(f"Непознат месец: {', '.join(unknown)}")
+    parameters = year_parameter_columns(year, df['birth_year'].to_numpy() == BIRTH_BEFORE_1960)
+    # Праговете може да се подменят за отделни редове (напр. в сценарии); NaN оставя стойността за годината
+    for name in _THRESHOLD_NAMES:
+        if name in df:
+            override = df[name].to_numpy(dtype=np.float64)
+            parameters[name] = np.where(np.isnan(override), parameters[name], override)
+    total_working_days = workdays.working_days(year, month)
+    if any(name in df for name in BATCH_DATE_COLUMNS):
+        employed_days = workdays.employed_working_days(year, month, _date_column(df, 'hire_date'),
+                                                       _date_column(df, 'leave_date'))
+    else:
+        employed_days = total_working_days
+    return total_working_days, employed_days, parameters
+
+
+# Минималният осигурителен доход е за пълен месец; при постъпване или напускане в месеца
+# е пропорционален на работните дни по назначение
+def _minimum_insurance_base(min_insurance_income, employed_days, total_working_days):
+    return np.where(employed_days < total_working_days, min_insurance_income * employed_days / total_working_days,
+                    min_insurance_income)
+
+
+def _round2(values):
+    # Закръгляне като вграденото round(), за да съвпада с единичното изчисление
+    rounded = np.zeros_like(values)
+    nonzero = np.flatnonzero(values)
+    rounded[nonzero] = [round(v, 2) for v in values[nonzero].tolist()]
+    return rounded
+
+
+# Изчислява нетната заплата за много служители-месеци наведнъж с операции по колони.
+# Приема DataFrame (или речник от колони) с колоните от BATCH_REQUIRED_COLUMNS и по желание
+# BATCH_INPUT_DEFAULTS, BATCH_DATE_COLUMNS и BATCH_PREVIOUS_MONTH_COLUMNS, както и прагове от годишната
+# таблица (напр. max_insurance_income) за отделни редове. Редовете може да са от различни
+# години. Връща DataFrame със същите ключове
+# като calculate_net_salary_with_absences; при money=MONEY_STOTINKI сумите са цели стотинки.
+@perf.timed('payroll.batch')
+def calculate_net_salary_batch(data, money=MONEY_FLOAT):
+    import pandas as pd
+
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    missing = [name for name in BATCH_REQUIRED_COLUMNS if name not in df]
+    if missing:
+        raise ValueError(f"Липсващи колони: {', '.join(missing)}")
+
+    gross_salary = df['gross_salary'].to_numpy(dtype=np.float64)
+    tzpb_rate = df['tzpb_rate'].to_numpy(dtype=np.float64)
+    days_vacation = _column(df, 'days_vacation', np.int64)
+    days_sick = _column(df, 'days_sick', np.int64)
+    days_absence = _column(df, 'days_absence', np.int64)
+    days_unpaid = _column(df, 'days_unpaid', np.int64)
+    has_telk = _column(df, 'has_telk', bool)
+    years_experience = _column(df, 'years_experience', np.float64)
+    supko_rate = _column(df, 'supko_rate', np.float64)
+    sick_leave_count = _column(df, 'sick_leave_count', np.int64)
+
+    prev_gross_salary_base = _column(df, 'prev_gross_salary_base', np.float64)
+    prev_supko_rate = _column(df, 'prev_supko_rate', np.float64)
+    prev_years_experience = _column(df, 'prev_years_experience', np.float64)
+    prev_total_working_days = _column(df, 'prev_total_working_days', np.float64)
+
+    # Работни дни за месеца и по назначение, прагове и осигурителни ставки за годината на всеки ред
+    total_working_days, employed_days, rates = _period_columns(df)
+
+    # Изчисляване на отработени дни
+    days_worked = employed_days - days_vacation - days_sick - days_absence - days_unpaid
+
+    if money == MONEY_STOTINKI:
+        return _calculate_batch_stotinki(
+            gross_salary, tzpb_rate, days_vacation, days_sick, days_absence, days_unpaid, has_telk,
+            years_experience, supko_rate, sick_leave_count, prev_gross_salary_base, prev_supko_rate,
+            prev_years_experience, prev_total_working_days, total_working_days, employed_days, days_worked, rates,
+            df.index)
+    if money != MONEY_FLOAT:
+        raise ValueError(f"Непознат режим на сумите: {money!r}")
+
+    # Доплащане за професионален опит
+    supko_amount = gross_salary * (supko_rate / 100) * years_experience
+    gross_salary_with_supko = gross_salary + supko_amount
+
+    tzpb_employer = tzpb_rate / 100
+
+    # База за платения отпуск: предходен месец с 10+ отработени дни, иначе текущият месец
+    has_previous = ~np.isnan(prev_gross_salary_base)
+    prev_gross_with_supko = prev_gross_salary_base + (
+            prev_gross_salary_base * (prev_supko_rate / 100) * prev_years_experience)
+    current_month_base = days_worked >= 10
+    daily_gross_salary_vacation = np.where(
+        has_previous,
+        prev_gross_with_supko / prev_total_working_days,
+        np.where(current_month_base, gross_salary_with_supko / total_working_days, 0.0))
+    vacation_base_source = np.where(
+        has_previous, VACATION_BASE_PREVIOUS_MONTH,
+        np.where(current_month_base, VACATION_BASE_CURRENT_MONTH, VACATION_BASE_NONE)).astype(object)
+
+    # Изчисляване на заплатата по пера
+    base_salary_part = (gross_salary_with_supko / total_working_days) * days_worked
+    vacation_salary_part = daily_gross_salary_vacation * days_vacation
+    gross_salary_worked = base_salary_part + vacation_salary_part
+
+    # Болнични: първите 2 дни за всеки болничен лист са за сметка на работодателя
+    daily_sick_pay = (gross_salary_with_supko / total_working_days) * 0.7
+    days_sick_employer = np.minimum(days_sick, 2 * sick_leave_count)
+    days_sick_nssi = np.maximum(0, days_sick - days_sick_employer)
+
+    sick_pay_employer = daily_sick_pay * days_sick_employer
+    sick_pay_nssi = daily_sick_pay * days_sick_nssi
+
+    min_insurance_income = rates['min_insurance_income']
+    sick_leave_insurance_base = (min_insurance_income / total_working_days) * days_sick_nssi
+    health_insurance_sick_leave_employer = sick_leave_insurance_base * 0.048
+
+    health_insurance_unpaid_base = min_insurance_income / 2
+    health_insurance_unpaid_total = (health_insurance_unpaid_base / total_working_days) * days_unpaid * 0.08
+
+    total_gross_income = gross_salary_worked + sick_pay_employer
+
+    insurance_base_income = gross_salary_worked + sick_pay_employer
+    insurance_base = np.maximum(np.minimum(insurance_base_income, rates['max_insurance_income']),
+                                _minimum_insurance_base(min_insurance_income, employed_days, total_working_days))
+
+    # Осигуровки за служител
+    pension_employee_val = insurance_base * rates['pension_employee']
+    ozm_employee_val = insurance_base * rates['ozm_employee']
+    unemployment_employee_val = insurance_base * rates['unemployment_employee']
+    dzpo_employee_val = insurance_base * rates['dzpo_employee']
+    health_employee_val = insurance_base * rates['health_employee']
+
+    total_doo_employee = pension_employee_val + ozm_employee_val + unemployment_employee_val
+    total_insurance_employee = total_doo_employee + dzpo_employee_val + health_employee_val + health_insurance_unpaid_total
+
+    # Осигуровки за работодател
+    pension_employer_val = insurance_base * rates['pension_employer']
+    ozm_employer_val = insurance_base * rates['ozm_employer']
+    unemployment_employer_val = insurance_base * rates['unemployment_employer']
+    dzpo_employer_val = insurance_base * rates['dzpo_employer']
+    tzpb_val = insurance_base * tzpb_employer
+    health_employer_val = insurance_base * rates['health_employer']
+
+    total_doo_employer = pension_employer_val + ozm_employer_val + unemployment_employer_val
+    total_insurance_employer = total_doo_employer + dzpo_employer_val + tzpb_val + health_employer_val + health_insurance_sick_leave_employer
+
+    total_employer_cost = total_gross_income + total_insurance_employer + health_insurance_unpaid_total
+
+    # Данъчна основа и облекчение за ТЕЛК
+    taxable_income = (gross_salary_worked) - (
+            total_insurance_employee - health_insurance_unpaid_total)
+    taxable_income = np.where(has_telk, np.maximum(0, taxable_income - rates['telk_relief']), taxable_income)
+
+    income_tax = taxable_income * rates['tax_rate']
+    net_salary = total_gross_income - total_insurance_employee - income_tax
+
+    zeros = np.zeros(len(df), dtype=np.int64)
+    return pd.DataFrame({
+        'gross_salary_before_supko': gross_salary,
+        'gross_salary_with_supko': gross_salary_with_supko,
+        'supko_amount': supko_amount,
+        'total_gross_income': total_gross_income,
+        'net_salary': net_salary,
+        'insurance_base': insurance_base,
+
+        'pension_employee_rate': rates['pension_employee'],
+        'ozm_employee_rate': rates['ozm_employee'],
+        'unemployment_employee_rate': rates['unemployment_employee'],
+        'dzpo_employee_rate': rates['dzpo_employee'],
+        'health_employee_rate': rates['health_employee'],
+
+        'pension_insurance_employee': pension_employee_val,
+        'ozm_insurance_employee': ozm_employee_val,
+        'unemployment_insurance_employee': unemployment_employee_val,
+        'dzpo_insurance_employee': dzpo_employee_val,
+        'health_insurance_employee': health_employee_val,
+        'total_doo_employee': total_doo_employee,
+        'total_insurance_employee': total_insurance_employee,
+        'health_insurance_unpaid': _round2(health_insurance_unpaid_total),
+
+        'pension_employer_rate': rates['pension_employer'],
+        'ozm_employer_rate': rates['ozm_employer'],
+        'unemployment_employer_rate': rates['unemployment_employer'],
+        'dzpo_employer_rate': rates['dzpo_employer'],
+        'tzpb_employer_rate': tzpb_rate,
+        'health_employer_rate': rates['health_employer'],
+
+        'pension_insurance_employer': pension_employer_val,
+        'ozm_insurance_employer': ozm_employer_val,
+        'unemployment_insurance_employer': unemployment_employer_val,
+        'dzpo_insurance_employer': dzpo_employer_val,
+        'tzpb': tzpb_val,
+        'health_insurance_employer': health_employer_val,
+        'health_insurance_sick_leave_employer': health_insurance_sick_leave_employer,
+        'total_doo_employer': total_doo_employer,
+        'total_insurance_employer': total_insurance_employer,
+        'total_employer_cost': total_employer_cost,
+
+        'taxable_income': taxable_income,
+        'income_tax': income_tax,
+
+        'days_worked': days_worked,
+        'total_working_days': total_working_days,
+        'days_vacation': days_vacation,
+        'days_sick': days_sick,
+        'days_absence': days_absence,
+        'days_unpaid': days_unpaid,
+        'sick_pay_employer': sick_pay_employer,
+        'sick_pay_nssi': sick_pay_nssi,
+        'days_sick_employer': days_sick_employer,
+        'days_sick_nssi': days_sick_nssi,
+
+        'base_salary_part': base_salary_part,
+        'vacation_salary_part': vacation_salary_part,
+        'sick_pay_part': zeros,
+        'unpaid_absence_part': zeros,
+        'vacation_daily_base': daily_gross_salary_vacation,
+        'vacation_base_source': vacation_base_source
+    }, index=df.index)
+
+
+# --- Изчисление в стотинки ---
+
+# Сумите са цели стотинки (int64), а всяко перо се закръгля поотделно до стотинка (половинката нагоре).
+# Сборовете са точни сборове на закръглените пера - така и общите суми за фирмата съвпадат със
+# счетоводството, независимо колко служители се сумират.
+
+def _to_stotinki(levs):
+    levs = np.asarray(levs, dtype=np.float64)
+    # Първо се премахва шумът от двоичното представяне (1234.565 * 100 = 123456.49999...)
+    return np.floor(np.round(np.abs(levs) * 100, 6) + 0.5).astype(np.int64) * np.sign(levs).astype(np.int64)
+
+
+def _basis_points(rate):
+    # Ставка като дял (0.0658) -> стотни от процента (658)
+    return np.round(np.asarray(rate, dtype=np.float64) * 10000).astype(np.int64)
+
+
+def _div_round(numerator, denominator):
+    # Целочислено деление със закръгляне на половинката далеч от нулата
+    numerator = np.asarray(numerator, dtype=np.int64)
+    quotient = (2 * np.abs(numerator) + denominator) // (2 * denominator)
+    return np.where(numerator < 0, -quotient, quotient)
+
+
+def _calculate_batch_stotinki(gross_salary, tzpb_rate, days_vacation, days_sick, days_absence, days_unpaid,
+                              has_telk, years_experience, supko_rate, sick_leave_count, prev_gross_salary_base,
+                              prev_supko_rate, prev_years_experience, prev_total_working_days, total_working_days,
+                              employed_days, days_worked, rates, index):
+    import pandas as pd
+
+    min_income = _to_stotinki(rates['min_insurance_income'])
+    max_income = _to_stotinki(rates['max_insurance_income'])
+    min_insurance_base = np.where(employed_days < total_working_days,
+                                  _div_round(min_income * employed_days, total_working_days), min_income)
+    years_experience = years_experience.astype(np.int64)
+
+    # Доплащане за професионален опит
+    gross_salary = _to_stotinki(gross_salary)
+    supko_amount = _div_round(gross_salary * _basis_points(supko_rate / 100) * years_experience, 10000)
+    gross_salary_with_supko = gross_salary + supko_amount
+
+    # База за платения отпуск: предходен месец с 10+ отработени дни, иначе текущият месец
+    has_previous = ~np.isnan(prev_gross_salary_base)
+    prev_gross_salary = _to_stotinki(np.where(has_previous, prev_gross_salary_base, 0.0))
+    prev_gross_with_supko = prev_gross_salary + _div_round(
+        prev_gross_salary * _basis_points(np.where(has_previous, prev_supko_rate, 0.0) / 100)
+        * np.where(has_previous, prev_years_experience, 0.0).astype(np.int64), 10000)
+    prev_days = np.where(has_previous, prev_total_working_days, 1.0).astype(np.int64)
+    current_month_base = days_worked >= 10
+    vacation_gross = np.where(has_previous, prev_gross_with_supko,
+                              np.where(current_month_base, gross_salary_with_supko, 0))
+    vacation_days = np.where(has_previous, prev_days, total_working_days)
+    vacation_base_source = np.where(
+        has_previous, VACATION_BASE_PREVIOUS_MONTH,
+        np.where(current_month_base, VACATION_BASE_CURRENT_MONTH, VACATION_BASE_NONE)).astype(object)
+
+    # Пера на заплатата - всяко се закръгля от точната дроб, а не от закръглената дневна ставка
+    base_salary_part = _div_round(gross_salary_with_supko * days_worked, total_working_days)
+    vacation_salary_part = _div_round(vacation_gross * days_vacation, vacation_days)
+    vacation_daily_base = _div_round(vacation_gross, vacation_days)
+    gross_salary_worked = base_salary_part + vacation_salary_part
+
+    # Болнични: 70% от дневното възнаграждение, първите 2 дни на лист за сметка на работодателя
+    days_sick_employer = np.minimum(days_sick, 2 * sick_leave_count)
+    days_sick_nssi = np.maximum(0, days_sick - days_sick_employer)
+    sick_pay_employer = _div_round(gross_salary_with_supko * 70 * days_sick_employer, 100 * total_working_days)
+    sick_pay_nssi = _div_round(gross_salary_with_supko * 70 * days_sick_nssi, 100 * total_working_days)
+
+    # Здравно осигуряване върху минималния доход за дните от НОИ (4,8%) и неплатения отпуск (8% върху половината)
+    health_insurance_sick_leave_employer = _div_round(min_income * days_sick_nssi * 480,
+                                                      total_working_days * 10000)
+    health_insurance_unpaid = _div_round(min_income * days_unpaid * 800, 2 * total_working_days * 10000)
+
+    total_gross_income = gross_salary_worked + sick_pay_employer
+    insurance_base = np.minimum(np.maximum(total_gross_income, min_insurance_base), max_income)
+
+    def contribution(rate):
+        return _div_round(insurance_base * _basis_points(rate), 10000)
+
+    # Осигуровки за служител
+    pension_employee_val = contribution(rates['pension_employee'])
+    ozm_employee_val = contribution(rates['ozm_employee'])
+    unemployment_employee_val = contribution(rates['unemployment_employee'])
+    dzpo_employee_val = contribution(rates['dzpo_employee'])
+    health_employee_val = contribution(rates['health_employee'])
+
+    total_doo_employee = pension_employee_val + ozm_employee_val + unemployment_employee_val
+    total_insurance_employee = total_doo_employee + dzpo_employee_val + health_employee_val + health_insurance_unpaid
+
+    # Осигуровки за работодател
+    pension_employer_val = contribution(rates['pension_employer'])
+    ozm_employer_val = contribution(rates['ozm_employer'])
+    unemployment_employer_val = contribution(rates['unemployment_employer'])
+    dzpo_employer_val = contribution(rates['dzpo_employer'])
+    tzpb_val = contribution(tzpb_rate / 100)
+    health_employer_val = contribution(rates['health_employer'])
+
+    total_doo_employer = pension_employer_val + ozm_employer_val + unemployment_employer_val
+    total_insurance_employer = (total_doo_employer + dzpo_employer_val + tzpb_val + health_employer_val
+                                + health_insurance_sick_leave_employer)
+
+    total_employer_cost = total_gross_income + total_insurance_employer + health_insurance_unpaid
+
+    # Данъчна основа и облекчение за ТЕЛК
+    taxable_income = gross_salary_worked - (total_insurance_employee - health_insurance_unpaid)
+    taxable_income = np.where(has_telk, np.maximum(0, taxable_income - _to_stotinki(rates['telk_relief'])),
+                              taxable_income)
+
+    income_tax = _div_round(taxable_income * _basis_points(rates['tax_rate']), 10000)
+    net_salary = total_gross_income - total_insurance_employee - income_tax
+
+    zeros = np.zeros(len(index), dtype=np.int64)
+    return pd.DataFrame({
+        'gross_salary_before_supko': gross_salary,
+        'gross_salary_with_supko': gross_salary_with_supko,
+        'supko_amount': supko_amount,
+        'total_gross_income': total_gross_income,
+        'net_salary': net_salary,
+        'insurance_base': insurance_base,
+
+        'pension_employee_rate': rates['pension_employee'],
+        'ozm_employee_rate': rates['ozm_employee'],
+        'unemployment_employee_rate': rates['unemployment_employee'],
+        'dzpo_employee_rate': rates['dzpo_employee'],
+        'health_employee_rate': rates['health_employee'],
+
+        'pension_insurance_employee': pension_employee_val,
+        'ozm_insurance_employee': ozm_employee_val,
+        'unemployment_insurance_employee': unemployment_employee_val,
+        'dzpo_insurance_employee': dzpo_employee_val,
+        'health_insurance_employee': health_employee_val,
+        'total_doo_employee': total_doo_employee,
+        'total_insurance_employee': total_insurance_employee,
+        'health_insurance_unpaid': health_insurance_unpaid,
+
+        'pension_employer_rate': rates['pension_employer'],
+        'ozm_employer_rate': rates['ozm_employer'],
+        'unemployment_employer_rate': rates['unemployment_employer'],
+        'dzpo_employer_rate': rates['dzpo_employer'],
+        'tzpb_employer_rate': tzpb_rate,
+        'health_employer_rate': rates['health_employer'],
+
+        'pension_insurance_employer': pension_employer_val,
+        'ozm_insurance_employer': ozm_employer_val,
+        'unemployment_insurance_employer': unemployment_employer_val,
+        'dzpo_insurance_employer': dzpo_employer_val,
+        'tzpb': tzpb_val,
+        'health_insurance_employer': health_employer_val,
+        'health_insurance_sick_leave_employer': health_insurance_sick_leave_employer,
+        'total_doo_employer': total_doo_employer,
+        'total_insurance_employer': total_insurance_employer,
+        'total_employer_cost': total_employer_cost,
+
+        'taxable_income': taxable_income,
+        'income_tax': income_tax,
+
+        'days_worked': days_worked,
+        'total_working_days': total_working_days,
+        'days_vacation': days_vacation,
+        'days_sick': days_sick,
+        'days_absence': days_absence,
+        'days_unpaid': days_unpaid,
+        'sick_pay_employer': sick_pay_employer,
+        'sick_pay_nssi': sick_pay_nssi,
+        'days_sick_employer': days_sick_employer,
+        'days_sick_nssi': days_sick_nssi,
+
+        'base_salary_part': base_salary_part,
+        'vacation_salary_part': vacation_salary_part,
+        'sick_pay_part': zeros,
+        'unpaid_absence_part': zeros,
+        'vacation_daily_base': vacation_daily_base,
+        'vacation_base_source': vacation_base_source
+    }, index=index)
+
+
+# Превръща сумите от резултат в стотинки обратно в лева (за показване и запис)
+def stotinki_to_levs(results):
+    results = results.copy()
+    for name in MONEY_RESULT_COLUMNS:
+        if name in results:
+            results[name] = results[name] / 100
+    return results
+
+
+# --- Компактен резултат ---
+
+# Ставките в резултата са едни и същи за всички с еднаква година, поколение и ТЗПБ - пазят се веднъж
+# за такава група, а не във всеки резултат
+RATE_RESULT_COLUMNS = ['pension_employee_rate', 'ozm_employee_rate', 'unemployment_employee_rate',
+                       'dzpo_employee_rate', 'health_employee_rate', 'pension_employer_rate', 'ozm_employer_rate',
+                       'unemployment_employer_rate', 'dzpo_employer_rate', 'tzpb_employer_rate',
+                       'health_employer_rate']
+# Всички ключове на резултата по реда им и тези от тях, които се пазят във всеки резултат
+RESULT_KEYS = RESULT_COLUMNS + ['vacation_base_source']
+_VALUE_KEYS = [name for name in RESULT_KEYS if name not in RATE_RESULT_COLUMNS]
+_RATE_KEY_SET = frozenset(RATE_RESULT_COLUMNS)
+_VALUE_KEY_SET = frozenset(_VALUE_KEYS)
+_VALUE_INDEX = {name: index for index, name in enumerate(_VALUE_KEYS)}
+_result_values = itemgetter(*_VALUE_KEYS)
+
+
+# Речник само за четене с общите ставки на група (може да се сериализира, за разлика от MappingProxyType)
+class CohortRates(Mapping):
+    __slots__ = ['_rates']
+
+    def __init__(self, rates):
+        self._rates = dict(rates)
+
+    def __getitem__(self, key):
+        return self._rates[key]
+
+    def __iter__(self):
+        return iter(self._rates)
+
+    def __len__(self):
+        return len(self._rates)
+
+    def __repr__(self):
+        return f"CohortRates({self._rates!r})"
+
+
+# Общите ставки за група - един и същ обект за всички резултати от групата
+def cohort_rates(birth_year, tzpb_rate, year=DEFAULT_YEAR):
+    return _cohort_rates(birth_year == BIRTH_BEFORE_1960, float(tzpb_rate), year)
+
+
+@lru_cache(maxsize=None)
+def _cohort_rates(before_1960, tzpb_rate, year):
+    rates = contribution_rates(BIRTH_BEFORE_1960 if before_1960 else BIRTH_AFTER_1960, year)
+    return CohortRates(zip(RATE_RESULT_COLUMNS, [
+        rates['pension_employee'], rates['ozm_employee'], rates['unemployment_employee'], rates['dzpo_employee'],
+        rates['health_employee'], rates['pension_employer'], rates['ozm_employer'],
+        rates['unemployment_employer'], rates['dzpo_employer'], tzpb_rate, rates['health_employer']]))
+
+
+# Резултат от изчислението за един служител-месец. Чете се като речник (result['net_salary'], keys(),
+# dict(result)) с ключовете от RESULT_KEYS или като атрибути (result.net_salary). Стойностите са в един
+# кортеж по реда на _VALUE_KEYS, а ставките - в общия за групата rates. Речник се създава само при to_dict().
+class PayrollResult(Mapping):
+    __slots__ = ['rates', '_values']
+
+    def __init__(self, rates, values):
+        if len(values) != len(_VALUE_KEYS):
+            unknown = sorted(set(values) - _VALUE_KEY_SET) or sorted(_VALUE_KEY_SET - set(values))
+            raise TypeError(f"Непознати или липсващи полета: {', '.join(unknown)}")
+        self.rates = rates
+        self._values = _result_values(values)
+
+    # Без проверки - за готови стойности по реда на _VALUE_KEYS (от PayrollResults)
+    @classmethod
+    def _from_values(cls, rates, values):
+        result = cls.__new__(cls)
+        result.rates = rates
+        result._values = tuple(values)
+        return result
+
+    def __getattr__(self, name):
+        index = _VALUE_INDEX.get(name)
+        if index is None:
+            raise AttributeError(name)
+        return self._values[index]
+
+    def __getitem__(self, key):
+        index = _VALUE_INDEX.get(key)
+        if index is not None:
+            return self._values[index]
+        if key in _RATE_KEY_SET:
+            return self.rates[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(RESULT_KEYS)
+
+    def __len__(self):
+        return len(RESULT_KEYS)
+
+    def __repr__(self):
+        return f"PayrollResult(net_salary={self.net_salary!r}, total_employer_cost={self.total_employer_cost!r})"
+
+    def to_dict(self):
+        return dict(self)
+
+
+# Резултатите от пакетно изчисление по колони (масиви). Ставките се пазят веднъж за група в rates,
+# а за всеки ред - само номерът на групата му. Останалите колони на таблицата (напр. egn, month) се запазват.
+# results[i] и обхождането дават PayrollResult, създаван едва при достъпа.
+class PayrollResults:
+    __slots__ = ['index', 'rates', '_cohort', '_columns', '_order']
+
+    def __init__(self, columns, cohort, rates, order, index):
+        self._columns = columns
+        self._cohort = cohort
+        self.rates = rates
+        self._order = order
+        self.index = index
+
+    # От таблицата на calculate_net_salary_batch (или run_month / run_year)
+    @classmethod
+    def from_frame(cls, frame):
+        import pandas as pd
+
+        present = [name for name in RATE_RESULT_COLUMNS if name in frame]
+        if len(present) != len(RATE_RESULT_COLUMNS):
+            raise ValueError("Липсват колоните със ставките.")
+        # Номер на групата по реда на първата поява - по хеш на всяка колона, без сортиране на редовете
+        cohort = np.zeros(len(frame), dtype=np.int64)
+        for name in RATE_RESULT_COLUMNS:
+            codes, uniques = pd.factorize(frame[name].to_numpy(dtype=np.float64))
+            cohort, _ = pd.factorize(cohort * len(uniques) + codes)
+        _, first = np.unique(cohort, return_index=True)
+        groups = frame[RATE_RESULT_COLUMNS].to_numpy(dtype=np.float64)[first]
+        rates = tuple(CohortRates(zip(RATE_RESULT_COLUMNS, group)) for group in groups.tolist())
+        columns = {}
+        for name in frame.columns:
+            if name in _RATE_KEY_SET:
+                continue
+            values = frame[name]
+            # Малкото различни низове (вида на базата за отпуска) се пазят като номера
+            columns[name] = values.array if name != 'vacation_base_source' else pd.Categorical(values)
+        cohort = cohort.astype(np.min_scalar_type(max(len(rates) - 1, 0)))
+        return cls(columns, cohort, rates, list(frame.columns), frame.index)
+
+    # Слепва резултати с еднакви колони (напр. от отделните процеси в run_year) с нов индекс 0..n-1
+    @classmethod
+    def concat(cls, parts):
+        import pandas as pd
+
+        parts = list(parts)
+        rates, numbers, cohorts = [], {}, []
+        for part in parts:
+            mapping = []
+            for group in part.rates:
+                key = tuple(group.values())
+                if key not in numbers:
+                    numbers[key] = len(rates)
+                    rates.append(group)
+                mapping.append(numbers[key])
+            cohorts.append(np.array(mapping, dtype=np.int64)[part._cohort] if len(part) else
+                           np.empty(0, dtype=np.int64))
+        cohort = np.concatenate(cohorts).astype(np.min_scalar_type(max(len(rates) - 1, 0)))
+        columns = {}
+        for name in parts[0]._columns:
+            values = [part._columns[name] for part in parts]
+            if name == 'vacation_base_source':
+                columns[name] = pd.api.types.union_categoricals(values)
+            else:
+                columns[name] = pd.concat([pd.Series(column) for column in values], ignore_index=True).array
+        return cls(columns, cohort, tuple(rates), parts[0]._order, pd.RangeIndex(len(cohort)))
+
+    def __len__(self):
+        return len(self._cohort)
+
+    def __getitem__(self, position):
+        rates = self.rates[self._cohort[position]]
+        return PayrollResult._from_values(rates, [_scalar(self._columns[name][position]) for name in _VALUE_KEYS])
+
+    def __iter__(self):
+        values = zip(*[self._column_list(name) for name in _VALUE_KEYS])
+        for cohort, row in zip(self._cohort.tolist(), values):
+            yield PayrollResult._from_values(self.rates[cohort], row)
+
+    # Само редовете на позициите (масив с номера или булева маска); ставките на групите са същите
+    def take(self, positions):
+        columns = {name: values[positions] for name, values in self._columns.items()}
+        return type(self)(columns, self._cohort[positions], self.rates, self._order, self.index[positions])
+
+    def _column_list(self, name):
+        return self._columns[name].tolist()
+
+    # Колона като масив (ставките се разгъват по групите)
+    def column(self, name):
+        if name in _RATE_KEY_SET:
+            return np.array([rates[name] for rates in self.rates], dtype=np.float64)[self._cohort]
+        return np.asarray(self._columns[name])
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({name: self.column(name) for name in self._order}, index=self.index)
+
+    # Заета памет за масивите в байтове (без общите ставки)
+    @property
+    def nbytes(self):
+        return self._cohort.nbytes + sum(values.nbytes for values in self._columns.values())
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# --- Обратно изчисление: бруто от нето ---
+
+# Величини, за които може да се търси брутна заплата
+SOLVE_TARGETS = {
+    'net_salary': 'Нетна заплата',
+    'total_employer_cost': 'Разходи за работодател',
+}
+
+_EMPLOYEE_RATE_COLUMNS = ['pension_employee_rate', 'ozm_employee_rate', 'unemployment_employee_rate',
+                          'dzpo_employee_rate', 'health_employee_rate']
+
+
+def _evaluate_at(df, gross_salary):
+    # Всеки ред от df се изчислява за всяка от колоните на gross_salary (n x k)
+    k = gross_salary.shape[1]
+    repeated = df.loc[df.index.repeat(k)].reset_index(drop=True)
+    repeated['gross_salary'] = gross_salary.ravel()
+    return calculate_net_salary_batch(repeated)
+
+
+# Намира основната брутна заплата (без СУПКО), при която target_column достига target, за всеки ред от data.
+# data съдържа входните колони на calculate_net_salary_batch без 'gross_salary'; target е число или масив.
+# При фиксирани дни и ставки резултатът е частично линеен по брутната заплата с прекъсвания само при
+# минималния и максималния осигурителен доход и при изчерпване на облекчението за ТЕЛК. Тези точки се
+# намират аналитично, изчисляват се с пакетното изчисление и целта се интерполира в нужния отрязък.
+# Връща резултата от calculate_net_salary_batch за намерената заплата (закръглена до стотинка);
+# за недостижими цели заплатата е NaN.
+@perf.timed('payroll.solve')
+def solve_gross_salary_batch(data, target, target_column='net_salary'):
+    import pandas as pd
+
+    if target_column not in SOLVE_TARGETS:
+        raise ValueError(f"Непозната цел: {target_column!r}")
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    df = df.reset_index(drop=True)
+    target = np.broadcast_to(np.asarray(target, dtype=np.float64), (len(df),))
+
+    # Общият и облагаемият доход са линейни по заплатата: наклонът и началото се вземат от изчислението
+    probe = _evaluate_at(df, np.tile([0.0, 1.0], (len(df), 1)))
+    income = probe['total_gross_income'].to_numpy().reshape(-1, 2)
+    worked = (probe['total_gross_income'] - probe['sick_pay_employer']).to_numpy().reshape(-1, 2)
+    employee_rate = probe[_EMPLOYEE_RATE_COLUMNS].sum(axis=1).to_numpy()[::2]
+    income_0, income_1 = income[:, 0], income[:, 1] - income[:, 0]
+    worked_0, worked_1 = worked[:, 0], worked[:, 1] - worked[:, 0]
+
+    # Праговете за годината и периода на назначението на всеки ред
+    total_working_days, employed_days, parameters = _period_columns(df)
+    min_income = _minimum_insurance_base(parameters['min_insurance_income'], employed_days, total_working_days)
+    max_income = parameters['max_insurance_income']
+    telk_relief = parameters['telk_relief']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        breakpoints = np.column_stack([
+            # Осигурителният доход достига минимума и максимума
+            (min_income - income_0) / income_1,
+            (max_income - income_0) / income_1,
+            # Облагаемият доход достига облекчението за ТЕЛК при всеки от трите режима на осигурителния доход
+            (telk_relief + min_income * employee_rate - worked_0) / worked_1,
+            (telk_relief - worked_0 + income_0 * employee_rate) / (worked_1 - income_1 * employee_rate),
+            (telk_relief + max_income * employee_rate - worked_0) / worked_1,
+        ])
+    breakpoints = np.where(np.isfinite(breakpoints) & (breakpoints > 0), breakpoints, 0.0)
+    # Последният отрязък продължава линейно - добавя се още една точка след всички прекъсвания
+    points = np.column_stack([np.zeros(len(df)), breakpoints, breakpoints.max(axis=1) + GROSS_SALARY_MAX])
+    points = np.sort(points, axis=1)
+
+    values = _evaluate_at(df, points)[target_column].to_numpy().reshape(points.shape)
+    # Отрязъкът, в който попада целта (функцията е ненамаляваща), с продължение след последната точка
+    segment = np.clip((values <= target[:, None]).sum(axis=1) - 1, 0, points.shape[1] - 2)
+    rows = np.arange(len(df))
+    x0, x1 = points[rows, segment], points[rows, segment + 1]
+    y0, y1 = values[rows, segment], values[rows, segment + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gross_salary = x0 + (target - y0) * (x1 - x0) / (y1 - y0)
+    reachable = (target >= values[:, 0]) & np.isfinite(gross_salary)
+    gross_salary = np.where(reachable, np.round(gross_salary, 2), np.nan)
+
+    solved = df.assign(gross_salary=gross_salary)
+    return calculate_net_salary_batch(solved)
+
+
+# --- Изчисление за съхранените служители ---
+
+# Годината на раждане се определя от ЕГН (месец +20 за 1800-1899 и +40 за 2000-2099 г.)
+def birth_cohort_from_egn(egn):
+    egn = str(egn)
+    if len(egn) < 4 or not egn[:4].isdigit():
+        return BIRTH_AFTER_1960
+    year, month = int(egn[:2]), int(egn[2:4])
+    if month > 40:
+        year += 2000
+    elif month > 20:
+        year += 1800
+    else:
+        year += 1900
+    return BIRTH_BEFORE_1960 if year < 1960 else BIRTH_AFTER_1960
+
+
+# Базата за отпуска за всеки ред от историята на служителите за годината (редове във вида на
+# db.SALARY_COLUMNS): последният по-ранен месец на същия ЕГН с 10+ отработени дни. carried е речник
+# ЕГН -> данни за последния такъв месец от предходните години (db.get_previous_month_data_all за януари)
+# и важи до първия отговарящ месец в годината. Връща BATCH_PREVIOUS_MONTH_COLUMNS.
+def previous_month_columns(history, year=DEFAULT_YEAR, carried=None):
+    import pandas as pd
+
+    ordered = history.assign(_idx=_month_numbers(history['month'])).sort_values(['egn', '_idx'], kind='stable')
+    total_working_days = workdays.working_days(year, ordered['_idx'].to_numpy())
+    days_worked = (total_working_days - ordered['days_vacation'] - ordered['days_sick'] - ordered['days_absence']
+                   - ordered['days_unpaid'])
+    qualifying = days_worked >= 10
+
+    previous = pd.DataFrame({
+        'prev_gross_salary_base': ordered['gross_salary_base'],
+        'prev_supko_rate': ordered['supko_rate'],
+        'prev_years_experience': ordered['years_experience'],
+        'prev_total_working_days': total_working_days,
+    }, index=ordered.index).astype(np.float64).where(qualifying)
+    # Стойността от предходен ред в групата, пренесена напред до следващия отговарящ месец
+    groups = previous.groupby(ordered['egn'], sort=False)
+    previous = groups.shift(1).groupby(ordered['egn'], sort=False).ffill()
+    if carried:
+        carried = pd.DataFrame.from_dict(carried, orient='index', columns=BATCH_PREVIOUS_MONTH_COLUMNS)
+        previous = previous.fillna(carried.reindex(ordered['egn']).set_axis(ordered.index).astype(np.float64))
+    return previous.reindex(history.index)
+
+
+# Превръща месечни записи (db.SALARY_COLUMNS) във входни колони за calculate_net_salary_batch.
+# previous е речник ЕГН -> данни за предходен месец (db.get_previous_month_data_all)
+# или DataFrame с BATCH_PREVIOUS_MONTH_COLUMNS със същия индекс (previous_month_columns).
+def batch_input_from_records(records, previous, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(), year=DEFAULT_YEAR):
+    import pandas as pd
+
+    egns = records['egn']
+    batch = pd.DataFrame({
+        'egn': egns,
+        'full_name': records['full_name'],
+        'year': year,
+        'month': records['month'],
+        'gross_salary': records['gross_salary_base'],
+        'tzpb_rate': tzpb_rate,
+        'birth_year': egns.map(birth_cohort_from_egn),
+        'days_vacation': records['days_vacation'],
+        'days_sick': records['days_sick'],
+        'days_absence': records['days_absence'],
+        'days_unpaid': records['days_unpaid'],
+        'has_telk': egns.isin(set(telk_egns)),
+        'years_experience': records['years_experience'],
+        'supko_rate': records['supko_rate'],
+        'sick_leave_count': records['sick_leave_count'].fillna(1),
+    }, index=records.index)
+    if isinstance(previous, pd.DataFrame):
+        for name in BATCH_PREVIOUS_MONTH_COLUMNS:
+            batch[name] = previous[name]
+        return batch
+
+    missing = (np.nan,) * len(BATCH_PREVIOUS_MONTH_COLUMNS)
+    previous_values = [previous.get(egn, missing) for egn in egns]
+    for i, name in enumerate(BATCH_PREVIOUS_MONTH_COLUMNS):
+        batch[name] = np.array([values[i] for values in previous_values], dtype=np.float64)
+    return batch
+
+
+# Изчислява заплатите на всички съхранени служители за даден месец (PayrollResults с egn, full_name и month)
+def run_month(month, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(), money=MONEY_FLOAT, year=DEFAULT_YEAR):
+    import pandas as pd
+    import db
+
+    records = pd.DataFrame(db.read_month_data(month, year), columns=db.SALARY_COLUMNS)
+    return _run_month_records(records, db.get_previous_month_data_all(month, year), tzpb_rate, telk_egns, money,
+                              year)
+
+
+# Изчислява записите от един месец; previous е базата за отпуска от db.get_previous_month_data_all
+def _run_month_records(records, previous, tzpb_rate, telk_egns, money=MONEY_FLOAT, year=DEFAULT_YEAR):
+    import pandas as pd
+
+    batch = batch_input_from_records(records, previous, tzpb_rate, telk_egns, year)
+    results = calculate_net_salary_batch(batch, money)
+    return PayrollResults.from_frame(pd.concat([batch[['egn', 'full_name', 'month']], results], axis=1))
+
+
+# Изчислява цялата година за група служители: историята им за годината се чете с една заявка,
+# а месеците на всеки служител се обработват подред (базата за отпуска зависи от предходните,
+# а за началото на годината - от последния отговарящ месец в предходните години)
+def _run_employees(egns, tzpb_rate, telk_egns, money=MONEY_FLOAT, year=DEFAULT_YEAR):
+    import pandas as pd
+
+    batch = employees_batch_input(egns, tzpb_rate, telk_egns, year)
+    results = calculate_net_salary_batch(batch, money)
+    return PayrollResults.from_frame(pd.concat([batch[['egn', 'full_name', 'month']], results], axis=1))
+
+
+# Входът за calculate_net_salary_batch за всички месеци на група служители, подреден по ЕГН и месец
+def employees_batch_input(egns, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(), year=DEFAULT_YEAR):
+    import pandas as pd
+    import db
+
+    history = pd.DataFrame(db.read_employee_history(egns, year), columns=db.SALARY_COLUMNS)
+    history = history.assign(_idx=_month_numbers(history['month'])).sort_values(['egn', '_idx'], kind='stable')
+    history = history.drop(columns='_idx').reset_index(drop=True)
+    carried = db.get_previous_month_data_all(MONTHS[0], year, egns)
+    return batch_input_from_records(history, previous_month_columns(history, year, carried), tzpb_rate, telk_egns,
+                                    year)
+
+
+# Процес от пула: собствена връзка само за четене към базата
+def _run_shard(db_path, egns, tzpb_rate, telk_egns, money, year):
+    import db
+
+    db.set_pool(db.ConnectionPool(db_path, size=1, read_only=True))
+    return _run_employees(egns, tzpb_rate, telk_egns, money, year)
+
+
+# Изчислява всички месеци за всички служители. При workers > 1 служителите се разпределят
+# между отделни процеси; резултатът (PayrollResults) е същият като при последователното изпълнение.
+def run_year(tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(), workers=1, money=MONEY_FLOAT, year=DEFAULT_YEAR):
+    import db
+
+    egns = db.read_egns(year=year)
+    workers = max(1, min(workers, len(egns)))
+    if workers == 1:
+        return _run_employees(egns, tzpb_rate, telk_egns, money, year)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Последователни групи ЕГН, за да може резултатите просто да се слепят по ред
+    shard_size = -(-len(egns) // workers)
+    shards = [egns[i:i + shard_size] for i in range(0, len(egns), shard_size)]
+    db_path = db.get_pool().path
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(_run_shard, [db_path] * len(shards), shards, [tzpb_rate] * len(shards),
+                                  [tuple(telk_egns)] * len(shards), [money] * len(shards), [year] * len(shards)))
+    return PayrollResults.concat(parts)
+
+
+# Резултатите (PayrollResults) за месец (или за цялата година при month=None) на порции от chunk_size
+# служители, подредени по ЕГН и месец. В паметта е само историята на текущата порция.
+# За един месец се четат и изчисляват само записите от него (базата за отпуска е от последния
+# отговарящ месец преди него), а не цялата година на служителите.
+def iter_results(month=None, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=(), money=MONEY_FLOAT, chunk_size=1000,
+                 year=DEFAULT_YEAR):
+    import pandas as pd
+    import db
+
+    after = None
+    while True:
+        if month is None:
+            egns = db.read_egns(after, chunk_size, year)
+            if not egns:
+                return
+            results = _run_employees(egns, tzpb_rate, telk_egns, money, year)
+        else:
+            records = pd.DataFrame(db.read_month_data(month, year, after, chunk_size), columns=db.SALARY_COLUMNS)
+            if records.empty:
+                return
+            egns = records['egn'].tolist()
+            previous = db.get_previous_month_data_all(month, year, egns)
+            results = _run_month_records(records, previous, tzpb_rate, telk_egns, money, year)
+        after = egns[-1]
+        yield results
+
+
+# Преизчислява само маркираните записи (и тези без резултат) и ги записва в payroll_results.
+# При telk_egns=None ТЕЛК остава на служителите, които го имат в съхранените резултати;
+# подаден списък го заменя. Връща броя на преизчислените записи.
+def refresh_results(tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=None, year=DEFAULT_YEAR):
+    import pandas as pd
+    import db
+
+    if telk_egns is None:
+        telk_egns = db.read_telk_egns(year)
+    stale = db.read_stale_results(tzpb_rate, telk_egns, year)
+    if not stale:
+        return 0
+    stale_keys = {(egn, month) for egn, month, _ in stale}
+    egns = {egn for egn, _ in stale_keys}
+
+    history = pd.DataFrame(db.read_employee_history(egns, year), columns=db.SALARY_COLUMNS)
+    previous = previous_month_columns(history, year, db.get_previous_month_data_all(MONTHS[0], year, egns))
+    selected = pd.MultiIndex.from_arrays([history['egn'], history['month']]).isin(list(stale_keys))
+    records = history[selected]
+
+    batch = batch_input_from_records(records, previous[selected], tzpb_rate, telk_egns, year)
+    results = calculate_net_salary_batch(batch)
+    results.insert(0, 'egn', batch['egn'])
+    results.insert(1, 'month', batch['month'])
+    results.insert(2, 'tzpb_rate', tzpb_rate)
+    results.insert(3, 'has_telk', batch['has_telk'].astype(int))
+    results = PayrollResults.from_frame(results)
+    db.save_results(results, stale, year)
+    return len(results)
@@ -0,0 +1,195 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Леко измерване на времето по фази. Докато е изключено, span() връща общ празен обект,
+# а декорираните функции правят само една проверка на флага.
+
+# Общият флаг за процеса (командния ред и бенчмарковете); включва се и с променливата на средата
+# PAYROLL_PERF=1. Заявката може да има собствен флаг (begin_request) - сесиите на Streamlit се изпълняват
+# в различни нишки на един процес и всяка включва измерването само за себе си.
+enabled = os.environ.get('PAYROLL_PERF') == '1'
+
+# Брой последни измервания за всяка фаза, от които се смятат p50/p95
+WINDOW = 500
+# Брой последни заявки (изпълнения на страницата или командата), пазени с всичките им фази
+REQUESTS_KEPT = 200
+# Най-много фази, пазени поотделно за една заявка (останалите влизат само в обобщението)
+SPANS_PER_REQUEST = 1000
+
+_lock = threading.Lock()
+_phases = defaultdict(lambda: deque(maxlen=WINDOW))
+_requests = deque(maxlen=REQUESTS_KEPT)
+_local = threading.local()
+
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+
+
+# Флагът на заявката в текущата нишка, а извън заявка - общият
+def is_enabled():
+    return getattr(_local, 'enabled', enabled)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+
+    def __enter__(self):
+        self.parent = getattr(_local, 'span', None)
+        _local.span = self
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        _local.span = self.parent
+        if self.parent is not None:
+            self.parent.queries += self.queries
+        with _lock:
+            _phases[self.name].append((seconds, self.queries))
+        request = getattr(_local, 'request', None)
+        if request is not None and len(request['spans']) < SPANS_PER_REQUEST:
+            request['spans'].append({'name': self.name, 'start': self.start - request['_start'],
+                                     'seconds': seconds, 'queries': self.queries})
+        return False
+
+
+def span(name):
+    if not is_enabled():
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Извиква се от SQLite за всяка изпълнена заявка (виж ConnectionPool.connection и WriteQueue)
+def count_query(statement):
+    current = getattr(_local, 'span', None)
+    if current is not None:
+        current.queries += 1
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request['queries'] += 1
+
+
+# --- Заявки ---
+
+# Начало на заявка в текущата нишка. Незавършена предходна заявка (напр. прекъсната от st.rerun) се изоставя.
+# flag включва или изключва измерването само за тази заявка (без него важи общият флаг).
+def begin_request(name, flag=None):
+    _local.enabled = enabled if flag is None else flag
+    if not _local.enabled:
+        _local.request = None
+        return
+    _local.span = None
+    _local.request = {'name': name, 'started': time.time(), 'queries': 0, 'spans': [],
+                      '_start': time.perf_counter()}
+
+
+def end_request():
+    request = getattr(_local, 'request', None)
+    _local.request = None
+    _local.__dict__.pop('enabled', None)
+    if request is None:
+        return
+    seconds = time.perf_counter() - request.pop('_start')
+    request['seconds'] = seconds
+    with _lock:
+        _phases[request['name']].append((seconds, request['queries']))
+        _requests.append(request)
+
+
+# Заявката и фазата на текущата нишка (None, ако измерването е изключено) - за работа, която друга нишка
+# върши от нейно име, като записите в нишката за запис
+def current():
+    if not is_enabled():
+        return None
+    return getattr(_local, 'request', None), getattr(_local, 'span', None)
+
+
+# Докато трае блокът, заявките и фазите в текущата нишка се броят към context (от current() в друга нишка)
+@contextmanager
+def attributed(context):
+    saved = {name: _local.__dict__[name] for name in ('enabled', 'request', 'span') if name in _local.__dict__}
+    _local.enabled = True
+    _local.request, _local.span = context
+    try:
+        yield
+    finally:
+        for name in ('enabled', 'request', 'span'):
+            _local.__dict__.pop(name, None)
+        _local.__dict__.update(saved)
+
+
+# --- Обобщение ---
+
+def _percentile(values, fraction):
+    # Най-близък ранг върху сортирани стойности
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+# Обобщение по фази за последните WINDOW измервания: брой, p50, p95, максимум (в секунди) и средно заявки
+def summary():
+    with _lock:
+        phases = {name: list(samples) for name, samples in _phases.items()}
+    rows = []
+    for name in sorted(phases):
+        samples = phases[name]
+        seconds = sorted(value for value, _ in samples)
+        rows.append({
+            'phase': name,
+            'count': len(samples),
+            'p50': _percentile(seconds, 0.50),
+            'p95': _percentile(seconds, 0.95),
+            'max': seconds[-1],
+            'queries': sum(queries for _, queries in samples) / len(samples),
+        })
+    return rows
+
+
+def reset():
+    with _lock:
+        _phases.clear()
+        _requests.clear()
+
+
+def dumps():
+    with _lock:
+        requests = list(_requests)
+    return json.dumps({'summary': summary(), 'requests': requests}, ensure_ascii=False, indent=2)
+
+
+# Записва обобщението и последните заявки в JSON файл за анализ извън приложението
+def dump(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dumps())
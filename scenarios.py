@@ -0,0 +1,113 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import payroll
+import perf
+from payroll import DEFAULT_TZPB_RATE, DEFAULT_YEAR
+
+# Параметрите на един сценарий: промяна на основните заплати в %, СУПКО %, ТЗПБ % и максимален
+# осигурителен доход. NaN означава стойността от записите (за СУПКО и ТЗПБ) или от таблицата за годината.
+SCENARIO_PARAMETERS = ['salary_change', 'supko_rate', 'tzpb_rate', 'max_insurance_income']
+
+# Сумите за цялата фирма за всеки сценарий; за всяка има и колона <име>_change спрямо текущото състояние
+SCENARIO_TOTAL_COLUMNS = ['total_gross_income', 'net_salary', 'total_insurance_employee',
+                          'total_insurance_employer', 'income_tax', 'total_employer_cost']
+
+SCENARIO_COLUMN_LABELS = {
+    'salary_change': 'Промяна на заплатите (%)',
+    'supko_rate': 'СУПКО %',
+    'tzpb_rate': 'ТЗПБ %',
+    'max_insurance_income': 'Макс. осигурителен доход',
+    'total_gross_income': 'Брутен доход',
+    'net_salary': 'Нетно',
+    'total_insurance_employee': 'Осигуровки служител',
+    'total_insurance_employer': 'Осигуровки работодател',
+    'income_tax': 'Данък',
+    'total_employer_cost': 'Разходи за работодател',
+}
+
+# Най-много редове (сценарии x служители-месеци), изчислявани наведнъж
+SCENARIO_CHUNK_ROWS = 500_000
+
+# Входните колони, които се размножават за всеки сценарий (останалите не влияят на сумите)
+_INPUT_COLUMNS = (payroll.BATCH_REQUIRED_COLUMNS + list(payroll.BATCH_INPUT_DEFAULTS)
+                  + payroll.BATCH_DATE_COLUMNS + payroll.BATCH_PREVIOUS_MONTH_COLUMNS)
+
+
+# Всички комбинации от стойностите като таблица SCENARIO_PARAMETERS, по един ред за сценарий.
+# None (или NaN) в списъците означава "без промяна".
+def scenario_grid(salary_changes=(0.0,), supko_rates=(None,), tzpb_rates=(None,), max_insurance_incomes=(None,)):
+    combinations = itertools.product(salary_changes, supko_rates, tzpb_rates, max_insurance_incomes)
+    return pd.DataFrame(list(combinations), columns=SCENARIO_PARAMETERS).astype(np.float64)
+
+
+# Съхранените служители за годината (или само месец month) като вход за calculate_net_salary_batch
+def headcount(month=None, year=DEFAULT_YEAR, tzpb_rate=DEFAULT_TZPB_RATE, telk_egns=()):
+    import db
+
+    batch = payroll.employees_batch_input(db.read_egns(year=year), tzpb_rate, telk_egns, year)
+    if month is not None:
+        batch = batch[batch['month'] == month]
+    return batch.reset_index(drop=True)
+
+
+# Входът на всички сценарии от scenarios за всички редове на batch: редовете се повтарят за всеки сценарий,
+# а параметрите на сценария се разпъват до техния брой (сценарий i е в редовете i*n ... (i+1)*n - 1)
+def _broadcast(batch, scenarios):
+    n, count = len(batch), len(scenarios)
+    rows = {}
+    for name in _INPUT_COLUMNS:
+        if name not in batch:
+            continue
+        column = batch[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            rows[name] = pd.Categorical.from_codes(np.tile(column.cat.codes.to_numpy(), count), dtype=column.dtype)
+        else:
+            rows[name] = np.tile(column.to_numpy(), count)
+    rows = pd.DataFrame(rows)
+
+    def per_row(name):
+        return np.repeat(scenarios[name].to_numpy(dtype=np.float64), n)
+
+    scale = 1 + np.nan_to_num(per_row('salary_change')) / 100
+    rows['gross_salary'] = rows['gross_salary'].to_numpy(dtype=np.float64) * scale
+    # Базата за отпуска от предходния месец следва същите заплати и СУПКО
+    if 'prev_gross_salary_base' in rows:
+        rows['prev_gross_salary_base'] = rows['prev_gross_salary_base'].to_numpy(dtype=np.float64) * scale
+    for name, columns in [('supko_rate', ['supko_rate', 'prev_supko_rate']), ('tzpb_rate', ['tzpb_rate'])]:
+        values = per_row(name)
+        for column in columns:
+            if column in rows:
+                rows[column] = np.where(np.isnan(values), rows[column].to_numpy(dtype=np.float64), values)
+    rows['max_insurance_income'] = per_row('max_insurance_income')
+    return rows
+
+
+# Сумите за цялата фирма за всеки сценарий и разликата им спрямо текущото състояние (записите без промени).
+# Всички сценарии се изчисляват с едно пакетно изчисление върху размножените редове, на порции от
+# chunk_rows реда. Връща scenarios с добавени SCENARIO_TOTAL_COLUMNS и <име>_change.
+@perf.timed('scenarios.run')
+def run_scenarios(batch, scenarios, chunk_rows=SCENARIO_CHUNK_ROWS):
+    scenarios = pd.DataFrame(scenarios).reindex(columns=SCENARIO_PARAMETERS).astype(np.float64)
+    scenarios = scenarios.reset_index(drop=True)
+    batch = batch.reset_index(drop=True)
+    # Месецът като категория - размножаването и намирането на номера му са без сравнения на низове
+    batch = batch.assign(month=pd.Categorical(batch['month'], categories=payroll.MONTHS))
+
+    # Текущото състояние е първият изчислен сценарий
+    evaluated = pd.concat([scenario_grid(), scenarios], ignore_index=True)
+    totals = np.zeros((len(evaluated), len(SCENARIO_TOTAL_COLUMNS)))
+    per_chunk = max(1, chunk_rows // max(len(batch), 1))
+    for start in range(0, len(evaluated) if len(batch) else 0, per_chunk):
+        part = evaluated.iloc[start:start + per_chunk]
+        results = payroll.PayrollResults.from_frame(payroll.calculate_net_salary_batch(_broadcast(batch, part)))
+        values = np.column_stack([results.column(name) for name in SCENARIO_TOTAL_COLUMNS])
+        totals[start:start + len(part)] = values.reshape(len(part), len(batch), -1).sum(axis=1)
+
+    report = scenarios.copy()
+    for i, name in enumerate(SCENARIO_TOTAL_COLUMNS):
+        report[name] = totals[1:, i]
+        report[f'{name}_change'] = totals[1:, i] - totals[0, i]
+    return report
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# Тестовете се пускат и без инсталиране - модулите на приложението са в корена на проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+# Пул към файл с база във временна папка (без създаване на схемата); пулът и нишката за запис се подменят
+# и връщат след теста
+@pytest.fixture
+def database_path(tmp_path, monkeypatch):
+    previous = db.get_pool()
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'salaries.db'))
+    pool = db.ConnectionPool(db.DB_PATH)
+    db.set_pool(pool)
+    yield db.DB_PATH
+    db.set_pool(previous)
+    pool.close()
+
+
+# Празна база с последната версия на схемата
+@pytest.fixture
+def database(database_path):
+    db.create_db()
+    yield db.get_pool()
@@ -0,0 +1,238 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import db
+import payroll
+import workdays
+
+
+def test_write_fails_when_database_cannot_be_opened(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'missing' / 'salaries.db'))
+    writer = db.WriteQueue(pool)
+    future = writer.submit(lambda conn: conn.execute("SELECT 1"))
+    # Без поправката нишката за запис умира и резултатът не идва никога
+    with pytest.raises(sqlite3.OperationalError):
+        future.result(timeout=10)
+    writer.close()
+
+
+def test_write_recovers_after_failed_connect(tmp_path):
+    folder = tmp_path / 'missing'
+    writer = db.WriteQueue(db.ConnectionPool(str(folder / 'salaries.db')))
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            writer.submit(lambda conn: None).result(timeout=10)
+        # Временната грешка отминава - следващият запис пуска нова нишка вместо да е отказан завинаги
+        folder.mkdir()
+        assert writer.submit(lambda conn: conn.execute("SELECT 42").fetchone()[0]).result(timeout=10) == 42
+    finally:
+        writer.close()
+
+
+def test_module_write_raises_instead_of_hanging(tmp_path):
+    previous = db.get_pool()
+    db.set_pool(db.ConnectionPool(str(tmp_path / 'missing' / 'salaries.db')))
+    try:
+        with ThreadPoolExecutor(1) as executor:
+            for _ in range(2):
+                with pytest.raises(sqlite3.OperationalError):
+                    executor.submit(db.write, lambda conn: conn.execute("SELECT 1")).result(timeout=10)
+    finally:
+        db.set_pool(previous)
+
+
+def _add(egn, month, gross_salary=2500.0, days_unpaid=0, name="Служител"):
+    db.add_data(egn, name, month, gross_salary, 0.6, 5, 0, 0, 0, days_unpaid, 1)
+
+
+def _not_qualifying(month):
+    # Пет отработени дни - месецът не може да е база за отпуска на следващите
+    return workdays.working_days(payroll.DEFAULT_YEAR, workdays.MONTH_NUMBERS[month]) - 5
+
+
+def _dirty(egn):
+    with db.get_pool().connection() as conn:
+        rows = conn.execute('SELECT month FROM payroll_dirty WHERE egn = ? ORDER BY month', (egn,)).fetchall()
+    return [workdays.MONTHS[month - 1] for month, in rows]
+
+
+def _clear_dirty():
+    db.write(lambda conn: conn.execute('DELETE FROM payroll_dirty'))
+
+
+def test_mark_dirty_reaches_next_qualifying_month(database):
+    egn = '7000000001'
+    _add(egn, 'Януари')
+    _add(egn, 'Февруари', days_unpaid=_not_qualifying('Февруари'))
+    _add(egn, 'Март', days_unpaid=_not_qualifying('Март'))
+    _add(egn, 'Април')
+    _add(egn, 'Май')
+    _clear_dirty()
+
+    db.update_data(egn, 'Януари', 2600.0, 0.6, 5, 0, 0, 0, 0, 1)
+    # Отпускът във февруари и март се смята от януари, април е първият месец с 10+ отработени дни
+    assert _dirty(egn) == ['Януари', 'Февруари', 'Март', 'Април']
+
+
+def test_mark_dirty_stops_at_qualifying_month_and_last_record(database):
+    egn = '7000000002'
+    for month in ['Януари', 'Февруари', 'Март']:
+        _add(egn, month)
+    _add('7000000003', 'Февруари')
+    _clear_dirty()
+
+    db.update_data(egn, 'Януари', 2600.0, 0.6, 5, 0, 0, 0, 0, 1)
+    assert _dirty(egn) == ['Януари', 'Февруари']
+    assert _dirty('7000000003') == []
+    _clear_dirty()
+
+    db.delete_data(egn, 'Март')
+    assert _dirty(egn) == ['Март']
+
+
+# Таблицата salaries от първата версия на приложението; sick_leave_count е добавен по-късно с ALTER TABLE
+def _legacy_database(path, rows, sick_leave_count=True):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS salaries (
+            egn TEXT,
+            full_name TEXT,
+            month TEXT,
+            gross_salary_base REAL,
+            supko_rate REAL,
+            years_experience INTEGER,
+            days_vacation INTEGER,
+            days_sick INTEGER,
+            days_absence INTEGER,
+            days_unpaid INTEGER,
+            PRIMARY KEY (egn, month)
+        )
+    ''')
+    if sick_leave_count:
+        conn.execute("ALTER TABLE salaries ADD COLUMN sick_leave_count INTEGER DEFAULT 1")
+    placeholders = ', '.join('?' for _ in rows[0])
+    conn.executemany(f"INSERT INTO salaries VALUES ({placeholders})", rows)
+    conn.commit()
+    conn.close()
+
+
+LEGACY_ROWS = [
+    ('7000000001', "Иван Петров", 'Януари', 2500.0, 0.6, 5, 0, 0, 0, 0, 1),
+    ('7000000001', "Иван Петров-Иванов", 'Март', 2600.0, 0.6, 5, 2, 3, 0, 0, 2),
+    ('7000000002', "Мария Георгиева", 'Декември', 4200.0, 1.0, 20, 0, 0, 1, 0, None),
+]
+
+
+def test_migrates_baseline_database_to_latest_version(database_path):
+    _legacy_database(database_path, LEGACY_ROWS)
+    db.create_db()
+
+    with db.get_pool().connection() as conn:
+        assert db.schema_version(conn) == len(db.MIGRATIONS) == 3
+        assert not db._table_exists(conn, 'salaries')
+        journal = conn.execute("SELECT operation, egn, month FROM salary_changes ORDER BY seq").fetchall()
+    # Името е от последния месец на служителя, липсващият брой болнични е 1
+    expected = [('7000000001', "Иван Петров-Иванов") + row[2:] for row in LEGACY_ROWS[:2]]
+    expected.append(LEGACY_ROWS[2][:-1] + (1,))
+    assert [tuple(row) for row in db.read_data(db.LEGACY_SALARIES_YEAR)] == expected
+    assert journal == [('insert', '7000000001', 1), ('insert', '7000000001', 3), ('insert', '7000000002', 12)]
+
+    # Повторното извикване не прави нищо
+    db.create_db()
+    assert len(db.read_data(db.LEGACY_SALARIES_YEAR)) == 3
+
+
+def test_migrates_database_without_sick_leave_count(database_path):
+    _legacy_database(database_path, [row[:-1] for row in LEGACY_ROWS], sick_leave_count=False)
+    db.create_db()
+    assert [row[-1] for row in db.read_data(db.LEGACY_SALARIES_YEAR)] == [1, 1, 1]
+
+
+def test_migration_with_unknown_month_is_rolled_back(database_path):
+    rows = LEGACY_ROWS + [('7000000003', "Петър Колев", 'януари ', 3100.0, 0.6, 2, 0, 0, 0, 0, 1)]
+    _legacy_database(database_path, rows)
+
+    with pytest.raises(ValueError, match=r"от 4 реда в salaries са копирани 3.*7000000003 \('януари '\)"):
+        db.create_db()
+
+    # Базата е непроменена - записите не се губят и миграцията може да се повтори след поправка
+    with db.get_pool().connection() as conn:
+        assert db.schema_version(conn) == 0
+        assert not db._table_exists(conn, 'salary_records')
+        assert conn.execute("SELECT COUNT(*) FROM salaries").fetchone()[0] == 4
+        conn.execute("UPDATE salaries SET month = 'Януари' WHERE egn = '7000000003'")
+        conn.commit()
+    db.create_db()
+    assert len(db.read_data(db.LEGACY_SALARIES_YEAR)) == 4
+
+
+def _changes(after=0, chunk_size=db.CHANGES_CHUNK_SIZE):
+    # (операция, ЕГН, месец, име, заплата) за всяка промяна след after
+    return [(row[1], row[3], row[5], row[6], row[7]) for rows in db.iter_changes(after, chunk_size) for row in rows]
+
+
+def _replay(after=0, state=None):
+    # Състоянието, възстановено само от журнала - както го прави външна система
+    state = dict(state or {})
+    for rows in db.iter_changes(after):
+        for row in rows:
+            key = (row[3], row[5])
+            if row[1] == 'delete':
+                state.pop(key, None)
+            else:
+                state[key] = (row[3], row[6], row[5]) + tuple(row[7:])
+    return state
+
+
+def test_journal_records_inserts_updates_moves_and_deletes(database):
+    _add('7000000001', 'Януари')
+    _add('7000000001', 'Февруари')
+    cursor = db.last_change()
+    assert _changes() == [('insert', '7000000001', 'Януари', "Служител", 2500.0),
+                          ('insert', '7000000001', 'Февруари', "Служител", 2500.0)]
+
+    # Запис със същите стойности не е промяна
+    _add('7000000001', 'Януари')
+    assert db.last_change() == cursor
+
+    db.update_data('7000000001', 'Януари', 2600.0, 0.6, 5, 0, 0, 0, 0, 1)
+    # Смяна на ключа направо в таблицата - изтриване на стария и вмъкване на новия запис
+    db.write(lambda conn: conn.execute("UPDATE salary_records SET month = 3 WHERE egn = ? AND month = 2",
+                                       ('7000000001',)))
+    db.delete_data('7000000001', 'Януари')
+    assert _changes(cursor) == [('update', '7000000001', 'Януари', "Служител", 2600.0),
+                                ('delete', '7000000001', 'Февруари', "Служител", 2500.0),
+                                ('insert', '7000000001', 'Март', "Служител", 2500.0),
+                                ('delete', '7000000001', 'Януари', "Служител", 2600.0)]
+
+
+def test_journal_records_rename_for_every_record_of_the_employee(database):
+    for month in ['Януари', 'Февруари', 'Март']:
+        _add('7000000001', month)
+    _add('7000000002', 'Януари')
+    cursor = db.last_change()
+
+    _add('7000000001', 'Февруари', name="Нов служител")
+    assert _changes(cursor) == [('update', '7000000001', month, "Нов служител", 2500.0)
+                                for month in ['Януари', 'Февруари', 'Март']]
+
+
+def test_journal_replay_matches_records(database):
+    for employee in range(4):
+        for month in workdays.MONTHS[:5]:
+            _add(f'70000000{employee:02d}', month, gross_salary=2000.0 + employee)
+    state = _replay()
+    cursor = db.last_change()
+
+    db.update_data('7000000001', 'Март', 2600.0, 0.7, 6, 1, 0, 0, 0, 1)
+    db.delete_data('7000000002', 'Май')
+    _add('7000000003', 'Юни', name="Преименуван")
+    db.apply_changes([('7000000000', "Служител", 'Юли', 3000.0, 0.6, 5, 0, 0, 0, 0, 1)], [('7000000000', 'Януари')])
+
+    # Четенето на малки порции и продължаването от курсора дават същото като пълния прочит
+    assert len(_changes(chunk_size=7)) == len(_changes())
+    expected = {(row[0], row[2]): tuple(row) for row in db.read_data()}
+    assert _replay() == expected
+    assert _replay(cursor, state) == expected
@@ -0,0 +1,20 @@
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import db
+import exporter
+
+
+@pytest.mark.parametrize('file_format', exporter.EXPORT_FORMATS)
+def test_register_download_data_is_accepted_by_streamlit(database, file_format):
+    if file_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    with database.transaction() as conn:
+        db.upsert_salaries(conn, [('7000000001', "Служител 1", 'Януари', 2500.0, 1.0, 5, 0, 0, 0, 0, 0)])
+
+    # Бутонът за изтегляне в приложението приема само данни, които Streamlit може да превърне в байтове
+    data = exporter.register_bytes(file_format)
+    content, _ = convert_data_to_bytes_and_infer_mime(data, RuntimeError("Неподдържан тип"))
+    assert content == data and len(content) > 0
+    if file_format == 'csv':
+        assert '7000000001' in content.decode('utf-8-sig')
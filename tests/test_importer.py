@@ -0,0 +1,91 @@
+import db
+import importer
+
+LABELS = db.SALARY_COLUMN_LABELS
+
+PAGE = [
+    ('7000000001', "Иван Петров", 'Януари', 2500.0, 0.6, 5, 0, 0, 0, 0, 1),
+    ('7000000001', "Иван Петров", 'Февруари', 2500.0, 0.6, 5, 0, 0, 0, 0, 1),
+    ('7000000002', "Мария Георгиева", 'Януари', 4200.0, 1.0, 20, 0, 0, 0, 0, 1),
+]
+
+
+def _load(database, rows=PAGE):
+    with database.transaction() as conn:
+        db.upsert_salaries(conn, rows)
+
+
+def _new_row(egn, month, name="Нов служител"):
+    return {LABELS['egn']: egn, LABELS['full_name']: name, LABELS['month']: month,
+            LABELS['gross_salary_base']: 3000.0, LABELS['supko_rate']: 0.6, LABELS['years_experience']: 2}
+
+
+def test_no_edits_and_unchanged_values_give_no_changes(database):
+    _load(database)
+    assert importer.table_changes(PAGE, {}) == ([], [], [])
+    edits = {'edited_rows': {0: {LABELS['gross_salary_base']: 2500.0}}}
+    assert importer.table_changes(PAGE, edits) == ([], [], [])
+
+
+def test_edited_added_and_deleted_rows(database):
+    _load(database)
+    edits = {
+        'edited_rows': {'1': {LABELS['gross_salary_base']: 2700.0, LABELS['days_vacation']: 2}},
+        'added_rows': [_new_row('7000000003', 'Март')],
+        'deleted_rows': [2],
+    }
+    upserts, deletes, errors = importer.table_changes(PAGE, edits)
+    assert errors == []
+    assert deletes == [('7000000002', 'Януари')]
+    assert upserts == [
+        ('7000000001', "Иван Петров", 'Февруари', 2700.0, 0.6, 5, 2, 0, 0, 0, 1),
+        ('7000000003', "Нов служител", 'Март', 3000.0, 0.6, 2, 0, 0, 0, 0, 1),
+    ]
+
+
+def test_changed_key_moves_the_record(database):
+    _load(database)
+    edits = {'edited_rows': {0: {LABELS['month']: 'Март'}}}
+    upserts, deletes, errors = importer.table_changes(PAGE, edits)
+    assert errors == []
+    assert deletes == [('7000000001', 'Януари')]
+    assert upserts == [('7000000001', "Иван Петров", 'Март') + PAGE[0][3:]]
+
+
+def test_invalid_rows_are_reported_per_row(database):
+    _load(database)
+    edits = {
+        'edited_rows': {0: {LABELS['gross_salary_base']: 10.0}, 2: {LABELS['supko_rate']: 0.65}},
+        'added_rows': [{LABELS['egn']: '7000000004', LABELS['month']: 'Май'}],
+    }
+    upserts, deletes, errors = importer.table_changes(PAGE, edits)
+    assert upserts == [] and deletes == []
+    assert [label for label, _ in errors] == ["7000000001, Януари", "7000000002, Януари", "Нов ред 1"]
+    assert "Брутната заплата" in errors[0][1]
+    assert "СУПКО" in errors[1][1]
+    assert "име" in errors[2][1]
+
+
+def test_duplicate_and_overwriting_keys_are_rejected(database):
+    # Запис, който не е на страницата, не може да бъде презаписан от нов или преместен ред
+    _load(database, PAGE + [('7000000005', "Петър Димитров", 'Април', 3000.0, 0.6, 1, 0, 0, 0, 0, 1)])
+    edits = {
+        'edited_rows': {1: {LABELS['month']: 'Януари'}},
+        'added_rows': [_new_row('7000000005', 'Април'), _new_row('7000000006', 'Май'),
+                       _new_row('7000000006', 'Май')],
+    }
+    upserts, deletes, errors = importer.table_changes(PAGE, edits)
+    assert [label for label, _ in errors] == ["7000000001, Февруари", "Нов ред 1", "Нов ред 3"]
+    assert "Вече има запис" in errors[0][1]
+    assert "Вече има запис" in errors[1][1]
+    assert "Повече от един ред" in errors[2][1]
+    assert [row[:3] for row in upserts] == [('7000000006', "Нов служител", 'Май')]
+
+
+def test_new_row_may_reuse_the_key_of_a_deleted_row(database):
+    _load(database)
+    edits = {'deleted_rows': [2], 'added_rows': [_new_row('7000000002', 'Януари', "Мария Иванова")]}
+    upserts, deletes, errors = importer.table_changes(PAGE, edits)
+    assert errors == []
+    assert deletes == [('7000000002', 'Януари')]
+    assert [row[:3] for row in upserts] == [('7000000002', "Мария Иванова", 'Януари')]
@@ -0,0 +1,294 @@
+import random
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+import payroll
+from payroll import BIRTH_AFTER_1960, BIRTH_BEFORE_1960
+
+NO_PREVIOUS_MONTH = (None, None, None, None)
+
+# (заплата, ТЗПБ, година на раждане, месец, отпуск, болничен, отсъствие, неплатен, ТЕЛК, стаж, СУПКО,
+#  брой болнични, предходен месец с 10+ отработени дни)
+CASES = [
+    (1050.0, 0.7, BIRTH_AFTER_1960, 'Януари', 0, 0, 0, 0, False, 0, 0.6, 1, NO_PREVIOUS_MONTH),
+    (2500.0, 0.4, BIRTH_AFTER_1960, 'Март', 3, 2, 0, 0, False, 10, 0.6, 1, NO_PREVIOUS_MONTH),
+    (2500.0, 1.1, BIRTH_BEFORE_1960, 'Май', 0, 5, 1, 2, True, 25, 1.0, 2, NO_PREVIOUS_MONTH),
+    (6000.0, 0.7, BIRTH_AFTER_1960, 'Юли', 2, 0, 0, 0, False, 5, 0.7, 1, (5500.0, 0.7, 5, 21)),
+    (3000.0, 0.5, BIRTH_AFTER_1960, 'Декември', 12, 3, 0, 0, True, 40, 0.9, 1, NO_PREVIOUS_MONTH),
+    (4500.0, 0.9, BIRTH_BEFORE_1960, 'Февруари', 0, 0, 0, 20, False, 3, 0.8, 1, NO_PREVIOUS_MONTH),
+]
+
+# Стойностите на първоначалната формула в app.py (преди пакетното изчисление) за случаите от CASES
+BASELINE_KEYS = ['net_salary', 'total_insurance_employee', 'total_insurance_employer', 'income_tax',
+                 'total_employer_cost']
+BASELINE_VALUES = [
+    (811.43046, 148.4106, 206.9994, 90.15894, 1256.9994),
+    (2013.20659, 354.2149, 486.3386, 203.07851, 3056.8386),
+    (1868.7882894736845, 317.30447368421056, 448.0432105263159, 83.64407894736843, 2722.3147894736844),
+    (5078.725971428572, 569.114, 793.786, 564.3028857142857, 7005.928857142857),
+    (1107.679488, 179.91168, 250.90992, 18.008832, 1556.50992),
+    (-176.64954, 191.4906, 209.1534, -14.841060, 252.2334),
+]
+
+
+def _scalar(case, **kwargs):
+    *arguments, sick_leave_count, previous = case
+    return payroll.calculate_net_salary_with_absences(*arguments, sick_leave_count=sick_leave_count,
+                                                      previous_month_data=previous, **kwargs)
+
+
+def _batch_input(cases):
+    columns = ['gross_salary', 'tzpb_rate', 'birth_year', 'month', 'days_vacation', 'days_sick', 'days_absence',
+               'days_unpaid', 'has_telk', 'years_experience', 'supko_rate', 'sick_leave_count']
+    batch = pd.DataFrame([case[:-1] for case in cases], columns=columns)
+    previous = [[np.nan if value is None else value for value in case[-1]] for case in cases]
+    batch[payroll.BATCH_PREVIOUS_MONTH_COLUMNS] = np.array(previous, dtype=np.float64)
+    return batch
+
+
+def _random_cases(count, seed=2025):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        month = rng.choice(payroll.MONTHS)
+        days = rng.choice([0, 0, 1, 2, 5, 10])
+        previous = NO_PREVIOUS_MONTH
+        if rng.random() < 0.5:
+            previous = (float(rng.randrange(1050, 8000, 50)), rng.choice(payroll.SUPKO_RATE_OPTIONS),
+                        rng.randint(0, 40), rng.choice([19, 20, 21, 22, 23]))
+        cases.append((float(rng.randrange(1050, 10000, 25)), rng.choice(payroll.TZPB_RATE_OPTIONS),
+                      rng.choice([BIRTH_BEFORE_1960, BIRTH_AFTER_1960]), month, days, rng.choice([0, 0, 2, 4, 8]),
+                      rng.choice([0, 0, 1]), rng.choice([0, 0, 1, 3]), rng.random() < 0.2, rng.randint(0, 40),
+                      rng.choice(payroll.SUPKO_RATE_OPTIONS), rng.choice([1, 2]), previous))
+    return cases
+
+
+@pytest.mark.parametrize('case, expected', list(zip(CASES, BASELINE_VALUES)))
+def test_scalar_matches_baseline_formula(case, expected):
+    result = _scalar(case)
+    assert [result[name] for name in BASELINE_KEYS] == pytest.approx(expected, abs=1e-9)
+
+
+def test_batch_matches_baseline_formula():
+    results = payroll.calculate_net_salary_batch(_batch_input(CASES))
+    for name, values in zip(BASELINE_KEYS, zip(*BASELINE_VALUES)):
+        np.testing.assert_allclose(results[name].to_numpy(), values, rtol=0, atol=1e-9)
+
+
+def test_batch_matches_scalar_for_every_column():
+    cases = _random_cases(300)
+    results = payroll.calculate_net_salary_batch(_batch_input(cases))
+    for row, case in enumerate(cases):
+        expected = _scalar(case)
+        for name in payroll.RESULT_COLUMNS:
+            assert results[name].iloc[row] == pytest.approx(expected[name], abs=1e-9), (row, name)
+        assert results['vacation_base_source'].iloc[row] == expected['vacation_base_source']
+
+
+def _stored_results():
+    columns = ['egn', 'month', 'tzpb_rate', 'has_telk'] + payroll.RESULT_COLUMNS + ['vacation_base_source']
+    return pd.DataFrame(db.read_results(), columns=columns).set_index(['egn', 'month'])
+
+
+def _full_run(tzpb_rate=payroll.DEFAULT_TZPB_RATE, telk_egns=()):
+    return payroll.run_year(tzpb_rate, telk_egns).to_frame().set_index(['egn', 'month'])
+
+
+def _assert_matches_full_run(stored, expected):
+    assert sorted(stored.index) == sorted(expected.index)
+    stored = stored.loc[expected.index]
+    for name in payroll.RESULT_COLUMNS:
+        np.testing.assert_allclose(stored[name].to_numpy(dtype=np.float64),
+                                   expected[name].to_numpy(dtype=np.float64), rtol=0, atol=1e-9, err_msg=name)
+
+
+def test_refresh_results_recomputes_only_changed_rows(database):
+    for employee in range(3):
+        for index, month in enumerate(payroll.MONTHS[:6]):
+            db.add_data(f'70000000{employee:02d}', f"Служител {employee}", month, 2000.0 + 100 * employee, 0.6,
+                        employee, 2 if index % 2 else 0, 0, 0, 0, 1)
+
+    assert payroll.refresh_results() == 18
+    assert payroll.refresh_results() == 0
+    _assert_matches_full_run(_stored_results(), _full_run())
+
+    # Промяна на февруари: преизчисляват се февруари и март (първият следващ месец с 10+ отработени дни)
+    db.update_data('7000000001', 'Февруари', 3100.0, 0.6, 1, 2, 0, 0, 0, 1)
+    assert payroll.refresh_results() == 2
+    _assert_matches_full_run(_stored_results(), _full_run())
+
+    # Резултатът на изтрит запис се премахва
+    db.delete_data('7000000002', 'Юни')
+    payroll.refresh_results()
+    assert ('7000000002', 'Юни') not in _stored_results().index
+    _assert_matches_full_run(_stored_results(), _full_run())
+
+    # Друг ТЗПБ или ТЕЛК - преизчисляват се всички, съответно само засегнатите записи
+    assert payroll.refresh_results(tzpb_rate=1.1) == 17
+    assert payroll.refresh_results(tzpb_rate=1.1, telk_egns=['7000000000']) == 6
+    _assert_matches_full_run(_stored_results(), _full_run(1.1, ['7000000000']))
+
+    # Без списък ТЕЛК остава от съхранените резултати - и за новите записи на служителя
+    assert db.read_telk_egns() == ['7000000000']
+    db.update_data('7000000000', 'Март', 2050.0, 0.6, 0, 0, 0, 0, 0, 1)
+    db.add_data('7000000000', "Служител 0", 'Юли', 2000.0, 0.6, 0, 0, 0, 0, 0, 1)
+    assert payroll.refresh_results(tzpb_rate=1.1) == 3
+    assert payroll.refresh_results(tzpb_rate=1.1) == 0
+    _assert_matches_full_run(_stored_results(), _full_run(1.1, ['7000000000']))
+
+    # Празен списък премахва ТЕЛК
+    assert payroll.refresh_results(tzpb_rate=1.1, telk_egns=[]) == 7
+    assert db.read_telk_egns() == []
+    _assert_matches_full_run(_stored_results(), _full_run(1.1))
+
+
+def test_payroll_results_round_trip():
+    frame = payroll.calculate_net_salary_batch(_batch_input(_random_cases(200)))
+    results = payroll.PayrollResults.from_frame(frame)
+
+    assert len(results) == len(frame)
+    assert len(results.rates) < len(frame)
+    pd.testing.assert_frame_equal(results.to_frame(), frame, check_dtype=False)
+    row = frame.iloc[7]
+    assert dict(results[7]) == {name: row[name] for name in payroll.RESULT_KEYS}
+    assert [result.net_salary for result in results] == frame['net_salary'].tolist()
+
+
+def test_payroll_results_concat_and_take():
+    frame = payroll.calculate_net_salary_batch(_batch_input(_random_cases(200)))
+    parts = [payroll.PayrollResults.from_frame(frame.iloc[start:start + 70]) for start in range(0, 200, 70)]
+    results = payroll.PayrollResults.concat(parts)
+    pd.testing.assert_frame_equal(results.to_frame(), frame, check_dtype=False)
+
+    selected = frame['net_salary'].to_numpy() > 2000
+    taken = results.take(selected)
+    pd.testing.assert_frame_equal(taken.to_frame(), frame[selected], check_dtype=False)
+
+
+def test_run_year_with_workers_matches_sequential(database):
+    for employee in range(5):
+        for month in payroll.MONTHS[:4]:
+            db.add_data(f'70000000{employee:02d}', f"Служител {employee}", month, 1500.0 + 250 * employee, 0.6,
+                        employee, 0, 0, 0, 0, 1)
+
+    pd.testing.assert_frame_equal(payroll.run_year(workers=2).to_frame(), payroll.run_year().to_frame())
+
+
+def test_iter_results_for_month_matches_full_year(database):
+    for employee in range(7):
+        egn = f'70000000{employee:02d}'
+        # Предходна година за базата на отпуска в началото на годината
+        db.add_data(egn, f"Служител {employee}", 'Декември', 1800.0, 0.6, employee, 0, 0, 0, 0, 1,
+                    payroll.DEFAULT_YEAR - 1)
+        for index, month in enumerate(payroll.MONTHS[:5]):
+            if (employee + index) % 4 == 3:
+                continue
+            # Месеци с под 10 отработени дни - базата идва от по-ранен месец
+            db.add_data(egn, f"Служител {employee}", month, 2000.0 + 100 * employee + 10 * index, 0.6, employee,
+                        3 if index % 2 else 0, 15 if (employee + index) % 3 == 0 else 0, 0, 0, 1)
+
+    year = payroll.run_year(tzpb_rate=0.5, telk_egns=['7000000003']).to_frame()
+    for month in payroll.MONTHS[:6]:
+        chunks = list(payroll.iter_results(month, 0.5, ['7000000003'], chunk_size=2))
+        assert all(0 < len(chunk) <= 2 for chunk in chunks)
+        results = pd.concat([chunk.to_frame() for chunk in chunks], ignore_index=True) if chunks else None
+        expected = year[year['month'] == month].reset_index(drop=True)
+        if results is None:
+            assert expected.empty
+            continue
+        pd.testing.assert_frame_equal(results, expected, check_dtype=False)
+
+
+def _half_up(numerator, denominator=1):
+    # Точната дроб, закръглена до цяло с половинката далеч от нулата
+    value = Fraction(numerator) / denominator
+    rounded = (abs(value) * 2 + 1) // 2
+    return int(rounded if value >= 0 else -rounded)
+
+
+def test_to_stotinki_rounds_half_up_without_binary_noise():
+    assert payroll._to_stotinki([1234.565, 0.005, -0.005, 1.004, 2.675]).tolist() == [123457, 1, -1, 100, 268]
+    assert payroll._div_round([5, 15, -5, 4, -16], 10).tolist() == [1, 2, -1, 0, -2]
+
+
+def test_stotinki_lines_are_rounded_and_totals_are_exact_sums():
+    cases = _random_cases(300, seed=12)
+    batch = _batch_input(cases)
+    results = payroll.calculate_net_salary_batch(batch, money=payroll.MONEY_STOTINKI)
+    floats = payroll.calculate_net_salary_batch(batch)
+
+    for name in payroll.MONEY_RESULT_COLUMNS:
+        assert results[name].dtype == np.int64, name
+
+    def column(name):
+        return results[name].to_numpy()
+
+    np.testing.assert_array_equal(column('total_doo_employee'), column('pension_insurance_employee')
+                                  + column('ozm_insurance_employee') + column('unemployment_insurance_employee'))
+    np.testing.assert_array_equal(column('total_insurance_employee'), column('total_doo_employee')
+                                  + column('dzpo_insurance_employee') + column('health_insurance_employee')
+                                  + column('health_insurance_unpaid'))
+    np.testing.assert_array_equal(column('total_doo_employer'), column('pension_insurance_employer')
+                                  + column('ozm_insurance_employer') + column('unemployment_insurance_employer'))
+    np.testing.assert_array_equal(column('total_insurance_employer'), column('total_doo_employer')
+                                  + column('dzpo_insurance_employer') + column('tzpb')
+                                  + column('health_insurance_employer')
+                                  + column('health_insurance_sick_leave_employer'))
+    np.testing.assert_array_equal(column('total_gross_income'), column('base_salary_part')
+                                  + column('vacation_salary_part') + column('sick_pay_employer'))
+    np.testing.assert_array_equal(column('total_employer_cost'), column('total_gross_income')
+                                  + column('total_insurance_employer') + column('health_insurance_unpaid'))
+    np.testing.assert_array_equal(column('net_salary'), column('total_gross_income')
+                                  - column('total_insurance_employee') - column('income_tax'))
+
+    for row in range(len(results)):
+        line = results.iloc[row]
+        # Всяко перо е закръглено от точната дроб, а не от вече закръглена дневна ставка
+        assert line['base_salary_part'] == _half_up(line['gross_salary_with_supko'] * line['days_worked'],
+                                                    line['total_working_days'])
+        for name, rate in [('pension_insurance_employee', 'pension_employee_rate'),
+                           ('health_insurance_employer', 'health_employer_rate'), ('tzpb', 'tzpb_employer_rate')]:
+            rate = Fraction(str(line[rate])) / (100 if name == 'tzpb' else 1)
+            assert line[name] == _half_up(line['insurance_base'] * rate), (row, name)
+        # Закръглянето по пера се отклонява от изчислението с плаваща запетая с най-много няколко стотинки
+        assert abs(line['net_salary'] / 100 - floats['net_salary'].iloc[row]) <= 0.05
+
+
+def test_stotinki_scalar_matches_batch_and_converts_to_levs():
+    results = payroll.calculate_net_salary_batch(_batch_input(CASES), money=payroll.MONEY_STOTINKI)
+    levs = payroll.stotinki_to_levs(results)
+    for row, case in enumerate(CASES):
+        scalar = _scalar(case, money=payroll.MONEY_STOTINKI)
+        for name in payroll.MONEY_RESULT_COLUMNS:
+            assert scalar[name] == results[name].iloc[row], (row, name)
+            assert levs[name].iloc[row] == pytest.approx(results[name].iloc[row] / 100, abs=1e-12)
+
+
+@pytest.mark.parametrize('target_column', list(payroll.SOLVE_TARGETS))
+def test_solve_gross_salary_round_trip(target_column):
+    # Заплати около минималния и максималния осигурителен доход и облекчението за ТЕЛК, заедно със случайни
+    cases = _random_cases(400, seed=13)
+    thresholds = [1050.0, 1077.0, 1500.0, 4130.0, 4200.0]
+    cases += [(gross,) + case[1:] for gross, case in zip(thresholds * 20, _random_cases(100, seed=14))]
+    batch = _batch_input(cases)
+    forward = payroll.calculate_net_salary_batch(batch)
+    # Само редове, при които целта зависи от заплатата (има отработени или платени дни)
+    rows = (forward['base_salary_part'] + forward['vacation_salary_part'] + forward['sick_pay_employer']) > 0
+    batch, forward = batch[rows.to_numpy()].drop(columns='gross_salary'), forward[rows]
+
+    solved = payroll.solve_gross_salary_batch(batch, forward[target_column].to_numpy(), target_column)
+    np.testing.assert_allclose(solved['gross_salary_before_supko'], forward['gross_salary_before_supko'], atol=1e-9)
+    np.testing.assert_allclose(solved[target_column], forward[target_column], atol=0.02)
+
+
+def test_solve_gross_salary_unreachable_target_is_nan():
+    batch = _batch_input(CASES[:2]).drop(columns='gross_salary')
+    solved = payroll.solve_gross_salary_batch(batch, [-1000.0, 2000.0])
+    assert np.isnan(solved['gross_salary_before_supko'].iloc[0])
+    assert solved['net_salary'].iloc[1] == pytest.approx(2000.0, abs=0.01)
+    with pytest.raises(ValueError):
+        payroll.solve_gross_salary_batch(batch, 1000.0, 'income_tax')
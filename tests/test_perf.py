@@ -0,0 +1,48 @@
+import threading
+
+import db
+import perf
+
+
+def _run_request(name, flag, started, finish):
+    perf.begin_request(name, flag)
+    started.wait()
+    with perf.span(f'{name}.phase'):
+        pass
+    finish.wait()
+    perf.end_request()
+
+
+def test_request_flag_is_per_thread(monkeypatch):
+    monkeypatch.setattr(perf, 'enabled', False)
+    perf.reset()
+    # Двете сесии работят едновременно; включеното измерване в едната не засяга другата
+    started, finish = threading.Barrier(2), threading.Barrier(2)
+    threads = [threading.Thread(target=_run_request, args=(name, flag, started, finish))
+               for name, flag in [('on', True), ('off', False)]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {row['phase'] for row in perf.summary()} == {'on', 'on.phase'}
+    assert perf.enabled is False
+    assert perf.is_enabled() is False
+    perf.reset()
+
+
+def test_writes_count_queries_for_the_submitting_request(database, monkeypatch):
+    monkeypatch.setattr(perf, 'enabled', False)
+    perf.reset()
+    perf.begin_request('write', True)
+    db.add_data('7000000001', "Служител", 'Януари', 2500.0, 0.6, 5, 0, 0, 0, 0, 1)
+    perf.end_request()
+    # Без измерване записите не се броят никъде
+    db.add_data('7000000001', "Служител", 'Февруари', 2500.0, 0.6, 5, 0, 0, 0, 0, 1)
+
+    phases = {row['phase']: row for row in perf.summary()}
+    assert set(phases) == {'write', 'db.add_data'}
+    # Служителят, записът и маркировката за преизчисление - в нишката за запис
+    assert phases['db.add_data']['queries'] >= 3
+    assert phases['write']['queries'] == phases['db.add_data']['queries']
+    perf.reset()
@@ -0,0 +1,160 @@
+import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Месеците по ред - имената се използват навсякъде като ключ на месеца
+MONTHS = ["Януари", "Февруари", "Март", "Април", "Май", "Юни", "Юли", "Август", "Септември", "Октомври",
+          "Ноември", "Декември"]
+MONTH_NUMBERS = {name: idx for idx, name in enumerate(MONTHS, start=1)}
+
+# Години с календар. Празниците са по сегашния Кодекс на труда, а формулата за Великден е вярна до 2099 г.
+# По-ранните години биха изисквали и решенията на Министерския съвет за тях (виж EXTRA_DAYS_OFF).
+FIRST_YEAR = 2025
+LAST_YEAR = 2099
+
+# Официални празници с фиксирана дата (чл. 154, ал. 1 КТ) като (месец, ден)
+FIXED_HOLIDAYS = [(1, 1), (3, 3), (5, 1), (5, 6), (5, 24), (9, 6), (9, 22), (12, 24), (12, 25), (12, 26)]
+
+# Великденските празници като отместване от Великден: Разпети петък, Велика събота, Великден и понеделник
+EASTER_HOLIDAYS = [-2, -1, 0, 1]
+
+# Допълнителни почивни дни и отработвани съботи по решения на Министерския съвет:
+# година -> списък от datetime.date. Промяна тук изисква рестарт (календарът се изгражда веднъж).
+EXTRA_DAYS_OFF = {}
+EXTRA_WORKING_DAYS = {}
+
+_EPOCH = np.datetime64(f'{FIRST_YEAR}-01-01', 'D')
+_END = np.datetime64(f'{LAST_YEAR + 1}-01-01', 'D')
+
+
+# Православен Великден: юлианската дата по формулата на Меус плюс 13 дни разлика между календарите
+def orthodox_easter(year):
+    a, b, c = year % 4, year % 7, year % 19
+    d = (19 * c + 15) % 30
+    e = (2 * a + 4 * b - d + 34) % 7
+    month, day = divmod(d + e + 114, 31)
+    return datetime.date(year, month, day + 1) + datetime.timedelta(days=13)
+
+
+# Неработните делнични и почивни празнични дни за годината, подредени
+def holidays(year):
+    easter = orthodox_easter(year)
+    days_off = {easter + datetime.timedelta(days=offset) for offset in EASTER_HOLIDAYS}
+    fixed = [datetime.date(year, month, day) for month, day in FIXED_HOLIDAYS]
+    days_off.update(fixed)
+    # Празник в събота или неделя (без Великден) се пренася на първия следващ работен ден (чл. 154, ал. 2 КТ).
+    # Подред, така че 24 - 26 декември през уикенда дават съответно следващите два или три дни.
+    for holiday in fixed:
+        if holiday.weekday() >= 5:
+            moved = holiday + datetime.timedelta(days=1)
+            while moved.weekday() >= 5 or moved in days_off:
+                moved += datetime.timedelta(days=1)
+            days_off.add(moved)
+    days_off.update(EXTRA_DAYS_OFF.get(year, ()))
+    return sorted(days_off)
+
+
+# Маска на работните дни за целия календар, натрупаният им брой (counts[i] = работни дни преди i-тия ден)
+# и таблица година x месец с броя работни дни. Изграждат се веднъж при първото използване.
+@lru_cache(maxsize=None)
+def _calendar():
+    days = np.arange(_EPOCH, _END)
+    # 1 януари 1970 е четвъртък, така че понеделник е 0
+    working = (days.astype(np.int64) + 3) % 7 < 5
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        working[_offsets(holidays(year))] = False
+        working[_offsets(EXTRA_WORKING_DAYS.get(year, ()))] = True
+    working.flags.writeable = False
+
+    counts = np.concatenate([[0], np.cumsum(working, dtype=np.int64)])
+    counts.flags.writeable = False
+    month_starts = np.arange(np.datetime64(f'{FIRST_YEAR}-01', 'M'), np.datetime64(f'{LAST_YEAR + 1}-02', 'M'))
+    month_table = np.diff(counts[_offsets(month_starts.astype('datetime64[D]'))]).reshape(-1, 12)
+    month_table.flags.writeable = False
+    return working, counts, month_table
+
+
+def _offsets(dates):
+    return (np.asarray(dates, dtype='datetime64[D]') - _EPOCH).astype(np.int64)
+
+
+def _checked_offsets(dates, allow_end=False):
+    offsets = _offsets(dates)
+    limit = (_END - _EPOCH).astype(np.int64) + (1 if allow_end else 0)
+    if ((offsets < 0) | (offsets >= limit)).any():
+        raise ValueError(f"Датата е извън календара ({FIRST_YEAR} - {LAST_YEAR}).")
+    return offsets
+
+
+def _result(values):
+    return int(values) if np.ndim(values) == 0 else values
+
+
+def _check_years(year):
+    year = np.asarray(year, dtype=np.int64)
+    if ((year < FIRST_YEAR) | (year > LAST_YEAR)).any():
+        unknown = sorted(set(np.atleast_1d(year[(year < FIRST_YEAR) | (year > LAST_YEAR)]).tolist()))
+        raise ValueError(f"Няма календар за година: {', '.join(map(str, unknown))}")
+    return year
+
+
+def _check_months(month):
+    month = np.asarray(month, dtype=np.int64)
+    if ((month < 1) | (month > 12)).any():
+        raise ValueError("Месецът трябва да е между 1 и 12.")
+    return month
+
+
+# --- Броене на работните дни ---
+
+def is_working_day(dates):
+    working = _calendar()[0]
+    return working[_checked_offsets(dates)]
+
+
+# Брой работни дни в [begindates, enddates) за всяка двойка дати, като numpy.busday_count,
+# но с българските празници и отработвани съботи. При enddates < begindates броят е отрицателен.
+def busday_count(begindates, enddates):
+    counts = _calendar()[1]
+    return _result(counts[_checked_offsets(enddates, allow_end=True)]
+                   - counts[_checked_offsets(begindates, allow_end=True)])
+
+
+# Работните дни в месеца (1 - 12) на годината; приема и масиви от години и месеци
+def working_days(year, month):
+    month_table = _calendar()[2]
+    if type(year) is int and type(month) is int and FIRST_YEAR <= year <= LAST_YEAR and 1 <= month <= 12:
+        return int(month_table[year - FIRST_YEAR, month - 1])
+    return _result(month_table[_check_years(year) - FIRST_YEAR, _check_months(month) - 1])
+
+
+# Работните дни по месеци за годината като речник име на месеца -> брой (за интерфейса и проверките)
+def month_working_days(year):
+    return dict(zip(MONTHS, working_days(year, np.arange(1, 13)).tolist()))
+
+
+# Първият ден на месеца и първият ден на следващия месец (datetime64[D])
+def month_bounds(year, month):
+    first = (_check_years(year) - 1970) * 12 + _check_months(month) - 1
+    first = first.astype('datetime64[M]')
+    return first.astype('datetime64[D]'), (first + 1).astype('datetime64[D]')
+
+
+# Работните дни от месеца, през които лицето е на работа: от hire_date до leave_date включително.
+# Липсваща дата (None или NaT) означава, че периодът не е ограничен от тази страна.
+def employed_working_days(year, month, hire_date=None, leave_date=None):
+    if hire_date is None and leave_date is None:
+        return working_days(year, month)
+    month_start, month_end = month_bounds(year, month)
+    start, end = month_start, month_end
+    if hire_date is not None:
+        hire_date = np.asarray(hire_date, dtype='datetime64[D]')
+        start = np.where(hire_date > start, hire_date, start)
+    if leave_date is not None:
+        leave_end = np.asarray(leave_date, dtype='datetime64[D]') + 1
+        end = np.where(leave_end < end, leave_end, end)
+    # Назначение изцяло извън месеца дава 0 (и не излиза извън календара)
+    start = np.minimum(start, month_end)
+    end = np.maximum(end, start)
+    return busday_count(start, end)